@@ -0,0 +1,110 @@
+"""
+Measure the memory taken by the per-test coverage data of a synthetic suite
+of N tests (10000 by default) over 500 files of 200 lines, each test
+executing runs of lines and arcs in 20 of the files, held as plain sets
+versus in a CoverageStore, and the time taken by some queries on each.
+
+  python -m benchmarks.bench_coveragestore [N]
+
+Each representation is built in a forked child process, and its memory is
+the growth of the child's resident set size (Linux only).
+"""
+
+import os, random, sys, time
+
+from trialcoverage.coveragestore import CoverageStore
+
+NUMFILES = 500
+LINESPERFILE = 200
+FILESPERTEST = 20
+RUNSPERFILE = 3 # runs of consecutive lines executed in each file
+RUNLENGTH = 15
+
+def synthetic_test(rng):
+    """ Returns (line_data, arc_data) of one test, in the format of
+    coverage.py's collector. """
+    line_data, arc_data = {}, {}
+    for filenum in rng.sample(xrange(NUMFILES), FILESPERTEST):
+        filename = '/src/pkg/mod%d.py' % (filenum,)
+        lines, arcs = {}, {}
+        for run in xrange(RUNSPERFILE):
+            first = rng.randrange(1, LINESPERFILE - RUNLENGTH)
+            prev = -first
+            for l in xrange(first, first + RUNLENGTH):
+                lines[l] = None
+                arcs[(prev, l)] = None
+                prev = l
+            arcs[(prev, -first)] = None
+        line_data[filename] = lines
+        arc_data[filename] = arcs
+    return (line_data, arc_data)
+
+def rss():
+    for line in open('/proc/self/status'):
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1]) * 1024
+    raise EnvironmentError("no VmRSS in /proc/self/status")
+
+class PlainSets(object):
+    """ What the per-test data costs without a compact store. """
+    def __init__(self):
+        self.tests = {} # testid -> { filename: (set of lines, set of arcs) }
+
+    def record(self, testid, line_data, arc_data):
+        self.tests[testid] = dict([(f, (set(line_data[f]), set(arc_data[f]))) for f in line_data])
+
+    def union(self, filename):
+        lines, arcs = set(), set()
+        for filemap in self.tests.itervalues():
+            entry = filemap.get(filename)
+            if entry is not None:
+                lines.update(entry[0])
+                arcs.update(entry[1])
+        return (lines, arcs)
+
+    def tests_hitting(self, filename, unit):
+        return sorted([testid for (testid, filemap) in self.tests.iteritems() if filename in filemap and (unit in filemap[filename][0] or unit in filemap[filename][1])])
+
+def measure(klass, n):
+    """ Returns (bytes, seconds to record, seconds for the queries) of
+    klass holding n synthetic tests. """
+    rng = random.Random(0)
+    before = rss()
+    store = klass()
+    recording = 0.0
+    for i in xrange(n):
+        (line_data, arc_data) = synthetic_test(rng)
+        started = time.time()
+        store.record('pkg.test.test_mod%d.T.test_%d' % (i % 100, i), line_data, arc_data)
+        recording += time.time() - started
+    size = rss() - before
+    started = time.time()
+    for filenum in xrange(0, NUMFILES, 50):
+        filename = '/src/pkg/mod%d.py' % (filenum,)
+        store.union(filename)
+        store.tests_hitting(filename, 100)
+    return (size, recording, time.time() - started)
+
+def measure_in_child(klass, n):
+    (r, w) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.write(w, repr(measure(klass, n)))
+        finally:
+            os._exit(0)
+    os.close(w)
+    result = os.read(r, 1000)
+    os.waitpid(pid, 0)
+    return eval(result)
+
+def bench(N=10000):
+    for klass in (PlainSets, CoverageStore):
+        (size, recording, querying) = measure_in_child(klass, N)
+        print "%-14s %6d tests: %7.1f MB, %6d bytes per test, recording %.2fs, 10 unions and 10 line queries %.2fs" % (klass.__name__, N, size / 1e6, size / N, recording, querying)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        bench(int(sys.argv[1]))
+    else:
+        bench()
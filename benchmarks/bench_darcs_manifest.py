@@ -0,0 +1,108 @@
+"""
+Measure what setuptools_darcs.find_files_for_darcs() costs when setuptools
+calls it once for each directory of a synthetic darcs repository of N files
+(5000 by default) in directories of 20 files, 3 levels deep, with the cache
+of darcs's output cleared before each call (as every call ran darcs before
+it was added) versus kept.
+
+  python -m benchmarks.bench_darcs_manifest [N]
+
+If darcs is installed the repository is a real one, made with darcs init, add
+and record. Otherwise the two darcs commands are replaced by functions which
+return the manifest that darcs would after sleeping for SIMULATED_LATENCY
+seconds, about what starting darcs on such a repository takes.
+"""
+
+import os, sys, time
+
+from pyutil import fileutil
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..', 'setuptools_darcs-1.2.11.egg'))
+from setuptools_darcs import setuptools_darcs
+
+FILES_PER_DIR = 20
+DEPTH = 3
+SIMULATED_LATENCY = 0.1
+
+def have_darcs():
+    for d in os.environ.get('PATH', '').split(os.pathsep):
+        if os.path.exists(os.path.join(d, 'darcs')):
+            return True
+    return False
+
+def make_tree(top, n):
+    """ Returns the repo-relative names of the directories and the files. """
+    dirs, files = set(['']), []
+    for i in xrange(n):
+        d = i // FILES_PER_DIR
+        parts = []
+        for level in xrange(DEPTH):
+            parts.append('d%d' % (d % 10,))
+            d //= 10
+        reldir = '/'.join(parts)
+        for j in range(1, len(parts)+1):
+            dirs.add('/'.join(parts[:j]))
+        relname = reldir + '/f%d.py' % (i,)
+        fname = os.path.join(top, *relname.split('/'))
+        fileutil.make_dirs(os.path.dirname(fname))
+        fileutil.write_file(fname, '')
+        files.append(relname)
+    return (sorted(dirs), files)
+
+def simulate_darcs(top, files):
+    """ Replaces the darcs commands, and makes top look like a darcs
+    repository to the cache. """
+    fileutil.make_dirs(os.path.join(top, '_darcs', 'patches'))
+    fileutil.write_file(os.path.join(top, '_darcs', 'hashed_inventory'), 'synthetic')
+    manifest = '.\n' + ''.join(['./%s\n' % (f,) for f in files])
+    def query_manifest():
+        time.sleep(SIMULATED_LATENCY)
+        return (0, manifest)
+    def whatsnew_dot():
+        time.sleep(SIMULATED_LATENCY)
+        return (1, "No changes!\n")
+    setuptools_darcs.run_darcs_query_manifest = query_manifest
+    setuptools_darcs.run_darcs_whatsnew_dot = whatsnew_dot
+
+def real_darcs(top, files):
+    os.system("darcs init --quiet && darcs add --quiet -r . && darcs record --quiet -a -A bench -m files >/dev/null")
+
+def walk_dirs(dirs, cached):
+    """ Returns (seconds, number of files found). """
+    found = 0
+    started = time.time()
+    for d in dirs:
+        if not cached:
+            setuptools_darcs._manifest_cache.clear()
+        for fn in setuptools_darcs.find_files_for_darcs(d.replace('/', os.sep)):
+            found += 1
+    return (time.time() - started, found)
+
+def bench(N=5000):
+    tmpdir = fileutil.NamedTemporaryDirectory()
+    top = tmpdir.name
+    olddir = os.getcwd()
+    try:
+        (dirs, files) = make_tree(top, N)
+        os.chdir(top)
+        if have_darcs():
+            real_darcs(top, files)
+            how = "real darcs"
+        else:
+            simulate_darcs(top, files)
+            how = "darcs simulated with %.2fs per command" % (SIMULATED_LATENCY,)
+        print "%d files in %d directories, %s" % (N, len(dirs), how)
+        for cached in (False, True):
+            setuptools_darcs._manifest_cache.clear()
+            (seconds, found) = walk_dirs(dirs, cached)
+            print "%-9s %7.2fs for %d calls, %.4fs per call, %d files listed" % (cached and "cached" or "uncached", seconds, len(dirs), seconds / len(dirs), found)
+    finally:
+        os.chdir(olddir)
+        tmpdir.shutdown()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        bench(int(sys.argv[1]))
+    else:
+        bench()
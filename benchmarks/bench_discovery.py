@@ -0,0 +1,61 @@
+"""
+Measure the startup cost of finding the packages and modules of a synthetic
+tree of N packages (each with 20 modules and a subpackage with 20 more),
+with setuptools.find_packages() plus os.walk() versus a warm discovery cache.
+
+  python -m benchmarks.bench_discovery
+"""
+
+import os
+
+from pyutil import benchutil, fileutil
+
+import setuptools
+
+from trialcoverage.discovery import DiscoveryIndex
+
+MODULES_PER_PACKAGE = 20
+
+class B(object):
+    def __init__(self):
+        self.tmpdir = None
+
+    def init(self, n):
+        self.tmpdir = fileutil.NamedTemporaryDirectory()
+        top = self.tmpdir.name
+        for i in xrange(n):
+            for pkgdir in (os.path.join(top, 'pkg%d' % i), os.path.join(top, 'pkg%d' % i, 'sub')):
+                fileutil.make_dirs(pkgdir)
+                fileutil.write_file(os.path.join(pkgdir, '__init__.py'), '')
+                for j in xrange(MODULES_PER_PACKAGE):
+                    fileutil.write_file(os.path.join(pkgdir, 'mod%d.py' % j), '')
+        self.cachefname = os.path.join(top, 'discovery-cache.pickle')
+        self._scan(DiscoveryIndex(self.cachefname))
+
+    def _scan(self, index):
+        top = self.tmpdir.name
+        for pkg in index.find_packages(top):
+            for x in index.walk(os.path.join(top, *pkg.split('.'))):
+                pass
+        index.save()
+
+    def run_uncached(self, n):
+        top = self.tmpdir.name
+        for pkg in setuptools.find_packages(top):
+            for x in os.walk(os.path.join(top, *pkg.split('.'))):
+                pass
+
+    def run_cached(self, n):
+        self._scan(DiscoveryIndex(self.cachefname))
+
+def bench(Ns=(10, 100, 1000)):
+    b = B()
+    for N in Ns:
+        print "%5d packages, find_packages + os.walk: " % (N,),
+        benchutil.rep_bench(b.run_uncached, N, initfunc=b.init, runreps=1, runiters=5, UNITS_PER_SECOND=1000000)
+        print "%5d packages, warm discovery cache:    " % (N,),
+        benchutil.rep_bench(b.run_cached, N, initfunc=b.init, runreps=1, runiters=5, UNITS_PER_SECOND=1000000)
+    benchutil.print_bench_footer(UNITS_PER_SECOND=1000000)
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,129 @@
+"""
+Measure what the coverage reporter costs compared with trial's stock
+reporter, on a synthetic package.
+
+  python -m benchmarks.bench_reporter --modules=200 --lines=100 \\
+      --branch-density=0.2 --tests=2000
+
+generates a package of --modules modules, each with a function of --lines
+lines of which about --branch-density are if-statements, plus --tests tests
+which each call one of those functions. It then runs trial on it once with
+each --reporters (default: bwverbose and bwverbose-coverage) in a fresh
+directory, and reports the wall time, the per-test overhead compared with the
+first reporter, the peak RSS of the trial process, and the bytes left in
+.coverage and .coverage-results/. Extra environment settings for the runs
+(e.g. TRIALCOVERAGE_SAVE_EVERY=100) are simply inherited.
+"""
+
+import os, subprocess, sys, time
+
+from optparse import OptionParser
+
+from pyutil import fileutil
+
+PKGNAME = 'benchpkg'
+
+def make_module(lines, branch_density):
+    """ Returns the source of a module with a function run(x) of about
+    `lines` lines. """
+    src = ["def run(x):\n", "    y = 0\n"]
+    n = 2
+    branches = 0
+    while n < lines - 1:
+        if branch_density and (branches + 1) <= branch_density * n:
+            src.append("    if x %% %d == 0:\n" % (branches % 7 + 2,))
+            src.append("        y += %d\n" % (n,))
+            branches += 1
+            n += 2
+        else:
+            src.append("    y += %d\n" % (n,))
+            n += 1
+    src.append("    return y\n")
+    return ''.join(src)
+
+def make_tests(modules, tests, perclass=50):
+    src = ["from twisted.trial import unittest\n"]
+    for i in range(modules):
+        src.append("from %s import mod%d\n" % (PKGNAME, i))
+    for j in range(tests):
+        if j % perclass == 0:
+            src.append("\nclass T%d(unittest.TestCase):\n" % (j // perclass,))
+        src.append("    def test_%d(self):\n        mod%d.run(%d)\n" % (j, j % modules, j))
+    return ''.join(src)
+
+def generate(topdir, modules, lines, branch_density, tests):
+    pkgdir = os.path.join(topdir, PKGNAME)
+    fileutil.make_dirs(os.path.join(pkgdir, 'test'))
+    fileutil.write_file(os.path.join(pkgdir, '__init__.py'), '')
+    fileutil.write_file(os.path.join(pkgdir, 'test', '__init__.py'), '')
+    modsrc = make_module(lines, branch_density)
+    for i in range(modules):
+        fileutil.write_file(os.path.join(pkgdir, 'mod%d.py' % (i,)), modsrc)
+    fileutil.write_file(os.path.join(pkgdir, 'test', 'test_generated.py'), make_tests(modules, tests))
+
+def dir_bytes(path):
+    total = 0
+    for (dirpath, dirnames, filenames) in os.walk(path):
+        for f in filenames:
+            total += os.path.getsize(os.path.join(dirpath, f))
+    return total
+
+def run_trial(rundir, reporter):
+    """ Runs trial in rundir and returns (wall seconds, peak RSS in KiB,
+    bytes of coverage results written). """
+    for f in ('.coverage', '.coverage-results', '_trial_temp'):
+        p = os.path.join(rundir, f)
+        if os.path.isdir(p):
+            fileutil.rm_dir(p)
+        else:
+            fileutil.remove_if_possible(p)
+
+    # Put the package under test first, and this source tree's parent next
+    # so that trial can find our plugin.
+    srcroot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([rundir, srcroot] + [p for p in [os.environ.get('PYTHONPATH')] if p])
+    cmd = [sys.executable, '-c', 'import sys; from twisted.scripts.trial import run; sys.argv[0] = "trial"; run()', '--reporter=%s' % (reporter,), PKGNAME]
+
+    devnull = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        p = subprocess.Popen(cmd, cwd=rundir, env=env, stdout=devnull, stderr=subprocess.STDOUT)
+        (pid, status, rusage) = os.wait4(p.pid, 0)
+        elapsed = time.time() - start
+    finally:
+        devnull.close()
+    written = dir_bytes(os.path.join(rundir, '.coverage-results'))
+    if os.path.exists(os.path.join(rundir, '.coverage')):
+        written += os.path.getsize(os.path.join(rundir, '.coverage'))
+    return (elapsed, rusage.ru_maxrss, written)
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--modules", type="int", default=100, help="number of modules [default: %default]")
+    parser.add_option("--lines", type="int", default=50, help="lines per module [default: %default]")
+    parser.add_option("--branch-density", type="float", default=0.2, help="fraction of lines which are if-statements [default: %default]")
+    parser.add_option("--tests", type="int", default=1000, help="number of tests [default: %default]")
+    parser.add_option("--reporters", default="bwverbose,bwverbose-coverage", help="comma-separated trial reporters to compare, the first is the reference [default: %default]")
+    parser.add_option("--runs", type="int", default=1, help="runs per reporter, the fastest is reported [default: %default]")
+    (options, args) = parser.parse_args(argv)
+
+    tmpdir = fileutil.NamedTemporaryDirectory()
+    try:
+        generate(tmpdir.name, options.modules, options.lines, options.branch_density, options.tests)
+        print "%d modules of %d lines, branch density %.2f, %d tests" % (options.modules, options.lines, options.branch_density, options.tests)
+        print "%-24s %10s %16s %14s %14s" % ("reporter", "wall (s)", "overhead/test", "peak RSS (KiB)", "bytes written")
+        reference = None
+        for reporter in options.reporters.split(','):
+            results = [run_trial(tmpdir.name, reporter) for i in range(options.runs)]
+            (elapsed, maxrss, written) = min(results)
+            if reference is None:
+                reference = elapsed
+            overhead = (elapsed - reference) / max(options.tests, 1)
+            print "%-24s %10.3f %14.3fms %14d %14d" % (reporter, elapsed, overhead * 1000, maxrss, written)
+    finally:
+        tmpdir.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
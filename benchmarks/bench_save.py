@@ -0,0 +1,47 @@
+"""
+Measure how long it takes to persist coverage data for a run of N tests,
+saving after every test (the old behavior) versus saving every 100 tests.
+
+  python -m benchmarks.bench_save
+"""
+
+import os
+
+from pyutil import benchutil, fileutil
+
+import coverage
+
+from trialcoverage import trialcoverage
+
+class B(object):
+    def __init__(self, numfiles=200, linesperfile=200, save_every=1):
+        self.numfiles = numfiles
+        self.linesperfile = linesperfile
+        self.save_every = save_every
+        self.tmpdir = fileutil.NamedTemporaryDirectory()
+
+    def init(self, n):
+        self.cov = coverage.coverage(data_file=os.path.join(self.tmpdir.name, '.coverage'))
+        # Pre-populate the data, as a big test suite would after a while.
+        for i in xrange(self.numfiles):
+            self.cov.data.add_line_data({'/src/pkg/mod%d.py' % i: dict.fromkeys(xrange(1, self.linesperfile), None)})
+        self.sp = trialcoverage.SavePolicy(save_every=self.save_every)
+
+    def run(self, n):
+        for i in xrange(n):
+            # Each test touches a few new lines.
+            self.cov.data.add_line_data({'/src/pkg/mod%d.py' % (i % self.numfiles): {self.linesperfile + i: None}})
+            if self.sp.test_finished(0):
+                trialcoverage.save_atomically(self.cov)
+                self.sp.saved(0)
+        trialcoverage.save_atomically(self.cov)
+
+def bench(N=100):
+    for save_every in (1, 10, 100):
+        b = B(save_every=save_every)
+        print "save every %3d tests, %d tests: " % (save_every, N),
+        benchutil.rep_bench(b.run, N, initfunc=b.init, runreps=1, runiters=5, UNITS_PER_SECOND=1000)
+    benchutil.print_bench_footer(UNITS_PER_SECOND=1000)
+
+if __name__ == "__main__":
+    bench()
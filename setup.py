@@ -68,7 +68,7 @@ setup(name=PKG,
       author_email='zooko@zooko.com',
       url='http://tahoe-lafs.org/trac/' + PKG,
       license='BSD', # see README.txt for details -- there are also alternative licences
-      packages=find_packages() + ['twisted'],
+      packages=find_packages(exclude=['benchmarks']) + ['twisted'],
       include_package_data=True,
       setup_requires=setup_requires,
       classifiers=trove_classifiers,
@@ -21,7 +21,58 @@ def run_darcs_query_manifest():
 def run_darcs_whatsnew_dot():
     return exec_darcs(['whatsnew', '.'])
 
-def find_files_for_darcs(dirname):
+# What darcs said the last time it was run in each current directory, so
+# that setuptools calling find_files_for_darcs() for each directory of the
+# tree doesn't run it each time:
+# { os.getcwd(): (repo state, (curdirname, { dir prefix: [relative filenames] })) }
+# where a dir prefix is "" or a repo-relative directory ending in "/".
+_manifest_cache = {}
+
+# The files which change when patches are recorded, pulled, obliterated or
+# unrecorded, or files are added or removed.
+REPO_STATE_FILES = ['hashed_inventory', 'inventory', 'tentative_hashed_inventory', os.path.join('patches', 'pending')]
+
+def find_repo_root(dirname):
+    dirname = os.path.abspath(dirname)
+    while True:
+        if os.path.isdir(os.path.join(dirname, '_darcs')):
+            return dirname
+        parent = os.path.dirname(dirname)
+        if parent == dirname:
+            return None
+        dirname = parent
+
+def repo_state(root):
+    """ Something which changes whenever the manifest of the repository at
+    root may have changed. """
+    state = []
+    for fn in REPO_STATE_FILES:
+        try:
+            st = os.stat(os.path.join(root, '_darcs', fn))
+        except EnvironmentError:
+            state.append(None)
+        else:
+            state.append((st.st_mtime, st.st_size, st.st_ino))
+    return tuple(state)
+
+def index_manifest(queryoutput):
+    """ Returns { dir prefix: [filenames relative to it] } of all of the
+    directories in the output of "darcs query manifest". """
+    index = {}
+    for fn in queryoutput.split('\n'):
+        if fn == ".":
+            continue
+        if fn.startswith('./'):
+            fn = fn[2:]
+        index.setdefault("", []).append(fn)
+        i = fn.find('/')
+        while i != -1:
+            index.setdefault(fn[:i+1], []).append(fn[i+1:])
+            i = fn.find('/', i+1)
+    return index
+
+def query_darcs():
+    """ Returns (curdirname, manifest index), or None if darcs failed. """
     try:
         unused, whatsnewoutput = run_darcs_whatsnew_dot()
         queryretcode, queryoutput = run_darcs_query_manifest()
@@ -49,6 +100,34 @@ def find_files_for_darcs(dirname):
     else:
         curdirname = ""
 
+    return (curdirname, index_manifest(queryoutput))
+
+def cached_query_darcs():
+    """ Like query_darcs(), but only runs darcs again if the current
+    directory or the state of its repository changed since the last time. """
+    cwd = os.getcwd()
+    root = find_repo_root(cwd)
+    if root is None:
+        # Not in a darcs repository, so there is nothing to tell whether
+        # the answer would still be the same.
+        return query_darcs()
+    state = repo_state(root)
+    cached = _manifest_cache.get(cwd)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+    res = query_darcs()
+    if res is None:
+        _manifest_cache.pop(cwd, None)
+    else:
+        _manifest_cache[cwd] = (state, res)
+    return res
+
+def find_files_for_darcs(dirname):
+    res = cached_query_darcs()
+    if res is None:
+        return
+    (curdirname, index) = res
+
     # Prepend this directory.
     rel_to_repo_dirname = curdirname + dirname
 
@@ -62,17 +141,11 @@ def find_files_for_darcs(dirname):
         rel_to_repo_dirname += '/'
 
     warn = True
-    for fn in queryoutput.split('\n'):
-        if fn == ".":
-            continue
-        if fn.startswith('./'):
-            fn = fn[2:]
-        if fn.startswith(rel_to_repo_dirname):
-            fn = fn[len(rel_to_repo_dirname):]
-            warn = False
-            # We need to replace "/" by "\\" because setuptools can't includes web/*.xhtml files on Windows, due of path separator
-            # This correct ticket #1033
-            yield fn.replace('/', os.sep)
+    for fn in index.get(rel_to_repo_dirname, []):
+        warn = False
+        # We need to replace "/" by "\\" because setuptools can't includes web/*.xhtml files on Windows, due of path separator
+        # This correct ticket #1033
+        yield fn.replace('/', os.sep)
 
     if warn and not os.path.exists('PKG-INFO'):
         from distutils import log
@@ -0,0 +1,178 @@
+"""
+An on-disk cache of the static part of coverage.py's analysis of each source
+file: which lines are statements, which are excluded, how multi-line
+statements map to their first line, and which arcs and branches are possible.
+None of that depends on the coverage data, only on the source, so a file that
+hasn't changed since the last run doesn't need to be parsed again.
+
+An entry is valid if the file's size and mtime are unchanged, or else if the
+SHA-1 of its contents is unchanged. The whole cache is thrown away if it was
+written by a different version of coverage.py or of this cache format, and an
+entry is thrown away if the exclusion regex it was computed with has
+changed. When there are more than maxentries entries the least recently used
+ones are evicted.
+"""
+
+import cPickle, errno, os, sys
+
+try:
+    from hashlib import sha1
+except ImportError:
+    # Python < 2.5
+    from sha import new as sha1
+
+from pyutil import fileutil
+
+import coverage
+from coverage.parser import CodeParser
+from coverage.results import Analysis, Numbers
+
+from util import write_file_atomically
+
+CACHE_FORMAT_VERSION = 1
+
+class CachedParser(object):
+    """ Stands in for coverage.parser.CodeParser, answering the questions
+    that coverage.results.Analysis asks of its parser from a cache
+    entry. """
+    def __init__(self, entry):
+        self.multiline = entry['multiline']
+        self._arcs = entry['arcs']
+        self._exit_counts = entry['exit_counts']
+
+    first_line = CodeParser.first_line.im_func
+    first_lines = CodeParser.first_lines.im_func
+
+    def arcs(self):
+        return self._arcs
+
+    def exit_counts(self):
+        return self._exit_counts
+
+class CachedAnalysis(Analysis):
+    """ A coverage.results.Analysis which takes its static information from
+    an AnalysisCache entry instead of parsing the source file. """
+    def __init__(self, cov, code_unit, entry):
+        self.coverage = cov
+        self.code_unit = code_unit
+        self.filename = self.code_unit.filename
+        self.parser = CachedParser(entry)
+        self.statements, self.excluded = entry['statements'], entry['excluded']
+
+        executed = self.coverage.data.executed_lines(self.filename)
+        exec1 = self.parser.first_lines(executed)
+        self.missing = sorted(set(self.statements) - set(exec1))
+
+        if self.coverage.data.has_arcs():
+            n_branches = self.total_branches()
+            mba = self.missing_branch_arcs()
+            n_missing_branches = sum([len(v) for v in mba.values()])
+        else:
+            n_branches = n_missing_branches = 0
+
+        self.numbers = Numbers(
+            n_files=1,
+            n_statements=len(self.statements),
+            n_excluded=len(self.excluded),
+            n_missing=len(self.missing),
+            n_branches=n_branches,
+            n_missing_branches=n_missing_branches,
+            )
+
+    def arcs_missing(self):
+        # Analysis.arcs_missing() looks each possible arc up in a list of
+        # the executed ones, which is quadratic in the size of the file.
+        executed = set(self.arcs_executed())
+        return sorted([p for p in self.arc_possibilities() if p not in executed])
+
+class AnalysisCache(object):
+    def __init__(self, fname, maxentries=10000):
+        self.fname = fname
+        self.maxentries = maxentries
+        self.entries = None # filename -> entry, loaded lazily
+        self.clock = 0
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        self.entries = {}
+        try:
+            data = cPickle.loads(fileutil.read_file(self.fname))
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                sys.stderr.write("WARNING, could not read analysis cache %s: %s\n" % (self.fname, le,))
+            return
+        except Exception, le:
+            sys.stderr.write("WARNING, discarding corrupt analysis cache %s: %s\n" % (self.fname, le,))
+            return
+        if not isinstance(data, dict) or data.get('format') != CACHE_FORMAT_VERSION or data.get('coverage') != coverage.__version__:
+            return
+        self.entries = data['entries']
+        self.clock = data['clock']
+
+    def save(self):
+        if not self.dirty:
+            return
+        if len(self.entries) > self.maxentries:
+            bylastuse = sorted(self.entries.iteritems(), key=lambda (f, entry): entry['lastuse'])
+            for (f, entry) in bylastuse[:len(self.entries) - self.maxentries]:
+                del self.entries[f]
+        data = {'format': CACHE_FORMAT_VERSION, 'coverage': coverage.__version__, 'clock': self.clock, 'entries': self.entries}
+        write_file_atomically(self.fname, cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL))
+        self.dirty = False
+
+    def _lookup(self, filename, exclude_re):
+        """ Returns the entry for filename, (re)computing it if it is
+        missing or stale. """
+        st = os.stat(filename)
+        entry = self.entries.get(filename)
+        if entry is not None and entry['exclude_re'] == exclude_re:
+            if entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+                self.hits += 1
+                return entry
+            source = fileutil.read_file(filename, mode='rU')
+            digest = sha1(source).hexdigest()
+            if entry['sha1'] == digest:
+                self.hits += 1
+                entry['size'], entry['mtime'] = st.st_size, st.st_mtime
+                self.dirty = True
+                return entry
+        else:
+            source = fileutil.read_file(filename, mode='rU')
+            digest = sha1(source).hexdigest()
+
+        self.misses += 1
+        parser = CodeParser(text=source, filename=filename, exclude=exclude_re)
+        statements, excluded = parser.parse_source()
+        entry = {
+            'lastuse': self.clock,
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'sha1': digest,
+            'exclude_re': exclude_re,
+            'statements': statements,
+            'excluded': excluded,
+            'multiline': parser.multiline,
+            'arcs': parser.arcs(),
+            'exit_counts': parser.exit_counts(),
+            }
+        self.entries[filename] = entry
+        self.dirty = True
+        return entry
+
+    def analyze(self, cov, code_unit):
+        """ Returns a coverage.results.Analysis of code_unit, like
+        cov._analyze() does. """
+        if self.entries is None:
+            self._load()
+        filename = code_unit.filename
+        if os.path.splitext(filename)[1] != '.py' or not os.path.exists(filename):
+            # Not a plain source file (e.g. it lives in a zip file).
+            return cov._analyze(code_unit)
+        entry = self._lookup(filename, cov.exclude_re)
+        # The use count is only written out when the cache is saved for some
+        # other reason, so eviction is approximately least-recently-used.
+        self.clock += 1
+        entry['lastuse'] = self.clock
+        return CachedAnalysis(cov, code_unit, entry)
@@ -0,0 +1,99 @@
+"""
+Compare an existing coverage data file with the best-ever run, without
+running any tests. For example, for a .coverage file combined from shards
+or downloaded from a CI build:
+
+  python -m trialcoverage.check --data-file=path/to/.coverage
+
+prints the same summary as the end of a trial run and exits with the code
+that ProgressionReporter.coverage_progressed() returns: 0 if coverage
+regressed, 1 if there is no best-ever run yet, 2 if it is unchanged and 3 if
+it improved (4 if the data file doesn't exist). The best-ever run is only
+replaced with --update-baseline, and the per-file baseline is only read if
+the totals regressed, unless --files is given.
+
+With --combine the data files written by the processes of a
+TRIALCOVERAGE_PARALLEL=1 run are first merged into the data file and
+removed; that is the step which reports on such a run, once all of its
+processes have finished:
+
+  python -m trialcoverage.check --combine --update-baseline
+
+With --history=best, --history=last or --history=N it instead prints that
+run of the coverage history (see trialcoverage/history.py), and with
+--export=FILE also writes its data to FILE, and exits with 0, or 4 if the
+history doesn't hold that run. --history=all lists every kept run.
+"""
+
+import os, sys
+
+from optparse import OptionParser
+
+import coverage
+
+import trialcoverage
+from history import History, describe_run
+from profiles import ProfileError
+
+def show_history(which, export=None):
+    history = History(trialcoverage.HISTORY_DIRNAME)
+    if which == 'all':
+        for runnum in history.runs():
+            sys.stdout.write(describe_run(history.run(runnum)) + "\n")
+        return 0
+    manifest = history.find_run(which)
+    if manifest is None:
+        sys.stderr.write("the coverage history in %s has no run %r\n" % (trialcoverage.HISTORY_DIRNAME, which,))
+        return 4
+    sys.stdout.write(describe_run(manifest) + "\n")
+    if export:
+        history.write_data(manifest, export)
+        sys.stdout.write("Wrote the data of run %d to %s\n" % (manifest['run'], export,))
+    return 0
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options]",
+                          description="Compare a coverage data file with the best-ever coverage and exit with 0 if it regressed, 1 if there is no best-ever coverage, 2 if it is unchanged, 3 if it improved.")
+    parser.add_option("--data-file", dest="data_file", default=None,
+                      help="the coverage data file [default: the one that trial writes]")
+    parser.add_option("--profile", dest="profile", default=None,
+                      help="compare with the best run of this measurement profile")
+    parser.add_option("--update-baseline", dest="update_baseline", action="store_true", default=False,
+                      help="if coverage didn't regress, make this the best run and record it in the history")
+    parser.add_option("--files", dest="files", action="store_true", default=False,
+                      help="list the files which regressed even if the totals didn't")
+    parser.add_option("--combine", dest="combine", action="store_true", default=False,
+                      help="first merge the data files of the processes of a parallel run into the data file")
+    parser.add_option("--history", dest="history", default=None,
+                      help="instead print the run of the coverage history which is 'best', 'last' or this run number, or every run with 'all'")
+    parser.add_option("--export", dest="export", default=None,
+                      help="with --history, also write the data of that run to this coverage data file")
+    (options, args) = parser.parse_args(argv)
+    if options.export and options.history in (None, 'all'):
+        parser.error("--export needs --history with a single run")
+
+    if options.profile:
+        try:
+            trialcoverage.use_profile(options.profile)
+        except ProfileError, le:
+            parser.error("no usable profile %r: %s" % (options.profile, le,))
+    if options.history:
+        return show_history(options.history, options.export)
+    fname = options.data_file or trialcoverage.COVERAGE_FNAME
+    cov = coverage.coverage(data_file=fname)
+    if options.combine:
+        combined = trialcoverage.combine_parallel_data(cov, fname=fname)
+        sys.stdout.write("Combined the coverage data of %d processes into %s\n" % (combined, fname,))
+    if not os.path.exists(fname):
+        sys.stderr.write("no coverage data file %s\n" % (fname,))
+        return 4
+
+    if not options.combine:
+        cov.load()
+    pr = trialcoverage.ProgressionReporter(cov)
+    return pr.report(None, update_baseline=options.update_baseline, file_diff=options.files)
+
+if __name__ == "__main__":
+    # Importing trialcoverage started coverage, which only the tests need.
+    trialcoverage.stop_measuring()
+    sys.exit(main())
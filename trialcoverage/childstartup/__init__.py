@@ -0,0 +1,5 @@
+"""
+This directory is put at the front of the PYTHONPATH of the child processes
+of a trial run with TRIALCOVERAGE_SUBPROCESS=1, so that Python runs its
+sitecustomize.py when they start.
+"""
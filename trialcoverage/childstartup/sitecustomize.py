@@ -0,0 +1,69 @@
+"""
+Measure the coverage of child processes of a trial run.
+
+With TRIALCOVERAGE_SUBPROCESS=1 the reporter puts this directory at the
+front of the PYTHONPATH that child processes inherit, and describes what to
+measure in TRIALCOVERAGE_SUBPROCESS_CONFIG. Python imports this module when
+a child starts, and it then starts coverage.py, and when the child exits
+writes its data to a file of its own, named after the data file in the
+config plus the host name, the process id and a random number. The reporter
+merges those files into the run's data before reporting on it.
+
+Only the standard library and coverage.py are imported, so that a child
+doesn't pay for more than that. Whatever sitecustomize module this one
+shadows is imported afterwards.
+"""
+
+import os, sys
+
+def start():
+    config = os.environ.get('TRIALCOVERAGE_SUBPROCESS_CONFIG')
+    if not config:
+        return
+    try:
+        import json
+    except ImportError:
+        # Python < 2.6
+        import simplejson as json
+    import atexit, random, socket
+    import coverage
+
+    config = json.loads(config)
+    cov = coverage.coverage(data_file=config['data_file'], include=config['include'], omit=config['omit'], branch=config['branch'])
+    # Our own exit handler saves the data, so coverage.py's needn't.
+    cov.atexit_registered = True
+
+    def save():
+        cov.stop()
+        cov._harvest_data()
+        # The process id is only known now, since a forked child of this
+        # process writes a file of its own too.
+        fname = "%s.%s.%s.%06d" % (config['data_file'], socket.gethostname(), os.getpid(), random.randint(0, 999999))
+        # Renamed into place so that the reporter never reads half of it.
+        cov.data.write_file(fname + '~')
+        os.rename(fname + '~', fname)
+    atexit.register(save)
+    cov.start()
+
+def chain():
+    """ Imports the sitecustomize module that this one shadows, if any. """
+    here = os.path.dirname(os.path.abspath(__file__))
+    saved = sys.path[:]
+    sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != here]
+    # Holding on to this module, since one that drops out of sys.modules
+    # has its globals cleared, which the exit handler needs.
+    this = sys.modules.pop('sitecustomize')
+    try:
+        try:
+            import sitecustomize
+        except ImportError, le:
+            if 'sitecustomize' not in str(le):
+                raise
+    finally:
+        sys.path[:] = saved
+        sys.modules['sitecustomize'] = this
+
+# Don't do anything when imported as part of the trialcoverage package.
+if __name__ == 'sitecustomize':
+    start()
+    chain()
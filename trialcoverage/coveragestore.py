@@ -0,0 +1,240 @@
+"""
+A compact in-memory store of the lines and arcs that each test executed.
+
+Held as { testid: { filename: set of lines } } (and the same for arcs), the
+per-test data of a big suite takes gigabytes, since each line number in a
+set costs about 60 bytes and each arc, a tuple of two ints, about 130. This
+store instead numbers the distinct lines and arcs of each file in the order
+in which they are first seen, and keeps what a test executed in a file as a
+single bitmap, a Python long with one bit for each of those:
+
+  store.files[filename].bitmaps[testix] = bitmap
+
+For each file that it executed, a test then costs the bitmap, which is
+24 + 4 * max(1, ceil(U / 30)) bytes where U is the number of distinct lines
+and arcs of that file which any test executed, plus its slot in the file's
+dict of bitmaps, which is at most 144 bytes (24 bytes a slot, and the table
+is never less than a sixth full). That doesn't depend on how many lines the
+test executed. Unions, differences and counts are bitwise operations on the
+bitmaps, and finding the tests which executed a line is a bit test on each
+of the file's bitmaps.
+
+See benchmarks/bench_coveragestore.py for measurements.
+"""
+
+import array, binascii
+
+_HEXBITS = dict([('%x' % i, ''.join([str((i >> b) & 1) for b in (3, 2, 1, 0)])) for i in range(16)])
+
+def _bin(n):
+    """ bin() of a non-negative n, for Python < 2.6. """
+    return '0b' + (''.join(map(_HEXBITS.get, '%x' % (n,))).lstrip('0') or '0')
+
+try:
+    bin, _bytebuf = bin, bytearray
+except NameError:
+    # Python < 2.6
+    bin = _bin
+    def _bytebuf(n):
+        return array.array('B', [0]) * n
+
+def make_bitmap(bits):
+    """ Returns a long with the given bit numbers set. """
+    if not bits:
+        return 0L
+    # Setting the bits one by one in a long would copy it each time.
+    buf = _bytebuf((max(bits) >> 3) + 1)
+    for b in bits:
+        buf[b >> 3] |= 1 << (b & 7)
+    buf.reverse()
+    return long(binascii.hexlify(buf), 16)
+
+def bits_of(bitmap):
+    """ Returns the numbers of the bits set in bitmap, in increasing
+    order. """
+    s = bin(bitmap)[:1:-1] # least significant bit first
+    bits = []
+    i = s.find('1')
+    while i >= 0:
+        bits.append(i)
+        i = s.find('1', i+1)
+    return bits
+
+def popcount(bitmap):
+    return bin(bitmap).count('1')
+
+def split_units(units):
+    """ Returns (set of lines, set of arcs) of units. """
+    lines, arcs = set(), set()
+    for u in units:
+        if isinstance(u, tuple):
+            arcs.add(u)
+        else:
+            lines.add(u)
+    return (lines, arcs)
+
+class FileUnits(object):
+    """ The distinct lines and arcs of one file which were executed, and
+    for each test a bitmap of the ones that it executed. """
+    def __init__(self):
+        self.bits = {} # line or arc -> bit number
+        self.units = [] # bit number -> line or arc
+        self.bitmaps = {} # testix -> bitmap
+
+    def bitmap(self, units, add=True):
+        """ Returns the bitmap of units. Units not seen before get new bit
+        numbers if add, else they are left out. """
+        bits = map(self.bits.get, units)
+        if None in bits:
+            if add:
+                new = [u for u in units if u not in self.bits]
+                self.bits.update(zip(new, xrange(len(self.units), len(self.units) + len(new))))
+                self.units.extend(new)
+                bits = map(self.bits.get, units)
+            else:
+                bits = [b for b in bits if b is not None]
+        return make_bitmap(bits)
+
+    def expand(self, bitmap):
+        return [self.units[b] for b in bits_of(bitmap)]
+
+class CoverageStore(object):
+    def __init__(self):
+        self.testids = [] # testix -> testid, or None once forgotten
+        self.testixs = {} # testid -> testix
+        self.files = {} # filename -> FileUnits
+        self.testfiles = {} # testix -> set of the files it executed
+
+    def record(self, testid, line_data, arc_data):
+        """ Stores what testid executed, replacing whatever was stored for
+        it before. line_data and arc_data map each filename to its lines or
+        arcs, as coverage.py's collector returns them. Returns the set of the
+        files that testid had executed before. """
+        testix = self.testixs.get(testid)
+        if testix is None:
+            testix = self.testixs[testid] = len(self.testids)
+            self.testids.append(testid)
+            before = set()
+        else:
+            before = self._forget(testix)
+        filenames = self.testfiles[testix] = set()
+        for filename in set(line_data).union(arc_data):
+            units = list(line_data.get(filename, ())) + list(arc_data.get(filename, ()))
+            if not units:
+                continue
+            fu = self.files.get(filename)
+            if fu is None:
+                fu = self.files[filename] = FileUnits()
+            fu.bitmaps[testix] = fu.bitmap(units)
+            filenames.add(filename)
+        return before
+
+    def _forget(self, testix):
+        """ Returns the set of the files that testix executed. """
+        filenames = self.testfiles.pop(testix, set())
+        for filename in filenames:
+            del self.files[filename].bitmaps[testix]
+        return filenames
+
+    def forget(self, testid):
+        """ Removes testid. Returns the set of the files it executed. """
+        testix = self.testixs.pop(testid, None)
+        if testix is None:
+            return set()
+        self.testids[testix] = None
+        return self._forget(testix)
+
+    def tests(self):
+        return [testid for testid in self.testids if testid is not None]
+
+    def __len__(self):
+        return len(self.testixs)
+
+    def __contains__(self, testid):
+        return testid in self.testixs
+
+    def __iter__(self):
+        return iter(self.tests())
+
+    def files_of(self, testid):
+        """ Returns the set of the files that testid executed. """
+        return set(self.testfiles.get(self.testixs.get(testid), ()))
+
+    def bitmaps(self, testid):
+        """ Returns { filename: bitmap } of what testid executed. The bits
+        of a file are numbered the same for every test, so the bitmaps of
+        different tests can be combined with bitwise operations. """
+        testix = self.testixs.get(testid)
+        return dict([(filename, self.files[filename].bitmaps[testix]) for filename in self.testfiles.get(testix, ())])
+
+    def executed(self, testid, filename):
+        """ Returns (set of lines, set of arcs) that testid executed in
+        filename. """
+        fu = self.files.get(filename)
+        if fu is None or testid not in self.testixs:
+            return (set(), set())
+        return split_units(fu.expand(fu.bitmaps.get(self.testixs[testid], 0L)))
+
+    def _union(self, fu, testids):
+        bitmap = 0L
+        if testids is None:
+            for b in fu.bitmaps.itervalues():
+                bitmap |= b
+        else:
+            for testid in testids:
+                bitmap |= fu.bitmaps.get(self.testixs.get(testid), 0L)
+        return bitmap
+
+    def union(self, filename, testids=None):
+        """ Returns (set of lines, set of arcs) that any of testids (by
+        default, any test) executed in filename. """
+        fu = self.files.get(filename)
+        if fu is None:
+            return (set(), set())
+        return split_units(fu.expand(self._union(fu, testids)))
+
+    def difference(self, filename, testid, others=None):
+        """ Returns (set of lines, set of arcs) that testid executed in
+        filename and none of others (by default, no other test) did. """
+        fu = self.files.get(filename)
+        if fu is None or testid not in self.testixs:
+            return (set(), set())
+        testix = self.testixs[testid]
+        if others is None:
+            othersbitmap = 0L
+            for (ix, bitmap) in fu.bitmaps.iteritems():
+                if ix != testix:
+                    othersbitmap |= bitmap
+        else:
+            othersbitmap = self._union(fu, others)
+        return split_units(fu.expand(fu.bitmaps.get(testix, 0L) & ~othersbitmap))
+
+    def count(self, filename, testids=None):
+        """ Returns how many distinct lines and arcs of filename any of
+        testids (by default, any test) executed. """
+        fu = self.files.get(filename)
+        if fu is None:
+            return 0
+        return popcount(self._union(fu, testids))
+
+    def tests_hitting(self, filename, unit=None):
+        """ Returns the sorted ids of the tests which executed unit, a line
+        or an arc, of filename, or any of it if unit is None. """
+        if unit is None:
+            return self.tests_hitting_any(filename)
+        return self.tests_hitting_any(filename, [unit])
+
+    def tests_hitting_any(self, filename, units=None):
+        """ Returns the sorted ids of the tests which executed any of units
+        of filename, or any of it if units is None. """
+        fu = self.files.get(filename)
+        if fu is None:
+            return []
+        if units is None:
+            testixs = fu.bitmaps.keys()
+        else:
+            mask = fu.bitmap(list(units), add=False)
+            if not mask:
+                return []
+            testixs = [testix for (testix, bitmap) in fu.bitmaps.iteritems() if bitmap & mask]
+        return sorted([self.testids[testix] for testix in testixs])
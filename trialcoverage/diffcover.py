@@ -0,0 +1,320 @@
+"""
+Coverage of the lines that changed, rather than of the whole tree.
+
+The totals can improve while a new, untested function hides behind tests
+added elsewhere, and on a big tree working them out means analyzing every
+file. With TRIALCOVERAGE_DIFF=FILE, where FILE is a unified diff (e.g. the
+output of "git diff" or "darcs diff -u"), the reporter instead analyzes only
+the files that the diff changes, and reports which of the changed lines were
+left untested: the changed statements that never ran, and the changed branch
+lines of which some exits were never taken. With TRIALCOVERAGE_DIFF=best the
+changed lines are found by comparing the sources with fingerprints of them
+recorded when the best run was made, in .coverage-results/best/sources.json
+next to that run's version stamp. The run fails if less than
+TRIALCOVERAGE_DIFF_THRESHOLD (default 80) percent of the changed statements
+were tested. The baseline and the history aren't updated by such a run.
+
+  python -m trialcoverage.diffcover --diff=changes.diff --threshold=90
+
+does the same for an existing data file, without running any tests, and
+exits with 0 if the changed lines pass the threshold, 1 if they don't and 4
+if the data file doesn't exist.
+
+Only .py files that the coverage data has a record of, or that the run would
+measure (they match the profile's include patterns or, without those, are in
+a package), are counted. Apart from reading the diff, and the stat() of each
+file in the fingerprints with TRIALCOVERAGE_DIFF=best, the work is
+proportional to the size of the changed files.
+"""
+
+import difflib, errno, fnmatch, os, re, sys, zlib
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+try:
+    from hashlib import sha1
+except ImportError:
+    # Python < 2.5
+    from sha import new as sha1
+
+from pyutil import fileutil
+
+from coverage.misc import format_lines
+
+from filediff import partial_lines
+from util import write_file_atomically
+
+HUNK_RE = re.compile(r'^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+def canonical_filename(fname):
+    return os.path.realpath(os.path.abspath(fname))
+
+def resolve_diff_path(path, exists=os.path.exists):
+    """ Returns the file that a path in a diff header refers to, dropping
+    as many of its leading directories (like the a/ and b/ of git, or the
+    directories that darcs and diff -r compare) as needed for it to exist,
+    or None if none does. """
+    parts = path.split('/')
+    for i in range(len(parts)):
+        candidate = os.path.join(*parts[i:])
+        if exists(candidate):
+            return canonical_filename(candidate)
+    return None
+
+def parse_unified_diff(text, exists=os.path.exists):
+    """ Returns { filename: set of line numbers } of the lines which a
+    unified diff adds or changes, numbered as in the new version. """
+    changed = {}
+    lines = None # the changed lines of the current file
+    lineno = 0
+    oldleft = newleft = 0 # the lines of the hunk still to come
+    for line in text.splitlines():
+        if oldleft > 0 or newleft > 0:
+            # In a hunk, where even a line like "+++ x" is an added line.
+            if line.startswith('+'):
+                if lines is not None:
+                    lines.add(lineno)
+                lineno += 1
+                newleft -= 1
+            elif line.startswith('-'):
+                oldleft -= 1
+            elif line.startswith(' ') or not line:
+                lineno += 1
+                oldleft -= 1
+                newleft -= 1
+            continue
+        if line.startswith('+++ '):
+            path = line[4:].split('\t')[0].strip()
+            if path == '/dev/null':
+                lines = None
+                continue
+            fname = resolve_diff_path(path, exists)
+            if fname is None:
+                sys.stderr.write("WARNING, the diff changes %s, which doesn't exist here\n" % (path,))
+                lines = None
+            else:
+                lines = changed.setdefault(fname, set())
+            continue
+        mo = HUNK_RE.match(line)
+        if mo:
+            (oldcount, newstart, newcount) = mo.groups()
+            oldleft = int(oldcount or 1)
+            newleft = int(newcount or 1)
+            lineno = int(newstart)
+    return changed
+
+def line_matcher(a, b):
+    try:
+        # Line hashes that are common, like those of blank lines, must not
+        # be taken for junk.
+        return difflib.SequenceMatcher(None, a, b, autojunk=False)
+    except TypeError:
+        # Python < 2.7.1
+        return difflib.SequenceMatcher(None, a, b)
+
+def fingerprint(fname):
+    """ Returns (sha1 of fname, list of a crc32 of each of its lines). """
+    data = fileutil.read_file(fname)
+    return (sha1(data).hexdigest(), [zlib.crc32(l) & 0xffffffff for l in data.splitlines()])
+
+class SourceBaseline(object):
+    """ Fingerprints of the sources of a run, to tell which lines changed
+    since. """
+    def __init__(self):
+        self.files = {} # filename -> [mtime, size, sha1, [crc32 of each line]]
+
+    def add(self, fname):
+        st = os.stat(fname)
+        (digest, linehashes) = fingerprint(fname)
+        self.files[fname] = [st.st_mtime, st.st_size, digest, linehashes]
+
+    def from_files(klass, fnames):
+        """ Fingerprints those of fnames which can be read. """
+        self = klass()
+        for fname in fnames:
+            try:
+                self.add(fname)
+            except EnvironmentError:
+                pass
+        return self
+    from_files = classmethod(from_files)
+
+    def changed_lines(self, fname):
+        """ Returns the set of the lines of fname which aren't in its
+        fingerprint, all of them if it has none, or None if it can't be
+        read. """
+        entry = self.files.get(fname)
+        try:
+            st = os.stat(fname)
+            if entry is not None and (st.st_mtime, st.st_size) == (entry[0], entry[1]):
+                return set()
+            (digest, linehashes) = fingerprint(fname)
+        except EnvironmentError:
+            return None
+        if entry is None:
+            return set(range(1, len(linehashes)+1))
+        if digest == entry[2]:
+            return set()
+        changed = set()
+        for (tag, i1, i2, j1, j2) in line_matcher(entry[3], linehashes).get_opcodes():
+            if tag in ('replace', 'insert'):
+                changed.update(range(j1+1, j2+1))
+        return changed
+
+    def changed(self, others=()):
+        """ Returns { filename: set of changed lines } of the files in the
+        fingerprints and of others, which aren't (so they are new). """
+        changed = {}
+        for fname in set(self.files).union(others):
+            lines = self.changed_lines(fname)
+            if lines:
+                changed[fname] = lines
+        return changed
+
+    def to_json(self):
+        return json.dumps({'files': self.files})
+
+    def save(self, fname):
+        write_file_atomically(fname, self.to_json(), mode='w')
+
+    def load(klass, fname):
+        """ Returns the fingerprints stored in fname, or None if there are
+        none (or they are unreadable). """
+        try:
+            self = klass()
+            self.files = json.loads(fileutil.read_file(fname, mode='rU'))['files']
+            return self
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                sys.stderr.write("WARNING, could not read source fingerprints %s: %s\n" % (fname, le,))
+        except (ValueError, KeyError, TypeError), le:
+            sys.stderr.write("WARNING, discarding corrupt source fingerprints %s: %s\n" % (fname, le,))
+        return None
+    load = classmethod(load)
+
+def is_measured(fname, executed, include=None, omit=None):
+    """ Whether the changes to fname count: it is a .py file which the
+    data has a record of, in executed, or which matches the include
+    patterns, or is in a package if there are none, and doesn't match the
+    omit patterns. """
+    if not fname.endswith('.py'):
+        return False
+    if [p for p in omit or [] if fnmatch.fnmatch(fname, os.path.abspath(p))]:
+        return False
+    if fname in executed:
+        return True
+    if include:
+        return bool([p for p in include if fnmatch.fnmatch(fname, os.path.abspath(p))])
+    return os.path.exists(os.path.join(os.path.dirname(fname), '__init__.py'))
+
+class FileDiffCoverage(object):
+    def __init__(self, analysis, changed):
+        self.filename = analysis.filename
+        statements = set(analysis.statements)
+        self.statements = sorted(statements.intersection(changed)) # changed statements
+        self.missing = sorted(statements.intersection(changed).intersection(analysis.missing))
+        # Executed branch lines only, so that none is counted twice.
+        self.partial = sorted(set(partial_lines(analysis)).intersection(changed))
+        self.missing_formatted = format_lines(analysis.statements, self.missing)
+
+    def untested(self):
+        return len(self.missing) + len(self.partial)
+
+    def describe(self):
+        s = "%s: %d of %d changed statements untested" % (self.filename, self.untested(), len(self.statements))
+        if self.missing:
+            s += "; uncovered: %s" % (self.missing_formatted,)
+        if self.partial:
+            s += "; partially covered: %s" % (", ".join(map(str, self.partial)),)
+        return s
+
+class DiffCoverage(object):
+    def __init__(self, files):
+        self.files = files # FileDiffCoverage of each changed file, sorted by filename
+
+    def from_analyses(klass, analyses, changed):
+        """ changed is { filename: set of changed lines }. """
+        files = [FileDiffCoverage(a, changed[a.filename]) for a in analyses]
+        files.sort(key=lambda f: f.filename)
+        return klass(files)
+    from_analyses = classmethod(from_analyses)
+
+    def statements(self):
+        return sum([len(f.statements) for f in self.files])
+
+    def untested(self):
+        return sum([f.untested() for f in self.files])
+
+    def percent(self):
+        """ The percentage of the changed statements which were tested,
+        100 if there are none. """
+        if not self.statements():
+            return 100.0
+        return 100.0 * (self.statements() - self.untested()) / self.statements()
+
+    def passes(self, threshold):
+        return self.percent() >= threshold
+
+    def report(self, out, threshold):
+        out.write("diff coverage: %d changed statements in %d files, %d untested, %.1f%% tested (threshold %.1f%%)\n" % (self.statements(), len(self.files), self.untested(), self.percent(), threshold))
+        for f in self.files:
+            if f.untested():
+                out.write("  %s\n" % (f.describe(),))
+        if self.passes(threshold):
+            out.write("diff coverage passes\n")
+        else:
+            out.write("WARNING diff coverage below the threshold\n")
+
+def main(argv=None):
+    from optparse import OptionParser
+    import coverage
+    import trialcoverage
+    from profiles import ProfileError
+    parser = OptionParser(usage="%prog [options]",
+                          description="Report the coverage of the lines that a diff, or the changes since the best run, added or changed, and exit with 0 if enough of them were tested, else 1.")
+    parser.add_option("--data-file", dest="data_file", default=None,
+                      help="the coverage data file [default: the one that trial writes]")
+    parser.add_option("--profile", dest="profile", default=None,
+                      help="use the include and omit patterns and the best run of this measurement profile")
+    parser.add_option("--diff", dest="diff", default='best',
+                      help="a unified diff, '-' to read it from stdin, or 'best' to compare the sources with the best run's [default: %default]")
+    parser.add_option("--threshold", dest="threshold", type="float", default=None,
+                      help="the percentage of the changed statements which must have been tested [default: TRIALCOVERAGE_DIFF_THRESHOLD or 80]")
+    (options, args) = parser.parse_args(argv)
+
+    if options.profile:
+        try:
+            trialcoverage.use_profile(options.profile)
+        except ProfileError, le:
+            parser.error("no usable profile %r: %s" % (options.profile, le,))
+    fname = options.data_file or trialcoverage.COVERAGE_FNAME
+    if not os.path.exists(fname):
+        sys.stderr.write("no coverage data file %s\n" % (fname,))
+        return 4
+    if options.threshold is None:
+        options.threshold = trialcoverage.DIFF_THRESHOLD
+    if options.diff == '-':
+        diff = sys.stdin.read()
+    elif options.diff == 'best':
+        diff = None
+    else:
+        diff = fileutil.read_file(options.diff, mode='rU')
+
+    cov = coverage.coverage(data_file=fname)
+    cov.load()
+    changed = trialcoverage.find_changed_lines(cov, diff)
+    pr = trialcoverage.ProgressionReporter(cov)
+    dc = pr.report_diff(changed, options.threshold)
+    if dc.passes(options.threshold):
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    import trialcoverage
+    # Importing trialcoverage started coverage, which only the tests need.
+    trialcoverage.stop_measuring()
+    sys.exit(main())
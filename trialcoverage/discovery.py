@@ -0,0 +1,116 @@
+"""
+A cache of the directory listings that package and module discovery needs,
+so that setuptools.find_packages() and the os.walk() over each package don't
+have to list every directory of a big checkout on every run.
+
+For each directory the cache remembers its mtime, its subdirectories and its
+.py files. A directory's mtime changes whenever an entry is added to it,
+removed from it or renamed in it, so a directory whose mtime is unchanged can
+be answered from the cache after a single stat, and only the directories
+that did change are listed again.
+
+Like setuptools.find_packages(), find_packages() follows symlinks to
+directories, except that a link back to a directory which encloses it is
+skipped instead of being followed forever. Like os.walk(), walk() lists them
+but doesn't descend into them.
+"""
+
+import cPickle, errno, os, sys
+
+from pyutil import fileutil
+
+from util import write_file_atomically
+
+CACHE_FORMAT_VERSION = 2
+
+class DiscoveryIndex(object):
+    def __init__(self, fname):
+        self.fname = fname
+        self.dirs = None # dirpath -> (mtime, subdirs, linked subdirs, pyfiles), loaded lazily
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        self.dirs = {}
+        try:
+            data = cPickle.loads(fileutil.read_file(self.fname))
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                sys.stderr.write("WARNING, could not read discovery cache %s: %s\n" % (self.fname, le,))
+            return
+        except Exception, le:
+            sys.stderr.write("WARNING, discarding corrupt discovery cache %s: %s\n" % (self.fname, le,))
+            return
+        if isinstance(data, dict) and data.get('format') == CACHE_FORMAT_VERSION:
+            self.dirs = data['dirs']
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {'format': CACHE_FORMAT_VERSION, 'dirs': self.dirs}
+        write_file_atomically(self.fname, cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL))
+        self.dirty = False
+
+    def _listdir(self, dirpath):
+        """ Returns (subdirs, symlinks to directories, pyfiles) for
+        dirpath. """
+        if self.dirs is None:
+            self._load()
+        mtime = os.stat(dirpath).st_mtime
+        cached = self.dirs.get(dirpath)
+        if cached is not None and cached[0] == mtime:
+            self.hits += 1
+            return cached[1:]
+
+        self.misses += 1
+        subdirs, linkdirs, pyfiles = [], [], []
+        for name in sorted(os.listdir(dirpath)):
+            path = os.path.join(dirpath, name)
+            if name.endswith('.py'):
+                pyfiles.append(name)
+            elif os.path.isdir(path):
+                if os.path.islink(path):
+                    linkdirs.append(name)
+                else:
+                    subdirs.append(name)
+        self.dirs[dirpath] = (mtime, subdirs, linkdirs, pyfiles)
+        self.dirty = True
+        return subdirs, linkdirs, pyfiles
+
+    def listdir(self, dirpath):
+        """ Returns (subdirs, pyfiles) for dirpath. subdirs includes
+        symlinks to directories. """
+        subdirs, linkdirs, pyfiles = self._listdir(dirpath)
+        if linkdirs:
+            return sorted(subdirs + linkdirs), pyfiles
+        return subdirs, pyfiles
+
+    def walk(self, top):
+        """ Like os.walk(top), except that only the .py files are listed in
+        filenames. """
+        try:
+            subdirs, linkdirs, pyfiles = self._listdir(top)
+        except EnvironmentError:
+            return
+        yield (top, sorted(subdirs + linkdirs), pyfiles)
+        for name in subdirs:
+            for x in self.walk(os.path.join(top, name)):
+                yield x
+
+    def find_packages(self, where='.'):
+        """ Like setuptools.find_packages(where). """
+        out = []
+        stack = [(where, '', [os.path.realpath(where)])]
+        while stack:
+            where, prefix, enclosing = stack.pop(0)
+            subdirs, pyfiles = self.listdir(where)
+            for name in subdirs:
+                fn = os.path.join(where, name)
+                if '.' not in name and '__init__.py' in self.listdir(fn)[1]:
+                    realfn = os.path.realpath(fn)
+                    if realfn in enclosing:
+                        continue
+                    out.append(prefix+name)
+                    stack.append((fn, prefix+name+'.', enclosing + [realfn]))
+        return out
@@ -0,0 +1,105 @@
+"""
+A machine-readable log of the run, written as it goes, for dashboards and
+CI to tail instead of scraping the text output.
+
+With TRIALCOVERAGE_EVENTS=1 the reporter writes .coverage-results/events.jsonl
+(.coverage-results/profiles/NAME/events.jsonl for a measurement profile, or
+the file named by TRIALCOVERAGE_EVENTS_FILE), one JSON object per line:
+
+  {"event": "start", "time": ..., "pid": ..., "profile": "default"}
+  {"event": "test", "id": "pkg.test.test_x.T.test_y", "outcome": "success",
+   "seconds": 0.012, "new_lines": 3, "new_arcs": 4}
+  ...
+  {"event": "end", "time": ..., "tests": 1234, "uncovered": 10, "partial": 5,
+   "statements": 9000, "branches": 2000, "files": 120, "progression": 3,
+   "verdict": "improvement"}
+
+outcome is one of success, failure, error, skip, expectedFailure and
+unexpectedSuccess. new_lines and new_arcs count the lines and arcs which the
+test executed and which no test before it (nor the existing .coverage data,
+nor the imports) had. progression is the exit code of trialcoverage/check.py
+and verdict says the same in words.
+
+Records are buffered and written out when TRIALCOVERAGE_EVENTS_BUFFER
+(default 100) of them are waiting, or when a test ends more than
+TRIALCOVERAGE_EVENTS_INTERVAL (default 1.0) seconds after the last write, so
+a record reaches the file at most that long, plus the duration of the next
+test, after its test ended. The file is truncated at the start of a run,
+except with TRIALCOVERAGE_PARALLEL=1, when all processes append to it, and
+the end record of each process only has its time and number of tests, since
+the verdict comes from the combined data.
+"""
+
+import os, time
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+VERDICTS = {0: 'regression', 1: 'no-baseline', 2: 'unchanged', 3: 'improvement'}
+
+# The names of the outcomes, and the lists of trial's TestResult which
+# record them.
+OUTCOMES = [('error', 'errors'), ('failure', 'failures'), ('skip', 'skips'), ('expectedFailure', 'expectedFailures'), ('unexpectedSuccess', 'unexpectedSuccesses')]
+
+def outcome_counts(result):
+    return [len(getattr(result, listname)) for (outcome, listname) in OUTCOMES]
+
+def outcome(before, after):
+    """ Returns the outcome of a test, given the outcome_counts() of the
+    TestResult from before and after it ran. """
+    for ((name, listname), b, a) in zip(OUTCOMES, before, after):
+        if a > b:
+            return name
+    return 'success'
+
+def count_new(data, line_data, arc_data):
+    """ Returns (lines, arcs): how many of the lines and arcs in line_data
+    and arc_data, as collected by coverage.py's collector, aren't in the
+    coverage.data.CoverageData data yet. """
+    newlines = newarcs = 0
+    for filename, lines in line_data.iteritems():
+        known = data.lines.get(filename, {})
+        newlines += len([l for l in lines if l not in known])
+    for filename, arcs in arc_data.iteritems():
+        known = data.arcs.get(filename, {})
+        newarcs += len([a for a in arcs if a not in known])
+    return (newlines, newarcs)
+
+class EventLog(object):
+    def __init__(self, fname, append=False, max_buffered=100, interval=1.0):
+        if append:
+            flags = os.O_WRONLY|os.O_CREAT|os.O_APPEND
+        else:
+            flags = os.O_WRONLY|os.O_CREAT|os.O_TRUNC
+        self.fd = os.open(fname, flags, 0666)
+        self.max_buffered = max_buffered
+        self.interval = interval
+        self.buffered = []
+        self.last_write = time.time()
+
+    def write(self, event, now=None):
+        if now is None:
+            now = time.time()
+        self.buffered.append(json.dumps(event))
+        if len(self.buffered) >= self.max_buffered or (now - self.last_write) >= self.interval:
+            self.flush(now)
+
+    def flush(self, now=None):
+        if self.buffered:
+            # One write per batch, so that the lines of parallel processes
+            # appending to the same file don't get interleaved.
+            os.write(self.fd, '\n'.join(self.buffered) + '\n')
+            self.buffered = []
+        if now is None:
+            now = time.time()
+        self.last_write = now
+
+    def close(self):
+        if self.fd is None:
+            return
+        self.flush()
+        os.close(self.fd)
+        self.fd = None
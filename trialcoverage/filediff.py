@@ -0,0 +1,126 @@
+"""
+Per-file coverage of the best run, and a diff of the current run against it.
+
+The grand totals can hide a regression: if one file loses coverage while
+another gains more, the totals still improve. So the best run's uncovered and
+partially covered counts are also kept per file, in
+.coverage-results/best/files.json, together with which lines were uncovered
+and which branch lines were partially covered (runs of consecutive lines
+stored as [first, last] pairs).
+
+The diff compares each file's two counts with the baseline's, which is cheap.
+Only the files whose counts got worse are compared line by line, to find the
+lines that are newly uncovered or newly partially covered, so the cost of the
+detailed part of the diff is proportional to the number of files that
+regressed rather than to the size of the tree.
+"""
+
+import errno, sys
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+from pyutil import fileutil
+
+from coverage.misc import format_lines
+
+from util import compress_lines, expand_lines, write_file_atomically
+
+def partial_lines(analysis):
+    """ The branch lines of which some but not all exits were taken. A
+    branch line which never ran at all is uncovered, not partially
+    covered. """
+    if not analysis.has_arcs():
+        return []
+    missing = set(analysis.missing)
+    return sorted([l for l in analysis.missing_branch_arcs() if l not in missing])
+
+class FileBaseline(object):
+    def __init__(self):
+        self.files = {} # filename -> [uncovered, partial, compressed missing lines, compressed partial lines]
+
+    def add(self, analysis):
+        nums = analysis.numbers
+        self.files[analysis.filename] = [nums.n_missing, nums.n_missing_branches, compress_lines(analysis.missing), compress_lines(partial_lines(analysis))]
+
+    def from_analyses(klass, analyses):
+        self = klass()
+        for analysis in analyses:
+            self.add(analysis)
+        return self
+    from_analyses = classmethod(from_analyses)
+
+    def to_json(self):
+        return json.dumps({'files': self.files})
+
+    def from_json(klass, s):
+        self = klass()
+        self.files = json.loads(s)['files']
+        return self
+    from_json = classmethod(from_json)
+
+    def save(self, fname):
+        write_file_atomically(fname, self.to_json(), mode='w')
+
+    def load(klass, fname):
+        """ Returns the baseline stored in fname, or None if there is none
+        (or it is unreadable). """
+        try:
+            return klass.from_json(fileutil.read_file(fname, mode='rU'))
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                sys.stderr.write("WARNING, could not read per-file coverage baseline %s: %s\n" % (fname, le,))
+        except (ValueError, KeyError, TypeError), le:
+            sys.stderr.write("WARNING, discarding corrupt per-file coverage baseline %s: %s\n" % (fname, le,))
+        return None
+    load = classmethod(load)
+
+class FileRegression(object):
+    def __init__(self, filename, bestunc, bestpart, curunc, curpart, missing, missing_formatted, partial):
+        self.filename = filename
+        self.bestunc = bestunc
+        self.bestpart = bestpart
+        self.curunc = curunc
+        self.curpart = curpart
+        self.missing = missing # newly uncovered lines
+        self.missing_formatted = missing_formatted # the same, as ranges of statements
+        self.partial = partial # newly partially covered branch lines
+
+    def to_dict(self):
+        return {'filename': self.filename, 'best': [self.bestunc, self.bestpart], 'current': [self.curunc, self.curpart], 'missing': compress_lines(self.missing), 'partial': compress_lines(self.partial)}
+
+    def describe(self):
+        s = "%s: %d -> %d lines uncovered, %d -> %d lines partially covered" % (self.filename, self.bestunc, self.curunc, self.bestpart, self.curpart)
+        if self.missing:
+            s += "; newly uncovered: %s" % (self.missing_formatted,)
+        if self.partial:
+            s += "; newly partially covered: %s" % (", ".join(map(str, self.partial)),)
+        return s
+
+def diff_against_baseline(baseline, analyses):
+    """ Returns a FileRegression, sorted by filename, for each of the given
+    coverage.results.Analysis whose file has more lines left untested than
+    in baseline, or more lines uncovered. A file which isn't in the baseline
+    is compared with a baseline of no untested lines. """
+    regressions = []
+    for analysis in analyses:
+        nums = analysis.numbers
+        curunc, curpart = nums.n_missing, nums.n_missing_branches
+        entry = baseline.files.get(analysis.filename)
+        if entry is None:
+            entry = [0, 0, [], []]
+        bestunc, bestpart = entry[0], entry[1]
+        if (curunc + curpart <= bestunc + bestpart) and (curunc <= bestunc):
+            continue
+
+        missing = sorted(set(analysis.missing) - set(expand_lines(entry[2])))
+        partial = sorted(set(partial_lines(analysis)) - set(expand_lines(entry[3])))
+        regressions.append(FileRegression(analysis.filename, bestunc, bestpart, curunc, curpart, missing, format_lines(analysis.statements, missing), partial))
+    regressions.sort(key=lambda r: r.filename)
+    return regressions
+
+def save_regressions(fname, regressions):
+    write_file_atomically(fname, json.dumps({'regressions': [r.to_dict() for r in regressions]}), mode='w')
@@ -0,0 +1,253 @@
+"""
+A history of coverage runs, stored under .coverage-results/history/.
+
+Each run is a small manifest in runs/ which maps every measured file to the
+key of a record in objects/. A record holds the executed lines and arcs of one
+file, pickled and zlib-compressed, and its key is the SHA-1 of its contents.
+So a file whose coverage data didn't change since some earlier run refers to
+the same record, and a run only writes records for the files whose data did
+change.
+
+index.json lists the runs that are kept and which of them are the last and
+the best, so finding them doesn't require reading every manifest, and counts
+how many of the kept runs refer to each record. When there are more than
+`keep` runs the oldest are evicted (the best run is always kept), and the
+records that no kept run refers to any more are deleted, which only needs
+the manifests of the evicted runs. If index.json is missing its counts or is
+unreadable, it is rebuilt from the manifests in runs/.
+
+Runs are recorded under index.json.lock, since the processes of a parallel
+run may be recording at the same time.
+
+  python -m trialcoverage.check --history=best --export=best.coverage
+
+prints the best run and writes its data to best.coverage; --history also
+takes 'last', a run number, or 'all' to list every kept run.
+"""
+
+import cPickle, errno, os, sys, time, zlib
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+try:
+    from hashlib import sha1
+except ImportError:
+    # Python < 2.5
+    from sha import new as sha1
+
+from pyutil import fileutil
+
+from coverage.data import CoverageData
+
+from util import acquire_lock, release_lock, replace_file, write_file_atomically
+
+def encode_record(filename, lines, arcs):
+    """ Returns (key, compressed record) for one file's data. """
+    data = cPickle.dumps((filename, sorted(lines), sorted(arcs)), 2)
+    return (sha1(data).hexdigest(), zlib.compress(data))
+
+def decode_record(compressed):
+    """ Returns (filename, lines, arcs). """
+    return cPickle.loads(zlib.decompress(compressed))
+
+def describe_run(manifest):
+    """ Returns a one-line description of a run. """
+    s = "run %d%s at %s" % (manifest['run'], manifest.get('best') and " (best)" or "", time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(manifest['time'])))
+    if manifest.get('version'):
+        s += ", version %s" % (manifest['version'],)
+    totals = manifest.get('totals')
+    if totals:
+        s += ": %d total lines untested (%d lines uncovered and %d lines partially covered) in %d files" % (totals['uncovered'] + totals['partial'], totals['uncovered'], totals['partial'], totals['files'])
+    return s
+
+class History(object):
+    def __init__(self, dirname, keep=1000):
+        self.dirname = dirname
+        self.keep = keep
+        self.objdir = os.path.join(dirname, 'objects')
+        self.rundir = os.path.join(dirname, 'runs')
+        self.indexfname = os.path.join(dirname, 'index.json')
+        self._index = None
+
+    def _objfname(self, key):
+        return os.path.join(self.objdir, key[:2], key[2:])
+
+    def _runfname(self, runnum):
+        return os.path.join(self.rundir, '%08d.json' % (runnum,))
+
+    def index(self):
+        if self._index is None:
+            try:
+                self._index = json.loads(fileutil.read_file(self.indexfname, mode='rU'))
+                if not isinstance(self._index.get('refs'), dict):
+                    # Written before the counts were kept.
+                    self._index = self._rebuild_index()
+            except EnvironmentError, le:
+                if le.errno != errno.ENOENT:
+                    raise
+                self._index = self._rebuild_index()
+            except (ValueError, AttributeError), le:
+                sys.stderr.write("WARNING, rebuilding corrupt coverage history index %s: %s\n" % (self.indexfname, le,))
+                self._index = self._rebuild_index()
+        return self._index
+
+    def _rebuild_index(self):
+        """ Returns the index of the runs whose manifests are in runs/. """
+        index = {'runs': [], 'best': None, 'last': None, 'next': 1, 'refs': {}}
+        try:
+            fnames = os.listdir(self.rundir)
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                raise
+            fnames = []
+        runnums = sorted([int(f[:-5]) for f in fnames if f.endswith('.json') and f[:-5].isdigit()])
+        for runnum in runnums:
+            try:
+                manifest = json.loads(fileutil.read_file(self._runfname(runnum), mode='rU'))
+                keys = manifest['files'].values()
+            except (EnvironmentError, ValueError, KeyError, AttributeError):
+                continue
+            index['runs'].append(runnum)
+            index['last'] = runnum
+            if manifest.get('best'):
+                index['best'] = runnum
+            self._add_refs(index, keys)
+        if runnums:
+            index['next'] = runnums[-1] + 1
+        return index
+
+    def _add_refs(self, index, keys, delta=1):
+        """ Adds delta to the count of each of keys. Returns the keys whose
+        count dropped to 0. """
+        refs = index['refs']
+        unreferenced = []
+        for key in keys:
+            n = refs.get(key, 0) + delta
+            if n > 0:
+                refs[key] = n
+            else:
+                refs.pop(key, None)
+                unreferenced.append(key)
+        return unreferenced
+
+    def _write_index(self):
+        write_file_atomically(self.indexfname, json.dumps(self._index), mode='w')
+
+    def runs(self):
+        """ The numbers of the kept runs, oldest first. """
+        return list(self.index()['runs'])
+
+    def best_run(self):
+        """ The manifest of the best run, or None. """
+        return self.run(self.index()['best'])
+
+    def last_run(self):
+        """ The manifest of the most recent run, or None. """
+        return self.run(self.index()['last'])
+
+    def run(self, runnum):
+        """ The manifest of run number runnum, or None if it isn't kept. """
+        if runnum is None or runnum not in self.index()['runs']:
+            return None
+        return json.loads(fileutil.read_file(self._runfname(runnum), mode='rU'))
+
+    def find_run(self, which):
+        """ The manifest of the run that which names: 'best', 'last' or a
+        run number. None if there is no such run, or it isn't kept. """
+        if which == 'best':
+            return self.best_run()
+        if which == 'last':
+            return self.last_run()
+        try:
+            return self.run(int(which))
+        except ValueError:
+            return None
+
+    def load_data(self, manifest):
+        """ Returns the (lines, arcs) of the given run in the format of
+        coverage.data.CoverageData.line_data() and arc_data(). """
+        lines, arcs = {}, {}
+        for filename, key in manifest['files'].iteritems():
+            (f, filelines, filearcs) = decode_record(fileutil.read_file(self._objfname(key)))
+            lines[filename] = filelines
+            if filearcs:
+                arcs[filename] = filearcs
+        return (lines, arcs)
+
+    def write_data(self, manifest, fname):
+        """ Writes the data of the given run to fname, as a coverage data
+        file. """
+        (lines, arcs) = self.load_data(manifest)
+        data = CoverageData()
+        data.add_line_data(dict([(f, dict.fromkeys(l)) for (f, l) in lines.iteritems()]))
+        data.add_arc_data(dict([(f, dict.fromkeys(a)) for (f, a) in arcs.iteritems()]))
+        data.write_file(fname + '~')
+        replace_file(fname + '~', fname)
+
+    def record(self, covdata, best=False, **info):
+        """ Adds a run with the data in covdata (a coverage.data.CoverageData)
+        and returns its number. info is stored in the run's manifest. If
+        best, this run becomes the best run. """
+        fileutil.make_dirs(self.dirname)
+        lockfname = self.indexfname + '.lock'
+        acquire_lock(lockfname)
+        try:
+            # Another process may have recorded a run since we read it.
+            self._index = None
+            return self._record(covdata, best, info)
+        finally:
+            release_lock(lockfname)
+
+    def _record(self, covdata, best, info):
+        index = self.index()
+        files = {}
+        written = 0
+        for filename, linemap in covdata.lines.iteritems():
+            (key, compressed) = encode_record(filename, linemap.keys(), covdata.arcs.get(filename, {}).keys())
+            files[filename] = key
+            objfname = self._objfname(key)
+            if not os.path.exists(objfname):
+                fileutil.make_dirs(os.path.dirname(objfname))
+                write_file_atomically(objfname, compressed)
+                written += 1
+
+        runnum = index['next']
+        manifest = dict(info)
+        manifest.update({'run': runnum, 'time': time.time(), 'best': bool(best), 'files': files})
+        fileutil.make_dirs(self.rundir)
+        write_file_atomically(self._runfname(runnum), json.dumps(manifest), mode='w')
+
+        index['runs'].append(runnum)
+        self._add_refs(index, files.values())
+        index['next'] = runnum + 1
+        index['last'] = runnum
+        if best:
+            index['best'] = runnum
+        self._evict()
+        self._write_index()
+        self.records_written = written
+        return runnum
+
+    def _evict(self):
+        index = self._index
+        if len(index['runs']) <= self.keep:
+            return
+        evictable = [r for r in index['runs'] if r not in (index['best'], index['last'])]
+        evicted = evictable[:len(index['runs']) - self.keep]
+        if not evicted:
+            return
+        for runnum in evicted:
+            try:
+                keys = self.run(runnum)['files'].values()
+            except (EnvironmentError, ValueError, KeyError, TypeError), le:
+                sys.stderr.write("WARNING, could not read the manifest of evicted run %d: %s\n" % (runnum, le,))
+                keys = []
+            index['runs'].remove(runnum)
+            fileutil.remove_if_possible(self._runfname(runnum))
+            # Delete the records that no kept run refers to any more.
+            for key in self._add_refs(index, keys, -1):
+                fileutil.remove_if_possible(self._objfname(key))
@@ -0,0 +1,190 @@
+"""
+An HTML report like the one 'coverage html' writes, generated in-process at
+the end of the run from the analyses that the progression report already
+computed, and only re-rendering the pages that changed.
+
+For every page the report directory's render-state.json remembers a SHA-1 of
+everything the page is rendered from: the file's source, its statements,
+excluded, uncovered and partially covered lines, and its numbers. A page
+whose fingerprint is unchanged since the last report, and which is still
+there, is reused as it is. The others are rendered by a pool of processes,
+and index.html is always written again.
+"""
+
+import cPickle, errno, os, sys
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+try:
+    from hashlib import sha1
+except ImportError:
+    # Python < 2.5
+    from sha import new as sha1
+
+from StringIO import StringIO
+
+from pyutil import fileutil
+
+import coverage
+import coverage.html
+from coverage.html import HtmlReporter, data
+from coverage.templite import Templite
+
+from util import write_file_atomically
+
+STATE_FORMAT_VERSION = 1
+
+class PageCodeUnit(object):
+    """ Stands in for the coverage.codeunit.CodeUnit of a page that is
+    rendered in another process. """
+    def __init__(self, name, rootname, source):
+        self.name = name
+        self._rootname = rootname
+        self._source = source
+
+    def flat_rootname(self):
+        return self._rootname
+
+    def source_file(self):
+        return StringIO(self._source)
+
+class PageAnalysis(object):
+    """ Stands in for the coverage.results.Analysis of a page that is
+    rendered in another process. """
+    def __init__(self, numbers, statements, excluded, missing, mba):
+        self.numbers = numbers
+        self.statements = statements
+        self.excluded = excluded
+        self.missing = missing
+        self.mba = mba
+
+    def missing_branch_arcs(self):
+        return self.mba
+
+class PageRenderer(HtmlReporter):
+    """ Renders pages from PageCodeUnit and PageAnalysis, without a
+    coverage object. """
+    def __init__(self, directory, arcs):
+        self.directory = directory
+        self.arcs = arcs
+        self.files = []
+        self.source_tmpl = Templite(data("htmlfiles/pyfile.html"), coverage.html.__dict__)
+
+def render_pages(args):
+    """ Renders each of the pages in jobs into directory. Returns
+    [(filename, html_filename, n_par)]. """
+    (directory, arcs, jobs) = args
+    renderer = PageRenderer(directory, arcs)
+    res = []
+    for (filename, name, rootname, source, statements, excluded, missing, mba, numbers) in jobs:
+        renderer.html_file(PageCodeUnit(name, rootname, source), PageAnalysis(numbers, statements, excluded, missing, mba))
+        page = renderer.files.pop()
+        res.append((filename, page['html_filename'], page['par']))
+    return res
+
+def parallel_render_pages(directory, arcs, jobs, processes=None):
+    try:
+        import multiprocessing
+    except ImportError:
+        multiprocessing = None
+    if processes is None and multiprocessing is not None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes or 1, len(jobs))
+    if multiprocessing is None or processes < 2:
+        return render_pages((directory, arcs, jobs))
+
+    chunks = [(directory, arcs, jobs[i::processes]) for i in range(processes)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(render_pages, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    res = []
+    for r in results:
+        res.extend(r)
+    return res
+
+def fingerprint(arcs, job):
+    """ A SHA-1 of everything that the page for job is rendered from. """
+    (filename, name, rootname, source, statements, excluded, missing, mba, numbers) = job
+    data = (coverage.__version__, arcs, filename, name, rootname, sha1(source).hexdigest(), list(statements), list(excluded), list(missing), sorted(mba.items()), sorted(numbers.__dict__.items()))
+    return sha1(cPickle.dumps(data, 2)).hexdigest()
+
+class IncrementalHtmlReporter(HtmlReporter):
+    def __init__(self, coverage, ignore_errors=False, processes=None):
+        super(IncrementalHtmlReporter, self).__init__(coverage, ignore_errors)
+        self.processes = processes
+        self.rendered = 0
+        self.reused = 0
+
+    def _load_state(self):
+        try:
+            state = json.loads(fileutil.read_file(self.statefname, mode='rU'))
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                sys.stderr.write("WARNING, could not read HTML report state %s: %s\n" % (self.statefname, le,))
+            return {}
+        except ValueError, le:
+            sys.stderr.write("WARNING, discarding corrupt HTML report state %s: %s\n" % (self.statefname, le,))
+            return {}
+        if not isinstance(state, dict) or state.get('format') != STATE_FORMAT_VERSION:
+            return {}
+        return state['files']
+
+    def report_analyses(self, analyses, directory):
+        """ Writes the report for the given coverage.results.Analysis into
+        directory. """
+        self.directory = directory
+        fileutil.make_dirs(directory)
+        self.statefname = os.path.join(directory, 'render-state.json')
+        oldstate = self._load_state()
+        state = {}
+        jobs = []
+        pages = {} # filename -> (analysis, html_filename, n_par)
+        for analysis in sorted(analyses, key=lambda a: a.code_unit):
+            cu = analysis.code_unit
+            try:
+                source = cu.source_file().read()
+            except EnvironmentError, le:
+                if not self.ignore_errors:
+                    sys.stderr.write("WARNING, could not read source of %s: %s\n" % (cu.name, le,))
+                continue
+            mba = self.arcs and analysis.missing_branch_arcs() or {}
+            job = (analysis.filename, cu.name, cu.flat_rootname(), source, analysis.statements, analysis.excluded, analysis.missing, mba, analysis.numbers)
+            fp = fingerprint(self.arcs, job)
+            old = oldstate.get(analysis.filename)
+            if old is not None and old[0] == fp and os.path.exists(os.path.join(directory, old[1])):
+                pages[analysis.filename] = (analysis, old[1], old[2])
+                state[analysis.filename] = old
+            else:
+                pages[analysis.filename] = (analysis, None, None)
+                state[analysis.filename] = [fp, None, None]
+                jobs.append(job)
+        self.reused = len(pages) - len(jobs)
+        self.rendered = len(jobs)
+
+        if jobs:
+            for (filename, html_filename, n_par) in parallel_render_pages(directory, self.arcs, jobs, self.processes):
+                pages[filename] = (pages[filename][0], html_filename, n_par)
+                state[filename][1:] = [html_filename, n_par]
+
+        # Remove the pages of files which are no longer in the report.
+        current = set([page[1] for page in pages.itervalues()])
+        for filename, old in oldstate.iteritems():
+            if old[1] not in current:
+                fileutil.remove_if_possible(os.path.join(directory, old[1]))
+
+        self.files = []
+        for (analysis, html_filename, n_par) in sorted(pages.values(), key=lambda p: p[0].code_unit):
+            self.files.append({'nums': analysis.numbers, 'par': n_par, 'html_filename': html_filename, 'cu': analysis.code_unit})
+        self.index_file()
+        for static in ["style.css", "coverage_html.js", "jquery-1.3.2.min.js", "jquery.tablesorter.min.js"]:
+            dst = os.path.join(directory, static)
+            if not os.path.exists(dst):
+                fileutil.write_file(dst, data("htmlfiles/" + static))
+        write_file_atomically(self.statefname, json.dumps({'format': STATE_FORMAT_VERSION, 'files': state}), mode='w')
@@ -0,0 +1,146 @@
+"""
+Named measurement profiles, so that e.g. a cheap line-only pass can run on
+every commit and the full branch pass nightly, from one configuration.
+
+A profile is a section named trialcoverage:NAME in setup.cfg or in
+.trialcoveragerc (which takes precedence) in the current directory:
+
+  [trialcoverage:fast]
+  branch = false
+  include = mypkg/*
+  omit = mypkg/test/*
+  save_every = 500
+  import_all = none
+
+include and omit are comma- or newline-separated filename patterns (by
+default every package under the current directory is included), save_every
+and save_interval are the same as TRIALCOVERAGE_SAVE_EVERY and
+TRIALCOVERAGE_SAVE_INTERVAL, and import_all is the same as
+TRIALCOVERAGE_IMPORT_ALL. The environment variables, when set, take
+precedence over the profile.
+
+Each profile NAME is available as the trial reporter
+--reporter=bwverbose-coverage-NAME, and keeps its data file, its best-ever
+baseline and its history in .coverage-results/profiles/NAME/, so that runs
+of one profile are only ever compared with runs of the same profile. A
+section named trialcoverage:default configures the plain bwverbose-coverage
+reporter.
+
+Coverage has to be started before the tests are imported, which is before
+trial creates the reporter, so the profile is taken from the --reporter
+option on trial's command line (or from TRIALCOVERAGE_PROFILE=NAME). Note
+that trial caches the list of reporters in twisted/plugins/dropin.cache, so
+after adding a profile touch trialcoveragereporterplugin.py or remove that
+file.
+"""
+
+import os
+
+from ConfigParser import RawConfigParser, Error as ConfigParserError
+
+CONFIG_FNAMES = ['setup.cfg', '.trialcoveragerc'] # later ones take precedence
+SECTION_PREFIX = 'trialcoverage:'
+DEFAULT_PROFILE = 'default'
+REPORTER_NAME = 'bwverbose-coverage'
+
+# The values of import_all, and of TRIALCOVERAGE_IMPORT_ALL.
+IMPORT_ALL_POLICIES = ('import', 'static', 'none')
+
+class ProfileError(Exception): pass
+
+def _bool(s):
+    s = s.strip().lower()
+    if s in ('1', 'yes', 'true', 'on'):
+        return True
+    if s in ('0', 'no', 'false', 'off'):
+        return False
+    raise ValueError("not a boolean: %r" % (s,))
+
+def _import_all(s):
+    s = s.strip()
+    if s not in IMPORT_ALL_POLICIES:
+        raise ValueError("not one of %s: %r" % (", ".join(IMPORT_ALL_POLICIES), s,))
+    return s
+
+def _patterns(s):
+    return [p.strip() for p in s.replace('\n', ',').split(',') if p.strip()]
+
+class Profile(object):
+    # option name -> parser of its value
+    OPTIONS = {
+        'branch': _bool,
+        'include': _patterns,
+        'omit': _patterns,
+        'save_every': int,
+        'save_interval': float,
+        'import_all': _import_all,
+        }
+
+    def __init__(self, name, **options):
+        self.name = name
+        self.branch = True
+        self.include = None # None means every package under the current directory
+        self.omit = None
+        self.save_every = None
+        self.save_interval = None
+        self.import_all = None
+        for (k, v) in options.items():
+            if k not in self.OPTIONS:
+                raise ProfileError("unknown option %r in trialcoverage profile %r" % (k, name,))
+            setattr(self, k, v)
+
+    def reporter_name(self):
+        if self.name == DEFAULT_PROFILE:
+            return REPORTER_NAME
+        return REPORTER_NAME + '-' + self.name
+
+def read_profiles(fnames=CONFIG_FNAMES):
+    """ Returns { name: Profile } for the profiles configured in fnames.
+    There is always a default profile. """
+    parser = RawConfigParser()
+    try:
+        parser.read(fnames)
+    except ConfigParserError, le:
+        raise ProfileError("could not parse %s: %s" % (" or ".join(fnames), le,))
+    profiles = {DEFAULT_PROFILE: Profile(DEFAULT_PROFILE)}
+    for section in parser.sections():
+        if not section.startswith(SECTION_PREFIX):
+            continue
+        name = section[len(SECTION_PREFIX):].strip()
+        options = {}
+        for (k, v) in parser.items(section):
+            if k not in Profile.OPTIONS:
+                raise ProfileError("unknown option %r in [%s]" % (k, section,))
+            try:
+                options[k] = Profile.OPTIONS[k](v)
+            except ValueError, le:
+                raise ProfileError("bad value for %r in [%s]: %s" % (k, section, le,))
+        profiles[name] = Profile(name, **options)
+    return profiles
+
+def profile_name_from_argv(argv):
+    """ Returns the name of the profile whose reporter was asked for on
+    trial's command line argv, or None. """
+    reporter = None
+    for i, arg in enumerate(argv):
+        if arg == '--reporter' and i+1 < len(argv):
+            reporter = argv[i+1]
+        elif arg.startswith('--reporter='):
+            reporter = arg[len('--reporter='):]
+    if reporter == REPORTER_NAME:
+        return DEFAULT_PROFILE
+    if reporter is not None and reporter.startswith(REPORTER_NAME + '-'):
+        return reporter[len(REPORTER_NAME + '-'):]
+    return None
+
+def find_profile(profiles, name):
+    """ Returns the Profile called name, or raises ProfileError. """
+    if name not in profiles:
+        raise ProfileError("no trialcoverage profile named %r; the profiles are %s" % (name, ", ".join(sorted(profiles)),))
+    return profiles[name]
+
+def select_profile(profiles, argv, environ=os.environ):
+    """ Returns the Profile to measure with: the one named by
+    TRIALCOVERAGE_PROFILE, else the one whose reporter was asked for in
+    argv, else the default one. """
+    return find_profile(profiles, environ.get('TRIALCOVERAGE_PROFILE') or profile_name_from_argv(argv) or DEFAULT_PROFILE)
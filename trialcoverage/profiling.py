@@ -0,0 +1,74 @@
+"""
+Per-test cProfile capture, for finding where the time goes inside slow tests.
+
+With TRIALCOVERAGE_CPROFILE=PATTERNS, a comma-separated list of fnmatch
+patterns of test ids (e.g. '*.test_web.*,*.test_storage.T.test_big'), and/or
+TRIALCOVERAGE_CPROFILE_SLOWEST=N, which picks the N slowest tests of the
+previous run as recorded in .coverage-results/timings.json (see
+TRIALCOVERAGE_TIMINGS), the reporter runs the chosen tests under cProfile as
+well as under coverage. Each test's stats are written to
+.coverage-results/cprofile/TESTID.prof, all of them are merged into
+.coverage-results/cprofile.prof, and the TRIALCOVERAGE_TIMINGS_TOP (default
+10) functions with the most internal time are printed after the coverage
+summary. The .prof files are in the format that the pstats module reads.
+
+cProfile hooks sys.setprofile() and coverage.py hooks sys.settrace(), so
+neither gets in the way of the other and the coverage data is the same as
+without profiling. The times that cProfile measures do include coverage.py's
+tracing overhead, though.
+"""
+
+import cProfile, fnmatch, os, pstats
+
+from pyutil import fileutil
+
+class TestProfiler(object):
+    def __init__(self, patterns=(), testids=()):
+        self.patterns = list(patterns)
+        self.testids = set(testids)
+        self.profiler = None # of the test that is running, if it is profiled
+        self.testid = None
+        self.profiles = [] # (testid, cProfile.Profile), in the order the tests ran
+
+    def wants(self, testid):
+        if testid in self.testids:
+            return True
+        for pattern in self.patterns:
+            if fnmatch.fnmatchcase(testid, pattern):
+                return True
+        return False
+
+    def start(self, testid):
+        self.testid = testid
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop(self):
+        """ Stops profiling the running test, if it is profiled. """
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        self.profiles.append((self.testid, self.profiler))
+        self.profiler = self.testid = None
+
+    def aggregate(self, stream=None):
+        """ Returns the pstats.Stats of all of the profiled tests, or None if
+        no test was profiled. """
+        if not self.profiles:
+            return None
+        return pstats.Stats(*[profiler for (testid, profiler) in self.profiles], **{'stream': stream})
+
+    def save(self, dirname, fname):
+        fileutil.make_dirs(dirname)
+        for (testid, profiler) in self.profiles:
+            profiler.dump_stats(os.path.join(dirname, testid + '.prof'))
+        total = self.aggregate()
+        if total is not None:
+            total.dump_stats(fname)
+
+    def report(self, out, n=10):
+        total = self.aggregate(out)
+        if total is None:
+            return
+        out.write("cProfile of %d tests, the %d functions with the most internal time:\n" % (len(self.profiles), n))
+        total.sort_stats('time').print_stats(n)
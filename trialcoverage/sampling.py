@@ -0,0 +1,181 @@
+"""
+Measure a rotating sample of the source files on each run, and estimate the
+totals of the whole tree from it.
+
+Branch tracing slows a suite down several times, but coverage.py only pays
+that for the lines of the files it measures. With TRIALCOVERAGE_SAMPLE=K the
+measured files are split into K slots, by a hash of each file's path within
+its top-level package (e.g. pkg/sub/mod.py), which is the same wherever the
+tree is checked out, and a run measures the files of one slot only,
+while running every test as usual. Which slot is measured is kept in
+.coverage-results/sample/state.json (.coverage-results/profiles/NAME/sample/
+for a measurement profile) together with the version stamp of the run that
+measured it: a run with the same version stamp (see
+.coverage-results/version-stamp.txt) measures the same slot again, and a run
+with a new one moves on to the next slot, so any K consecutive versions
+measure every file. The first slot is chosen by a hash of the version stamp.
+Without a version stamp each run moves on to the next slot.
+
+Each slot's data is written to .coverage-results/sample/.coverage.SLOT,
+replacing what the last run of that slot wrote, so the union of those files,
+e.g. made with "coverage combine" in that directory, is the coverage of the
+whole tree over the last K versions.
+
+The totals of the whole tree are estimated from the files of the slot as a
+simple random sample: the number of files times the mean per-file count,
+with a standard error that includes the finite population correction (the
+estimate itself when fewer than two files were measured), and 95% confidence
+bounds of 1.96 standard errors either side. The files of the slot are also
+compared one by one with the per-file baseline of the last full run.
+
+The estimates are compared with the sampled baseline in
+.coverage-results/best/sample.json, which is kept apart from the baseline of
+full runs, and the verdict is a probable regression if the uncovered or the
+untested (uncovered plus partially covered) estimate is worse by more than
+1.96 standard errors of the difference, a probable improvement if neither is
+worse and one is better by more than that, and unchanged otherwise. Unless
+the verdict is a probable regression the baseline is replaced with this
+run's estimates. Sampled runs aren't recorded in the history and never
+replace the baseline of full runs.
+"""
+
+import errno, math, os, sys, zlib
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+from pyutil import fileutil
+
+from util import write_file_atomically
+
+# For 95% confidence.
+Z = 1.96
+
+SAMPLE_VERDICTS = {0: 'probable-regression', 1: 'no-baseline', 2: 'unchanged', 3: 'probable-improvement'}
+
+def package_path(fname):
+    """ Returns the path of fname from the directory which holds its
+    top-level package, with / as the separator (e.g. 'pkg/sub/mod.py'), or
+    just its name if it isn't in a package. """
+    (dirname, name) = os.path.split(os.path.abspath(fname))
+    parts = [name]
+    while os.path.exists(os.path.join(dirname, '__init__.py')):
+        (dirname, pkgname) = os.path.split(dirname)
+        if not pkgname:
+            break
+        parts.append(pkgname)
+    parts.reverse()
+    return '/'.join(parts)
+
+def file_slot(fname, slots):
+    """ The slot of fname, which is the same in any checkout of the tree. """
+    return (zlib.crc32(package_path(fname)) & 0xffffffff) % slots
+
+def choose_slot(statefname, version, slots):
+    """ Returns the slot to measure for a run of version (which may be
+    None), and records it in statefname. """
+    try:
+        state = json.loads(fileutil.read_file(statefname, mode='rU'))
+        lastversion, lastslot = state['version'], int(state['slot'])
+        if int(state['slots']) != slots:
+            lastslot = None
+    except EnvironmentError, le:
+        if le.errno != errno.ENOENT:
+            sys.stderr.write("WARNING, could not read sampling state %s: %s\n" % (statefname, le,))
+        lastversion = lastslot = None
+    except (ValueError, KeyError, TypeError), le:
+        sys.stderr.write("WARNING, discarding corrupt sampling state %s: %s\n" % (statefname, le,))
+        lastversion = lastslot = None
+    if lastslot is None:
+        slot = (zlib.crc32(version or '') & 0xffffffff) % slots
+    elif version is not None and version == lastversion:
+        slot = lastslot
+    else:
+        slot = (lastslot + 1) % slots
+    write_file_atomically(statefname, json.dumps({'version': version, 'slot': slot, 'slots': slots}), mode='w')
+    return slot
+
+class Sample(object):
+    """ The slot measured by this run, out of slots, the files of that slot
+    and the number of files in all of the slots. """
+    def __init__(self, slot, slots, files, population):
+        self.slot = slot
+        self.slots = slots
+        self.files = files
+        self.population = population
+
+def estimate_total(values, population):
+    """ Returns (estimate, standard error) of the sum over a population of
+    that many items, of which values is a simple random sample. """
+    n = len(values)
+    if not n:
+        return (0.0, 0.0)
+    mean = float(sum(values)) / n
+    estimate = population * mean
+    if n < 2:
+        return (estimate, estimate)
+    variance = sum([(v - mean) ** 2 for v in values]) / (n - 1)
+    fpc = max(0.0, 1.0 - float(n) / population)
+    return (estimate, population * math.sqrt(fpc * variance / n))
+
+class SampleEstimate(object):
+    def __init__(self, uncovered, uncovered_se, untested, untested_se, files, population):
+        self.uncovered, self.uncovered_se = uncovered, uncovered_se
+        self.untested, self.untested_se = untested, untested_se
+        self.files = files # how many files were measured
+        self.population = population
+
+    def from_numbers(klass, numbers, population):
+        """ numbers is a list of the coverage.results.Numbers of each of
+        the measured files. """
+        (unc, uncse) = estimate_total([n.n_missing for n in numbers], population)
+        (tot, totse) = estimate_total([n.n_missing + n.n_missing_branches for n in numbers], population)
+        return klass(unc, uncse, tot, totse, len(numbers), population)
+    from_numbers = classmethod(from_numbers)
+
+    def bounds(self, estimate, se):
+        return (max(0.0, estimate - Z * se), estimate + Z * se)
+
+    def describe(self):
+        (unclo, unchi) = self.bounds(self.uncovered, self.uncovered_se)
+        (totlo, tothi) = self.bounds(self.untested, self.untested_se)
+        return "an estimated %.0f total lines untested (95%% confidence: %.0f to %.0f), of which %.0f lines uncovered (%.0f to %.0f), from %d of %d files" % (self.untested, totlo, tothi, self.uncovered, unclo, unchi, self.files, self.population)
+
+    def to_dict(self):
+        return {'uncovered': self.uncovered, 'uncovered_se': self.uncovered_se, 'untested': self.untested, 'untested_se': self.untested_se, 'files': self.files, 'population': self.population}
+
+    def save(self, fname):
+        write_file_atomically(fname, json.dumps(self.to_dict()), mode='w')
+
+    def load(klass, fname):
+        """ Returns the estimate stored in fname, or None if there is none
+        (or it is unreadable). """
+        try:
+            d = json.loads(fileutil.read_file(fname, mode='rU'))
+            return klass(float(d['uncovered']), float(d['uncovered_se']), float(d['untested']), float(d['untested_se']), int(d['files']), int(d['population']))
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                sys.stderr.write("WARNING, could not read sampled baseline %s: %s\n" % (fname, le,))
+        except (ValueError, KeyError, TypeError), le:
+            sys.stderr.write("WARNING, discarding corrupt sampled baseline %s: %s\n" % (fname, le,))
+        return None
+    load = classmethod(load)
+
+def compare_estimates(cur, best):
+    """ Returns, like compare_with_best(), 0 for a probable regression, 1
+    if there is no baseline, 2 if the difference is within the sampling
+    error and 3 for a probable improvement. """
+    if best is None:
+        return 1
+    uncdiff = cur.uncovered - best.uncovered
+    uncerr = Z * math.sqrt(cur.uncovered_se ** 2 + best.uncovered_se ** 2)
+    totdiff = cur.untested - best.untested
+    toterr = Z * math.sqrt(cur.untested_se ** 2 + best.untested_se ** 2)
+    if uncdiff > uncerr or totdiff > toterr:
+        return 0
+    if uncdiff < -uncerr or totdiff < -toterr:
+        return 3
+    return 2
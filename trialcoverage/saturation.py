@@ -0,0 +1,74 @@
+"""
+Stop tracing the files whose coverage can't get any better.
+
+Once every statement of a file has been executed and every branch of it has
+been taken both ways, nothing that runs later can change its numbers, yet
+every later test that calls into it still pays for tracing it. A
+SaturationTracker wraps the coverage collector's should_trace callback so
+that, once a file is found to be saturated, new frames of its code are no
+longer traced. Frames that are already running keep their trace function
+until they return.
+
+The check is done between tests, and only for the files that were executed
+since the last check. The data that was already collected is kept, so the
+totals at the end of the run are the same as without the tracker, but the
+data no longer says which later tests executed a saturated file, which is
+why this can't be combined with TRIALCOVERAGE_TEST_IMPACT,
+TRIALCOVERAGE_ORDER or TRIALCOVERAGE_STOP_EARLY.
+"""
+
+import sys
+
+from coverage.codeunit import code_unit_factory
+
+class SaturationTracker(object):
+    def __init__(self, cov, analysis_cache=None):
+        self.cov = cov
+        self.analysis_cache = analysis_cache
+        self.saturated = set()
+        self.pending = set() # files executed since the last check
+        self.failed = set() # files which couldn't be analyzed
+        self._should_trace = cov.collector.should_trace
+        cov.collector.should_trace = self.should_trace
+
+    def should_trace(self, filename, frame):
+        tracename = self._should_trace(filename, frame)
+        if tracename and tracename in self.saturated:
+            return False
+        return tracename
+
+    def analyze(self, cu):
+        if self.analysis_cache is None:
+            return self.cov._analyze(cu)
+        return self.analysis_cache.analyze(self.cov, cu)
+
+    def executed(self, filenames):
+        self.pending.update(filenames)
+
+    def check(self):
+        """ Checks the files executed since the last check against all of
+        the data harvested so far, stops tracing the ones which are
+        saturated, and returns them. """
+        newly = []
+        for filename in self.pending - self.saturated - self.failed:
+            cu = code_unit_factory([filename], self.cov.file_locator)[0]
+            try:
+                nums = self.analyze(cu).numbers
+            except KeyboardInterrupt:
+                raise
+            except Exception, le:
+                sys.stderr.write("WARNING, got exception while analyzing %s: %s\n" % (cu.name, le,))
+                self.failed.add(filename)
+                continue
+            if nums.n_missing == 0 and nums.n_missing_branches == 0:
+                newly.append(filename)
+        self.pending.clear()
+
+        if newly:
+            self.saturated.update(newly)
+            # The collector caches should_trace's answer per file name.
+            cache = self.cov.collector.should_trace_cache
+            for filename, tracename in cache.items():
+                if tracename in self.saturated:
+                    cache[filename] = False
+        return newly
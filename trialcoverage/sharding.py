@@ -0,0 +1,154 @@
+"""
+Split a suite across several machines into shards which take about the same
+time to run.
+
+With TRIALCOVERAGE_TIMINGS=1 the reporter records how long each test took,
+with the coverage work around it, and merges that into
+.coverage-results/timings.json (see trialcoverage/timing.py), which keeps the
+latest timing of every test that any run, on this machine or copied from the
+shards of an earlier CI build, has recorded. Then:
+
+  python -m trialcoverage.sharding --shards 4 mypkg
+
+prints the test ids of each of 4 shards, and
+
+  trial --reporter=bwverbose-coverage $(python -m trialcoverage.sharding --shards 4 --shard 2 mypkg)
+
+runs the third of them. The tests are assigned longest first, each to the
+shard with the least total duration so far. A test without a recorded
+duration is estimated at the mean duration of the recorded tests of its
+module, or of the whole suite if none of its module's are recorded, or at
+DEFAULT_SECONDS if no test is recorded at all.
+
+With --coverage the planner also reads the test impact index (see
+trialcoverage/testimpact.py) and, among the shards whose total exceeds the
+least loaded one's by no more than --slack (default 0.1) times the mean
+shard duration, puts each test on the one which has executed the fewest of
+the test's files so far. That spreads the tests of each file over the shards, so that each
+shard's partial coverage data says something about most of the code, at a
+small cost in balance.
+"""
+
+import heapq, os, sys
+
+from testimpact import TestImpactIndex
+from timing import TestTimings
+
+# The duration assumed for each test when no test has a recorded one.
+DEFAULT_SECONDS = 1.0
+
+def module_of(testid):
+    """ 'pkg.test.test_x.T.test_y' -> 'pkg.test.test_x' """
+    parts = testid.split('.')
+    if len(parts) > 2:
+        return '.'.join(parts[:-2])
+    return parts[0]
+
+def estimate(testids, durations):
+    """ durations is { testid: seconds }, as TestTimings.seconds() returns
+    it. Returns [(testid, seconds, estimated)] for testids, with the recorded
+    duration of each test or else an estimate. """
+    permodule = {} # module -> [seconds of its recorded tests]
+    for testid, s in durations.iteritems():
+        permodule.setdefault(module_of(testid), []).append(s)
+    if durations:
+        overall = sum(durations.itervalues()) / len(durations)
+    else:
+        overall = DEFAULT_SECONDS
+    res = []
+    for testid in testids:
+        s = durations.get(testid)
+        if s is not None:
+            res.append((testid, s, False))
+            continue
+        known = permodule.get(module_of(testid))
+        if known:
+            res.append((testid, sum(known) / len(known), True))
+        else:
+            res.append((testid, overall, True))
+    return res
+
+def plan_shards(tests, n, files=None, slack=0.1):
+    """ tests is [(testid, seconds)]. Returns a list of n lists of test
+    ids. If files, a dict of testid -> the set of files that the test
+    executed, is given, then each test goes to the shard which executed the
+    fewest of its files so far, out of the shards whose total duration
+    exceeds the smallest total by no more than slack times the mean shard
+    duration. """
+    shards = [[] for i in range(n)]
+    if not tests:
+        return shards
+    # Longest first; ties by id, so that the plan is the same every time.
+    tests = sorted(tests, key=lambda t: (-t[1], t[0]))
+    if files is None:
+        heap = [(0.0, i) for i in range(n)]
+        for (testid, seconds) in tests:
+            (total, i) = heapq.heappop(heap)
+            shards[i].append(testid)
+            heapq.heappush(heap, (total + seconds, i))
+        return shards
+
+    totals = [0.0] * n
+    shardfiles = [set() for i in range(n)]
+    margin = slack * sum([s for (testid, s) in tests]) / n
+    for (testid, seconds) in tests:
+        least = min(totals)
+        testfiles = files.get(testid, set())
+        candidates = [i for i in range(n) if totals[i] <= least + margin]
+        i = min(candidates, key=lambda i: (len(testfiles.intersection(shardfiles[i])), totals[i], i))
+        shards[i].append(testid)
+        totals[i] += seconds
+        shardfiles[i].update(testfiles)
+    return shards
+
+def list_tests(names):
+    """ Returns the ids of the tests that trial would run for names. """
+    from twisted.scripts import trial
+    from twisted.trial import unittest
+    config = trial.Options()
+    config.parseOptions(list(names))
+    return [test.id() for test in unittest._iterateTests(trial._getSuite(config))]
+
+def main(argv=None):
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options] --shards N TESTNAME...",
+                          description="Split the tests that trial would run for the given names into N shards of about the same duration, and print the test ids of each shard.")
+    parser.add_option("--shards", dest="shards", type="int", default=None,
+                      help="the number of shards")
+    parser.add_option("--shard", dest="shard", type="int", default=None,
+                      help="only print the test ids of this shard, counting from 0, one per line")
+    parser.add_option("--durations", dest="durations", default=os.path.join('.coverage-results', 'timings.json'),
+                      help="the test timings recorded by the coverage reporter [default: %default]")
+    parser.add_option("--coverage", dest="coverage", action="store_true", default=False,
+                      help="also spread the tests of each file over the shards, using the test impact index")
+    parser.add_option("--index", dest="index", default=os.path.join('.coverage-results', 'test-impact.json'),
+                      help="the test impact index written by the coverage reporter [default: %default]")
+    parser.add_option("--slack", dest="slack", type="float", default=0.1,
+                      help="with --coverage, how far from the best balance, as a fraction of the mean shard duration, a shard may be [default: %default]")
+    (options, args) = parser.parse_args(argv)
+    if not options.shards or options.shards < 1:
+        parser.error("--shards must be given, and at least 1")
+    if options.shard is not None and not (0 <= options.shard < options.shards):
+        parser.error("--shard must be between 0 and %d" % (options.shards-1,))
+
+    tests = estimate(list_tests(args), TestTimings.load(options.durations).seconds())
+    estimated = len([t for t in tests if t[2]])
+    if estimated:
+        sys.stderr.write("%d of %d tests have no recorded duration and were estimated\n" % (estimated, len(tests)))
+    files = None
+    if options.coverage:
+        files = TestImpactIndex.load(options.index).test_files()
+    seconds = dict([(testid, s) for (testid, s, e) in tests])
+    shards = plan_shards([(testid, s) for (testid, s, e) in tests], options.shards, files, options.slack)
+    if options.shard is not None:
+        for testid in shards[options.shard]:
+            sys.stdout.write(testid + "\n")
+        return 0
+    for (i, shard) in enumerate(shards):
+        sys.stdout.write("# shard %d: %d tests, about %.1fs\n" % (i, len(shard), sum([seconds[testid] for testid in shard])))
+        for testid in shard:
+            sys.stdout.write(testid + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage.analysiscache import AnalysisCache
+
+import os, sys, time
+
+from mock import Mock
+
+import coverage
+from coverage.codeunit import code_unit_factory
+
+MODCONTENTS = '''\
+def f(x):
+    if (x and
+        x > 1):
+        return 1
+    return 2
+'''
+
+class AnalysisCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cachefname = os.path.abspath('analysis-cache.pickle')
+        self.modfname = os.path.abspath('cachedmod.py')
+        fileutil.write_file(self.modfname, MODCONTENTS)
+        self.cov = coverage.coverage(data_file=os.path.abspath('cachetest.coverage'), branch=True)
+        self.cov.data.add_line_data({self.modfname: dict.fromkeys([1, 2, 3, 5])})
+        self.cov.data.add_arc_data({self.modfname: dict.fromkeys([(-1, 1), (1, -1), (-1, 2), (2, 5), (5, -1)])})
+        self.cu = code_unit_factory([self.modfname], self.cov.file_locator)[0]
+
+    def tearDown(self):
+        fileutil.remove_if_possible(self.cachefname)
+        fileutil.remove_if_possible(self.modfname)
+
+    def _numbers(self, analysis):
+        n = analysis.numbers
+        return (n.n_statements, n.n_missing, n.n_branches, n.n_missing_branches)
+
+    def test_same_as_uncached(self):
+        expected = self._numbers(self.cov._analyze(self.cu))
+        cache = AnalysisCache(self.cachefname)
+        self.failUnlessEqual(self._numbers(cache.analyze(self.cov, self.cu)), expected)
+        self.failUnlessEqual((cache.hits, cache.misses), (0, 1))
+        cache.save()
+
+        cache = AnalysisCache(self.cachefname)
+        a = cache.analyze(self.cov, self.cu)
+        self.failUnlessEqual((cache.hits, cache.misses), (1, 0))
+        self.failUnlessEqual(self._numbers(a), expected)
+        self.failUnlessEqual(a.missing_formatted(), self.cov._analyze(self.cu).missing_formatted())
+        self.failUnlessEqual(a.arcs_missing(), self.cov._analyze(self.cu).arcs_missing())
+        self.failUnlessEqual(a.missing_branch_arcs(), self.cov._analyze(self.cu).missing_branch_arcs())
+
+    def test_invalidated_when_source_changes(self):
+        cache = AnalysisCache(self.cachefname)
+        cache.analyze(self.cov, self.cu)
+        cache.save()
+
+        fileutil.write_file(self.modfname, MODCONTENTS + "\ndef g():\n    return 3\n")
+        os.utime(self.modfname, (time.time() + 10, time.time() + 10))
+        cache = AnalysisCache(self.cachefname)
+        a = cache.analyze(self.cov, self.cu)
+        self.failUnlessEqual((cache.hits, cache.misses), (0, 1))
+        self.failUnlessEqual(self._numbers(a), self._numbers(self.cov._analyze(self.cu)))
+
+    def test_touched_but_unchanged(self):
+        cache = AnalysisCache(self.cachefname)
+        cache.analyze(self.cov, self.cu)
+        cache.save()
+
+        os.utime(self.modfname, (time.time() + 10, time.time() + 10))
+        cache = AnalysisCache(self.cachefname)
+        cache.analyze(self.cov, self.cu)
+        self.failUnlessEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_corrupt_cache_is_discarded(self):
+        fileutil.write_file(self.cachefname, "garbage")
+        cache = AnalysisCache(self.cachefname)
+        self.patch(sys, 'stderr', Mock())
+        cache.analyze(self.cov, self.cu)
+        self.failUnless('corrupt analysis cache' in sys.stderr.method_calls[0][1][0], sys.stderr.method_calls)
+        self.failUnlessEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_eviction(self):
+        cache = AnalysisCache(self.cachefname, maxentries=1)
+        cache.analyze(self.cov, self.cu)
+        othermodfname = os.path.abspath('othercachedmod.py')
+        fileutil.write_file(othermodfname, "x = 1\n")
+        try:
+            cache.analyze(self.cov, code_unit_factory([othermodfname], self.cov.file_locator)[0])
+            cache.save()
+        finally:
+            fileutil.remove(othermodfname)
+        self.failUnlessEqual(cache.entries.keys(), [othermodfname])
@@ -0,0 +1,101 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage import check, trialcoverage
+
+import os, sys
+
+import coverage
+
+from mock import Mock
+
+MODCONTENTS = '''\
+def f(x):
+    if x:
+        return 1
+    return 2
+'''
+
+class CheckTest(unittest.TestCase):
+    def setUp(self):
+        self.patch(trialcoverage, 'WRITE_SUMMARY', False)
+        trialcoverage.init_paths()
+        fileutil.remove_if_possible(trialcoverage.BEST_TOTALS_FNAME)
+        fileutil.remove_if_possible(trialcoverage.BEST_FILES_FNAME)
+        self.modfname = os.path.abspath('checkmod.py')
+        fileutil.write_file(self.modfname, MODCONTENTS)
+        self.realstdout = sys.stdout
+        sys.stdout = Mock()
+
+    def tearDown(self):
+        sys.stdout = self.realstdout
+        fileutil.remove_if_possible(self.modfname)
+
+    def _write_data(self, lines):
+        fname = self.mktemp()
+        cov = coverage.coverage(data_file=fname)
+        cov.data.add_line_data({self.modfname: dict.fromkeys(lines)})
+        cov.data.write()
+        return fname
+
+    def test_verdicts(self):
+        fname = self._write_data([1, 2, 3])
+        self.failUnlessEqual(check.main(['--data-file', fname]), 1)
+        self.failIf(os.path.exists(trialcoverage.BEST_TOTALS_FNAME))
+        self.failUnlessEqual(check.main(['--data-file', fname, '--update-baseline']), 1)
+        self.failUnless(os.path.exists(trialcoverage.BEST_TOTALS_FNAME))
+        self.failUnlessEqual(check.main(['--data-file', fname]), 2)
+
+        self.failUnlessEqual(check.main(['--data-file', self._write_data([1, 2, 3, 4])]), 3)
+        self.failUnlessEqual(check.main(['--data-file', self._write_data([1])]), 0)
+        self.failUnlessEqual(check.main(['--data-file', self.mktemp()]), 4)
+
+    def _printed(self):
+        return ''.join([args[0] for (name, args, kwargs) in sys.stdout.method_calls if name == 'write'])
+
+    def test_history(self):
+        self.patch(trialcoverage, 'HISTORY_DIRNAME', os.path.abspath(self.mktemp()))
+        self.failUnlessEqual(check.main(['--data-file', self._write_data([1, 2, 3]), '--update-baseline']), 1)
+        self.failUnlessEqual(check.main(['--data-file', self._write_data([1, 2, 3, 4]), '--update-baseline']), 3)
+        # The best run's data is in the history.
+        self.failIf(os.path.exists(trialcoverage.BEST_COVERAGE_FNAME))
+
+        sys.stdout = Mock()
+        self.failUnlessEqual(check.main(['--history', 'all']), 0)
+        self.failUnlessEqual(len(self._printed().splitlines()), 2)
+        sys.stdout = Mock()
+        self.failUnlessEqual(check.main(['--history', 'last']), 0)
+        self.failUnless(self._printed().startswith('run 2 (best) at '), self._printed())
+        self.failUnless('0 total lines untested' in self._printed(), self._printed())
+        exported = self.mktemp()
+        self.failUnlessEqual(check.main(['--history', '1', '--export', exported]), 0)
+        data = coverage.coverage(data_file=exported)
+        data.load()
+        self.failUnlessEqual(sorted(data.data.line_data()[self.modfname]), [1, 2, 3])
+        self.patch(sys, 'stderr', Mock())
+        self.failUnlessEqual(check.main(['--history', '3']), 4)
+
+    def test_best_data_without_history(self):
+        self.patch(trialcoverage, 'HISTORY_KEEP', 0)
+        self.patch(trialcoverage, 'HISTORY_DIRNAME', os.path.abspath(self.mktemp()))
+        fileutil.remove_if_possible(trialcoverage.BEST_COVERAGE_FNAME)
+        self.failUnlessEqual(check.main(['--data-file', self._write_data([1, 2, 3]), '--update-baseline']), 1)
+        self.failIf(os.path.exists(trialcoverage.HISTORY_DIRNAME))
+        data = coverage.coverage(data_file=trialcoverage.BEST_COVERAGE_FNAME)
+        data.load()
+        self.failUnlessEqual(sorted(data.data.line_data()[self.modfname]), [1, 2, 3])
+
+    def test_profile_options(self):
+        # Going back to the default profile's options and paths afterwards
+        # must happen once PROFILE is restored, and cleanups run last first.
+        self.addCleanup(trialcoverage.init_paths)
+        self.addCleanup(trialcoverage.init_options)
+        self.patch(trialcoverage, 'PROFILE', trialcoverage.PROFILE)
+        self.patch(os, 'environ', dict([(k, v) for (k, v) in os.environ.items() if not k.startswith('TRIALCOVERAGE_')]))
+        fileutil.write_file('.trialcoveragerc', '[trialcoverage:quick]\nimport_all = none\nsave_every = 7\n')
+        self.addCleanup(fileutil.remove_if_possible, '.trialcoveragerc')
+        self.failUnlessEqual(check.main(['--profile', 'quick', '--history', 'all']), 0)
+        self.failUnlessEqual((trialcoverage.PROFILE.name, trialcoverage.IMPORT_ALL, trialcoverage.SAVE_EVERY), ('quick', 'none', 7))
+        self.failUnless(trialcoverage.HISTORY_DIRNAME.startswith(trialcoverage.PROFILE_DIRNAME))
+        self.failIfEqual(trialcoverage.PROFILE_DIRNAME, trialcoverage.RES_FULLDIRNAME)
@@ -0,0 +1,66 @@
+from twisted.trial import unittest
+
+from trialcoverage import coveragestore
+from trialcoverage.coveragestore import CoverageStore, bits_of, make_bitmap, popcount
+
+import array, random
+
+class BitmapTest(unittest.TestCase):
+    def test_roundtrip(self):
+        rng = random.Random(0)
+        for n in (0, 1, 7, 8, 9, 100, 5000):
+            bits = sorted(rng.sample(xrange(2 * n + 10), n))
+            bitmap = make_bitmap(bits)
+            self.failUnlessEqual(bits_of(bitmap), bits)
+            self.failUnlessEqual(popcount(bitmap), n)
+
+    def test_bin(self):
+        for n in (0L, 1L, 2L, 15L, 16L, 0x80000000L, make_bitmap([0, 3, 100, 257])):
+            self.failUnlessEqual(coveragestore._bin(n), bin(n))
+
+    def test_array_buffer(self):
+        # What make_bitmap uses in Python < 2.6, which has no bytearray.
+        self.patch(coveragestore, '_bytebuf', lambda n: array.array('B', [0]) * n)
+        self.failUnlessEqual(make_bitmap([0, 9, 64]), (1L << 64) | (1L << 9) | 1L)
+
+class CoverageStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store = CoverageStore()
+        self.store.record('t1', {'a': {1: None, 2: None}, 'b': {1: None}}, {'a': {(-1, 1): None, (1, 2): None}})
+        self.store.record('t2', {'a': {2: None, 3: None}}, {'a': {(2, 3): None}})
+
+    def test_queries(self):
+        s = self.store
+        self.failUnlessEqual(sorted(s), ['t1', 't2'])
+        self.failUnlessEqual(s.executed('t1', 'a'), (set([1, 2]), set([(-1, 1), (1, 2)])))
+        self.failUnlessEqual(s.union('a'), (set([1, 2, 3]), set([(-1, 1), (1, 2), (2, 3)])))
+        self.failUnlessEqual(s.union('a', ['t2']), (set([2, 3]), set([(2, 3)])))
+        self.failUnlessEqual(s.difference('a', 't1'), (set([1]), set([(-1, 1), (1, 2)])))
+        self.failUnlessEqual(s.difference('a', 't2', []), (set([2, 3]), set([(2, 3)])))
+        self.failUnlessEqual(s.count('a'), 6)
+        self.failUnlessEqual(s.tests_hitting('a', 2), ['t1', 't2'])
+        self.failUnlessEqual(s.tests_hitting('a', (1, 2)), ['t1'])
+        self.failUnlessEqual(s.tests_hitting('a', 99), [])
+        self.failUnlessEqual(s.tests_hitting('b'), ['t1'])
+        self.failUnlessEqual(s.tests_hitting('c'), [])
+
+    def test_replace_and_forget(self):
+        s = self.store
+        self.failUnlessEqual(s.record('t1', {'b': {2: None}}, {}), set(['a', 'b']))
+        self.failUnlessEqual(s.union('b'), (set([2]), set()))
+        self.failUnlessEqual(s.tests_hitting('a'), ['t2'])
+        self.failUnlessEqual(s.forget('t2'), set(['a']))
+        self.failUnlessEqual(s.forget('t2'), set())
+        self.failUnlessEqual((len(s), 't2' in s), (1, False))
+        self.failUnlessEqual(s.union('a'), (set(), set()))
+
+    def test_files_and_bitmaps(self):
+        s = self.store
+        self.failUnlessEqual(s.files_of('t1'), set(['a', 'b']))
+        self.failUnlessEqual(s.files_of('t3'), set())
+        bitmaps = s.bitmaps('t2')
+        self.failUnlessEqual(sorted(bitmaps), ['a'])
+        self.failUnlessEqual(sorted(s.files['a'].expand(bitmaps['a'])), [2, 3, (2, 3)])
+        self.failUnlessEqual(s.tests_hitting_any('a', [1, 3]), ['t1', 't2'])
+        self.failUnlessEqual(s.tests_hitting_any('a', [(2, 3), 99]), ['t2'])
+        self.failUnlessEqual(s.tests_hitting_any('a', [99]), [])
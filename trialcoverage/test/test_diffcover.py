@@ -0,0 +1,144 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage import check, diffcover, trialcoverage
+from trialcoverage.diffcover import SourceBaseline, parse_unified_diff
+
+import os, sys, time
+
+import coverage
+
+from mock import Mock
+
+MODCONTENTS = '''\
+def f(x):
+    if x:
+        return 1
+    return 2
+'''
+
+NEWMODCONTENTS = '''\
+def f(x):
+    if x:
+        return 1
+    return 2
+
+def g(x):
+    if x:
+        return 3
+    return 4
+'''
+
+DIFF = '''\
+diff --git a/pkg/mod.py b/pkg/mod.py
+--- a/pkg/mod.py
++++ b/pkg/mod.py
+@@ -1,3 +1,4 @@
+ def f(x):
++    y = x
+     if x:
+         return 1
+@@ -10,2 +11,3 @@ def g():
+-    a = 1
++++ this added line looks like a header
++    b = 2
+     return 3
+diff --git a/gone.py b/gone.py
+--- a/gone.py
++++ /dev/null
+@@ -1 +0,0 @@
+-x = 1
+'''
+
+class ParseTest(unittest.TestCase):
+    def test_parse(self):
+        exists = lambda p: p.replace(os.sep, '/') == 'pkg/mod.py'
+        changed = parse_unified_diff(DIFF, exists)
+        self.failUnlessEqual(changed, {os.path.realpath(os.path.abspath(os.path.join('pkg', 'mod.py'))): set([2, 11, 12])})
+
+class SourceBaselineTest(unittest.TestCase):
+    def test_changed_lines(self):
+        fname = os.path.abspath('srcmod.py')
+        fileutil.write_file(fname, 'a = 1\n\nb = 2\n\nc = 3\n')
+        baseline = SourceBaseline.from_files([fname, os.path.abspath('nonexistent.py')])
+        self.failUnlessEqual(baseline.changed_lines(fname), set())
+        fileutil.write_file(fname, 'a = 1\n\nb = 20\nbb = 21\n\nc = 3\n')
+        # Make sure that the change is visible even on a coarse-grained
+        # file system clock.
+        mtime = time.time() + 10
+        os.utime(fname, (mtime, mtime))
+        baseline.save('sources.json')
+        baseline = SourceBaseline.load('sources.json')
+        self.failUnlessEqual(baseline.changed_lines(fname), set([3, 4]))
+        # A file that wasn't fingerprinted is new.
+        newfname = os.path.abspath('newmod.py')
+        fileutil.write_file(newfname, 'x = 1\ny = 2\n')
+        self.failUnlessEqual(baseline.changed([newfname]), {fname: set([3, 4]), newfname: set([1, 2])})
+
+class DiffCoverTest(unittest.TestCase):
+    def setUp(self):
+        self.patch(trialcoverage, 'WRITE_SUMMARY', False)
+        trialcoverage.init_paths()
+        for fname in (trialcoverage.BEST_TOTALS_FNAME, trialcoverage.BEST_FILES_FNAME, trialcoverage.BEST_SOURCES_FNAME):
+            fileutil.remove_if_possible(fname)
+        self.modfname = os.path.realpath(os.path.abspath('diffmod.py'))
+        fileutil.write_file(self.modfname, MODCONTENTS)
+        self.realstdout = sys.stdout
+        sys.stdout = Mock()
+
+    def tearDown(self):
+        sys.stdout = self.realstdout
+        fileutil.remove_if_possible(self.modfname)
+
+    def _write_data(self, arcs):
+        fname = self.mktemp()
+        cov = coverage.coverage(data_file=fname, branch=True)
+        cov.data.add_arc_data({self.modfname: dict.fromkeys(arcs)})
+        cov.data.add_line_data({self.modfname: dict.fromkeys([l for arc in arcs for l in arc if l > 0])})
+        cov.data.write()
+        return fname
+
+    def _printed(self):
+        return ''.join([args[0] for (name, args, kwargs) in sys.stdout.method_calls if name == 'write'])
+
+    def test_against_best(self):
+        # f(1) and f(0).
+        fname = self._write_data([(-1, 1), (1, -1), (-1, 2), (2, 3), (3, -1), (2, 4), (4, -1)])
+        self.failUnlessEqual(check.main(['--data-file', fname, '--update-baseline']), 1)
+        self.failUnless(os.path.exists(trialcoverage.BEST_SOURCES_FNAME))
+        self.failUnlessEqual(diffcover.main(['--data-file', fname]), 0)
+        self.failUnless('diff coverage: 0 changed statements in 0 files' in self._printed(), self._printed())
+
+        fileutil.write_file(self.modfname, NEWMODCONTENTS)
+        mtime = time.time() + 10
+        os.utime(self.modfname, (mtime, mtime))
+        # g(1) only: line 9 is uncovered and the if on line 7 partially
+        # covered, out of 4 changed statements (the blank line isn't one).
+        fname = self._write_data([(-1, 1), (1, 6), (6, -1), (-1, 2), (2, 3), (3, -1), (2, 4), (4, -1), (-1, 7), (7, 8), (8, -1)])
+        sys.stdout = Mock()
+        self.failUnlessEqual(diffcover.main(['--data-file', fname, '--threshold', '50']), 0)
+        self.failUnless('4 changed statements in 1 files, 2 untested, 50.0% tested' in self._printed(), self._printed())
+        self.failUnless('uncovered: 9; partially covered: 7' in self._printed(), self._printed())
+        sys.stdout = Mock()
+        self.failUnlessEqual(diffcover.main(['--data-file', fname, '--threshold', '80']), 1)
+        self.failUnless('WARNING diff coverage below the threshold' in self._printed(), self._printed())
+
+    def test_diff_file(self):
+        fileutil.write_file(self.modfname, NEWMODCONTENTS)
+        fileutil.write_file('changes.diff', '--- a/diffmod.py\n+++ b/diffmod.py\n@@ -4,0 +5,3 @@\n+\n+def g(x):\n+    if x:\n')
+        fname = self._write_data([(-1, 1), (1, -1), (-1, 6), (6, -1), (-1, 7), (7, 8), (8, -1), (7, 9), (9, -1)])
+        self.failUnlessEqual(diffcover.main(['--data-file', fname, '--diff', 'changes.diff', '--threshold', '100']), 0)
+        self.failUnless('2 changed statements in 1 files, 0 untested, 100.0% tested' in self._printed(), self._printed())
+        self.failUnlessEqual(diffcover.main(['--data-file', 'nonexistent']), 4)
+
+    def test_unexecuted_branch(self):
+        # g never ran: its if on line 7 is uncovered, and only that, not
+        # partially covered as well.
+        fileutil.write_file(self.modfname, NEWMODCONTENTS)
+        fileutil.write_file('changes.diff', '--- a/diffmod.py\n+++ b/diffmod.py\n@@ -4,0 +5,3 @@\n+\n+def g(x):\n+    if x:\n')
+        fname = self._write_data([(-1, 1), (1, 6), (6, -1), (-1, 2), (2, 3), (3, -1)])
+        self.failUnlessEqual(diffcover.main(['--data-file', fname, '--diff', 'changes.diff', '--threshold', '50']), 0)
+        self.failUnless('2 changed statements in 1 files, 1 untested, 50.0% tested' in self._printed(), self._printed())
+        self.failUnless('uncovered: 7' in self._printed(), self._printed())
+        self.failIf('partially covered' in self._printed(), self._printed())
@@ -0,0 +1,89 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage.discovery import DiscoveryIndex
+
+import os, time
+
+import setuptools
+
+class DiscoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.top = os.path.abspath('discoverytree')
+        self.cachefname = os.path.abspath('discovery-cache.pickle')
+        for d in ('pkga', 'pkga/sub', 'pkga/data', 'pkgb', 'notapkg', 'notapkg/inner'):
+            fileutil.make_dirs(os.path.join(self.top, d))
+        for f in ('pkga/__init__.py', 'pkga/m.py', 'pkga/sub/__init__.py', 'pkga/sub/n.py', 'pkga/data/script.py', 'pkgb/__init__.py', 'notapkg/inner/__init__.py', 'README'):
+            fileutil.write_file(os.path.join(self.top, f), '')
+        self.links = []
+
+    def tearDown(self):
+        # rm_dir() would follow the links.
+        for link in self.links:
+            os.remove(link)
+        fileutil.rm_dir(self.top)
+        fileutil.remove_if_possible(self.cachefname)
+
+    def _walk(self, walk, top):
+        return [(dirpath, sorted(dirnames), sorted([f for f in filenames if f.endswith('.py')])) for (dirpath, dirnames, filenames) in walk(top)]
+
+    def test_same_as_uncached(self):
+        index = DiscoveryIndex(self.cachefname)
+        self.failUnlessEqual(sorted(index.find_packages(self.top)), sorted(setuptools.find_packages(self.top)))
+        pkga = os.path.join(self.top, 'pkga')
+        self.failUnlessEqual(self._walk(index.walk, pkga), self._walk(os.walk, pkga))
+
+    def test_reuses_unchanged_directories(self):
+        index = DiscoveryIndex(self.cachefname)
+        index.find_packages(self.top)
+        list(index.walk(os.path.join(self.top, 'pkga')))
+        index.save()
+
+        index = DiscoveryIndex(self.cachefname)
+        list(index.walk(os.path.join(self.top, 'pkga')))
+        self.failUnlessEqual(index.misses, 0)
+        self.failUnlessEqual(index.hits, 3)
+
+    def test_notices_new_modules(self):
+        index = DiscoveryIndex(self.cachefname)
+        self.failUnlessEqual(sorted(index.find_packages(self.top)), ['pkga', 'pkga.sub', 'pkgb'])
+        index.save()
+
+        sub = os.path.join(self.top, 'pkgb', 'newsub')
+        fileutil.make_dirs(sub)
+        fileutil.write_file(os.path.join(sub, '__init__.py'), '')
+        # Make sure the mtime differs even on filesystems with coarse mtimes.
+        later = time.time() + 10
+        os.utime(os.path.join(self.top, 'pkgb'), (later, later))
+
+        index = DiscoveryIndex(self.cachefname)
+        self.failUnlessEqual(sorted(index.find_packages(self.top)), ['pkga', 'pkga.sub', 'pkgb', 'pkgb.newsub'])
+
+    def _symlink(self, target, link):
+        link = os.path.join(self.top, link)
+        os.symlink(target, link)
+        self.links.append(link)
+
+    def test_follows_symlinks(self):
+        self._symlink(os.path.join('..', 'pkga', 'sub'), os.path.join('pkgb', 'linked'))
+        index = DiscoveryIndex(self.cachefname)
+        self.failUnlessEqual(sorted(index.find_packages(self.top)), ['pkga', 'pkga.sub', 'pkgb', 'pkgb.linked'])
+        self.failUnlessEqual(sorted(index.find_packages(self.top)), sorted(setuptools.find_packages(self.top)))
+        # But walk(), like os.walk(), doesn't descend into the link.
+        pkgb = os.path.join(self.top, 'pkgb')
+        self.failUnlessEqual(self._walk(index.walk, pkgb), self._walk(os.walk, pkgb))
+        self.failUnlessEqual(self._walk(index.walk, pkgb), [(pkgb, ['linked'], ['__init__.py'])])
+        index.save()
+        index = DiscoveryIndex(self.cachefname)
+        self.failUnlessEqual(sorted(index.find_packages(self.top)), ['pkga', 'pkga.sub', 'pkgb', 'pkgb.linked'])
+        self.failUnlessEqual(index.misses, 0)
+
+    def test_symlink_cycle(self):
+        # setuptools.find_packages() would never return.
+        self._symlink('..', os.path.join('pkga', 'sub', 'loop'))
+        index = DiscoveryIndex(self.cachefname)
+        self.failUnlessEqual(sorted(index.find_packages(self.top)), ['pkga', 'pkga.sub', 'pkgb'])
+
+    if not hasattr(os, 'symlink'):
+        test_follows_symlinks.skip = test_symlink_cycle.skip = "symlinks are not supported here"
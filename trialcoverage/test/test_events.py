@@ -0,0 +1,54 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage import events
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+from coverage.data import CoverageData
+
+from mock import Mock
+
+class EventsTest(unittest.TestCase):
+    def test_outcome(self):
+        result = Mock()
+        for (outcome, listname) in events.OUTCOMES:
+            setattr(result, listname, [])
+        before = events.outcome_counts(result)
+        self.failUnlessEqual(events.outcome(before, events.outcome_counts(result)), 'success')
+        result.skips.append(None)
+        self.failUnlessEqual(events.outcome(before, events.outcome_counts(result)), 'skip')
+
+    def test_count_new(self):
+        data = CoverageData()
+        data.add_line_data({'a': {1: None, 2: None}})
+        data.add_arc_data({'a': {(1, 2): None}})
+        self.failUnlessEqual(events.count_new(data, {'a': {2: None, 3: None}, 'b': {1: None}}, {'a': {(1, 2): None, (2, 3): None}}), (2, 1))
+
+    def test_bounded_buffering(self):
+        fname = self.mktemp()
+        log = events.EventLog(fname, max_buffered=3, interval=10.0)
+        log.write({'n': 1}, log.last_write + 1)
+        log.write({'n': 2}, log.last_write + 2)
+        self.failUnlessEqual(fileutil.read_file(fname), '')
+        log.write({'n': 3}, log.last_write + 3)
+        self.failUnlessEqual([json.loads(l)['n'] for l in fileutil.read_file(fname).splitlines()], [1, 2, 3])
+
+        # A record is written right away once the interval has passed.
+        log.write({'n': 4}, log.last_write + 10)
+        self.failUnlessEqual(len(fileutil.read_file(fname).splitlines()), 4)
+        log.write({'n': 5}, log.last_write + 1)
+        log.close()
+        log.close()
+        self.failUnlessEqual(len(fileutil.read_file(fname).splitlines()), 5)
+
+        # A new log replaces the old one, unless it appends to it.
+        events.EventLog(fname, append=True).close()
+        self.failUnlessEqual(len(fileutil.read_file(fname).splitlines()), 5)
+        events.EventLog(fname).close()
+        self.failUnlessEqual(fileutil.read_file(fname), '')
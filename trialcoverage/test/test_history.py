@@ -0,0 +1,85 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage.history import History
+
+import os
+
+from coverage.data import CoverageData
+
+def _data(lines, arcs={}):
+    data = CoverageData()
+    data.add_line_data(dict([(f, dict.fromkeys(l)) for (f, l) in lines.items()]))
+    data.add_arc_data(dict([(f, dict.fromkeys(a)) for (f, a) in arcs.items()]))
+    return data
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.dirname = os.path.abspath('history')
+
+    def tearDown(self):
+        fileutil.rm_dir(self.dirname)
+
+    def _objects(self):
+        return sum([len(files) for (dirpath, dirnames, files) in os.walk(os.path.join(self.dirname, 'objects'))])
+
+    def test_queries(self):
+        h = History(self.dirname)
+        self.failUnlessEqual(h.best_run(), None)
+        self.failUnlessEqual(h.last_run(), None)
+        r1 = h.record(_data({'/a.py': [1, 2]}, {'/a.py': [(1, 2)]}), best=True, totals={'uncovered': 3})
+        r2 = h.record(_data({'/a.py': [1]}), best=False, totals={'uncovered': 4})
+
+        h = History(self.dirname)
+        self.failUnlessEqual(h.runs(), [r1, r2])
+        self.failUnlessEqual(h.best_run()['run'], r1)
+        self.failUnlessEqual(h.best_run()['totals'], {'uncovered': 3})
+        self.failUnlessEqual(h.last_run()['run'], r2)
+        self.failUnlessEqual(h.load_data(h.run(r1)), ({'/a.py': [1, 2]}, {'/a.py': [(1, 2)]}))
+        self.failUnlessEqual(h.run(12345), None)
+
+    def test_dedup(self):
+        h = History(self.dirname)
+        h.record(_data({'/a.py': [1, 2], '/b.py': [1]}))
+        self.failUnlessEqual(h.records_written, 2)
+        h.record(_data({'/a.py': [1, 2], '/b.py': [1, 3]}))
+        self.failUnlessEqual(h.records_written, 1)
+        self.failUnlessEqual(self._objects(), 3)
+
+    def test_eviction(self):
+        h = History(self.dirname, keep=2)
+        best = h.record(_data({'/a.py': [1]}), best=True)
+        h.record(_data({'/a.py': [2]}))
+        h.record(_data({'/a.py': [3]}))
+        last = h.record(_data({'/a.py': [4]}))
+        self.failUnlessEqual(h.runs(), [best, last])
+        self.failUnlessEqual(self._objects(), 2)
+        self.failUnlessEqual(h.load_data(h.best_run()), ({'/a.py': [1]}, {}))
+
+    def test_eviction_reads_only_evicted_manifests(self):
+        h = History(self.dirname, keep=3)
+        for i in range(3):
+            h.record(_data({'/a.py': [1], '/b.py': [i]}))
+        read = []
+        realrun = h.run
+        def run(runnum):
+            read.append(runnum)
+            return realrun(runnum)
+        h.run = run
+        h.record(_data({'/a.py': [1], '/b.py': [3]}))
+        self.failUnlessEqual(read, [1])
+        # /a.py's record is still referred to by the kept runs.
+        self.failUnlessEqual(self._objects(), 4)
+        self.failIf(os.path.exists(h.indexfname + '.lock'))
+
+    def test_corrupt_index(self):
+        h = History(self.dirname, keep=2)
+        best = h.record(_data({'/a.py': [1]}), best=True)
+        h.record(_data({'/a.py': [2]}))
+        fileutil.write_file(h.indexfname, '{"runs": [1, 2')
+        h = History(self.dirname, keep=2)
+        last = h.record(_data({'/a.py': [3]}))
+        self.failUnlessEqual(h.runs(), [best, last])
+        self.failUnlessEqual(h.best_run()['run'], best)
+        self.failUnlessEqual(self._objects(), 2)
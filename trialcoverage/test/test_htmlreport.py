@@ -0,0 +1,71 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage import htmlreport
+
+import os
+
+import coverage
+from coverage.codeunit import code_unit_factory
+
+MODCONTENTS = '''\
+def f(x):
+    if x:
+        return 1
+    return 2
+'''
+
+class IncrementalHtmlReporterTest(unittest.TestCase):
+    def setUp(self):
+        self.modfnames = []
+        for i in range(3):
+            fname = os.path.abspath('htmlmod%d.py' % (i,))
+            fileutil.write_file(fname, MODCONTENTS)
+            self.modfnames.append(fname)
+        self.directory = self.mktemp()
+
+    def tearDown(self):
+        for fname in self.modfnames:
+            fileutil.remove_if_possible(fname)
+
+    def _report(self, lines, processes=1):
+        cov = coverage.coverage(data_file=self.mktemp(), branch=True)
+        cov.data.add_line_data(dict([(fname, dict.fromkeys(lines.get(fname, [1]))) for fname in self.modfnames]))
+        cov.data.add_arc_data(dict([(fname, {(-1, 1): None, (1, -1): None}) for fname in self.modfnames]))
+        analyses = [cov._analyze(cu) for cu in code_unit_factory(self.modfnames, cov.file_locator)]
+        hr = htmlreport.IncrementalHtmlReporter(cov, processes=processes)
+        hr.report_analyses(analyses, self.directory)
+        return hr
+
+    def test_only_changed_pages_are_rendered(self):
+        hr = self._report({})
+        self.failUnlessEqual((hr.rendered, hr.reused), (3, 0))
+        for name in ('index.html', 'style.css', 'htmlmod0.html', 'htmlmod2.html'):
+            self.failUnless(os.path.exists(os.path.join(self.directory, name)), name)
+
+        hr = self._report({})
+        self.failUnlessEqual((hr.rendered, hr.reused), (0, 3))
+
+        # Changed coverage data.
+        hr = self._report({self.modfnames[1]: [1, 2, 4]})
+        self.failUnlessEqual((hr.rendered, hr.reused), (1, 2))
+        self.failUnless("htmlmod1" in fileutil.read_file(os.path.join(self.directory, 'index.html')))
+
+        # Changed source.
+        fileutil.write_file(self.modfnames[2], MODCONTENTS + "\ndef g():\n    return 3\n")
+        hr = self._report({self.modfnames[1]: [1, 2, 4]})
+        self.failUnlessEqual((hr.rendered, hr.reused), (1, 2))
+
+        # A missing page is rendered again.
+        os.remove(os.path.join(self.directory, 'htmlmod0.html'))
+        hr = self._report({self.modfnames[1]: [1, 2, 4]})
+        self.failUnlessEqual((hr.rendered, hr.reused), (1, 2))
+
+    def test_parallel_rendering(self):
+        hr = self._report({}, processes=2)
+        self.failUnlessEqual((hr.rendered, hr.reused), (3, 0))
+        serial = fileutil.read_file(os.path.join(self.directory, 'htmlmod1.html'))
+        os.remove(os.path.join(self.directory, 'htmlmod1.html'))
+        hr = self._report({}, processes=1)
+        self.failUnlessEqual(fileutil.read_file(os.path.join(self.directory, 'htmlmod1.html')), serial)
@@ -0,0 +1,58 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage import trialcoverage
+
+import os
+
+import coverage
+from coverage.data import CoverageData
+
+def _write_data(fname, lines, arcs):
+    data = CoverageData(basename=fname)
+    data.add_line_data(dict([(f, dict.fromkeys(l)) for (f, l) in lines.items()]))
+    data.add_arc_data(dict([(f, dict.fromkeys(a)) for (f, a) in arcs.items()]))
+    data.write()
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        trialcoverage.init_paths()
+        fileutil.remove_if_possible(trialcoverage.COVERAGE_FNAME)
+        self.shards = [
+            ({'/a.py': [1, 2, 3], '/b.py': [1]}, {'/a.py': [(1, 2), (2, 3)]}),
+            ({'/a.py': [1, 4]}, {'/a.py': [(1, 4)]}),
+            ({'/c.py': [7]}, {}),
+            ]
+        for i, (lines, arcs) in enumerate(self.shards):
+            _write_data(trialcoverage.PARALLEL_DATA_FNAME + '.host.%d.000000' % (i,), lines, arcs)
+
+    def tearDown(self):
+        for fname in trialcoverage.list_parallel_data_files():
+            fileutil.remove_if_possible(fname)
+        fileutil.remove_if_possible(trialcoverage.COVERAGE_FNAME)
+
+    def _sorted(self, (lines, arcs)):
+        return (dict([(f, sorted(l)) for (f, l) in lines.items()]),
+                dict([(f, sorted(a)) for (f, a) in arcs.items()]))
+
+    def test_parallel_merge_matches_serial(self):
+        fnames = trialcoverage.list_parallel_data_files()
+        self.failUnlessEqual(len(fnames), 3)
+        serial = self._sorted(trialcoverage.read_and_merge_data_files(fnames))
+        parallel = self._sorted(trialcoverage.parallel_read_and_merge_data_files(fnames, processes=2))
+        self.failUnlessEqual(serial, parallel)
+        self.failUnlessEqual(serial[0], {'/a.py': [1, 2, 3, 4], '/b.py': [1], '/c.py': [7]})
+        self.failUnlessEqual(serial[1], {'/a.py': [(1, 2), (1, 4), (2, 3)]})
+
+    def test_combine(self):
+        _write_data(trialcoverage.COVERAGE_FNAME, {'/d.py': [5]}, {})
+        cov = coverage.coverage(data_file=trialcoverage.COVERAGE_FNAME)
+        self.failUnlessEqual(trialcoverage.combine_parallel_data(cov, processes=2), 3)
+        self.failIf(trialcoverage.list_parallel_data_files())
+        self.failIf(os.path.exists(trialcoverage.COVERAGE_FNAME + '.lock'))
+
+        combined = CoverageData(basename=trialcoverage.COVERAGE_FNAME)
+        combined.read()
+        self.failUnlessEqual(combined.line_data(), {'/a.py': [1, 2, 3, 4], '/b.py': [1], '/c.py': [7], '/d.py': [5]})
+        self.failUnlessEqual(cov.data.line_data(), combined.line_data())
@@ -0,0 +1,56 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage import profiles
+
+SETUPCFG = '''\
+[egg_info]
+tag_build =
+
+[trialcoverage:fast]
+branch = false
+include = a/*, b/*
+save_every = 100
+
+[trialcoverage:nightly]
+omit =
+    a/test/*
+    b/test/*
+'''
+
+class ProfilesTest(unittest.TestCase):
+    def _read(self, *contents):
+        fnames = []
+        for c in contents:
+            fname = self.mktemp()
+            fileutil.write_file(fname, c)
+            fnames.append(fname)
+        return profiles.read_profiles(fnames)
+
+    def test_read(self):
+        ps = self._read(SETUPCFG)
+        self.failUnlessEqual(sorted(ps), ['default', 'fast', 'nightly'])
+        self.failUnlessEqual((ps['fast'].branch, ps['fast'].include, ps['fast'].save_every), (False, ['a/*', 'b/*'], 100))
+        self.failUnlessEqual((ps['nightly'].branch, ps['nightly'].include, ps['nightly'].omit), (True, None, ['a/test/*', 'b/test/*']))
+        self.failUnlessEqual(ps['default'].reporter_name(), 'bwverbose-coverage')
+        self.failUnlessEqual(ps['fast'].reporter_name(), 'bwverbose-coverage-fast')
+
+    def test_rc_takes_precedence(self):
+        ps = self._read(SETUPCFG, '[trialcoverage:fast]\nbranch = true\n')
+        self.failUnlessEqual((ps['fast'].branch, ps['fast'].save_every), (True, 100))
+
+    def test_errors(self):
+        self.failUnlessRaises(profiles.ProfileError, self._read, '[trialcoverage:x]\nbranches = false\n')
+        self.failUnlessRaises(profiles.ProfileError, self._read, '[trialcoverage:x]\nbranch = maybe\n')
+        self.failUnlessRaises(profiles.ProfileError, self._read, '[trialcoverage:x]\nimport_all = everything\n')
+        self.failUnlessEqual(self._read('[trialcoverage:x]\nimport_all = static\n')['x'].import_all, 'static')
+        self.failUnlessRaises(profiles.ProfileError, profiles.select_profile, self._read(SETUPCFG), ['--reporter=bwverbose-coverage-slow'], {})
+
+    def test_select(self):
+        ps = self._read(SETUPCFG)
+        self.failUnlessEqual(profiles.select_profile(ps, ['trial', 'pkg'], {}).name, 'default')
+        self.failUnlessEqual(profiles.select_profile(ps, ['trial', '--reporter=bwverbose-coverage', 'pkg'], {}).name, 'default')
+        self.failUnlessEqual(profiles.select_profile(ps, ['trial', '--reporter', 'bwverbose-coverage-fast', 'pkg'], {}).name, 'fast')
+        self.failUnlessEqual(profiles.select_profile(ps, ['trial', '--reporter=bwverbose', 'pkg'], {}).name, 'default')
+        self.failUnlessEqual(profiles.select_profile(ps, ['trial', '--reporter=bwverbose-coverage-fast'], {'TRIALCOVERAGE_PROFILE': 'nightly'}).name, 'nightly')
@@ -0,0 +1,61 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage.profiling import TestProfiler
+from trialcoverage.timing import TestTimings
+
+import imp, os, pstats
+
+import coverage
+
+from mock import Mock
+
+MODCONTENTS = '''\
+def f(x):
+    if x:
+        return 1
+    return 2
+'''
+
+class TestProfilerTest(unittest.TestCase):
+    def test_wants(self):
+        p = TestProfiler(['*.test_web.*'], ['a.T.test_slow'])
+        self.failUnless(p.wants('pkg.test.test_web.T.test_x'))
+        self.failUnless(p.wants('a.T.test_slow'))
+        self.failIf(p.wants('a.T.test_fast'))
+
+    def test_profile_and_coverage(self):
+        modfname = os.path.abspath('profmod.py')
+        fileutil.write_file(modfname, MODCONTENTS)
+        self.addCleanup(fileutil.remove_if_possible, modfname)
+        self.addCleanup(fileutil.remove_if_possible, modfname + 'c')
+        cov = coverage.coverage(data_file=self.mktemp(), branch=True, include=[modfname])
+        p = TestProfiler()
+        for (testid, x) in [('t1', 1), ('t2', 0)]:
+            cov.start()
+            p.start(testid)
+            mod = imp.load_source('profmod', modfname)
+            mod.f(x)
+            p.stop()
+            cov.stop()
+        p.stop() # not profiling, so does nothing
+
+        # Coverage saw everything despite cProfile running at the same time.
+        self.failUnless(set([1, 2, 3, 4]).issubset(cov.data.executed_lines(modfname)))
+
+        dirname, fname = self.mktemp(), self.mktemp()
+        p.save(dirname, fname)
+        self.failUnlessEqual(sorted(os.listdir(dirname)), ['t1.prof', 't2.prof'])
+        calls = [nc for ((f, l, name), (cc, nc, tt, ct, callers)) in pstats.Stats(fname).stats.iteritems() if f == modfname and name == 'f']
+        self.failUnlessEqual(calls, [2])
+
+        out = Mock()
+        p.report(out, 5)
+        self.failUnless('cProfile of 2 tests' in out.write.call_args_list[0][0][0])
+
+    def test_slowest_from_timings(self):
+        fname = self.mktemp()
+        fileutil.write_file(fname, '{"tests": [{"id": "a", "wall": 1.0, "start": 0, "stop": 0, "save": 0, "lines": 0, "arcs": 0}, {"id": "b", "wall": 2.0, "start": 0, "stop": 0, "save": 0, "lines": 0, "arcs": 0}]}')
+        self.failUnlessEqual([t.testid for t in TestTimings.load(fname).slowest(1)], ['b'])
+        self.failUnlessEqual(TestTimings.load(self.mktemp()).timings, [])
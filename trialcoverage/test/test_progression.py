@@ -0,0 +1,105 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage import trialcoverage
+
+import os, sys
+
+import coverage
+
+from mock import Mock
+
+MODCONTENTS = '''\
+def f(x):
+    if x:
+        return 1
+    return 2
+
+def g():
+    return 3
+'''
+
+class ProgressionTest(unittest.TestCase):
+    def setUp(self):
+        self.patch(trialcoverage, 'WRITE_SUMMARY', False)
+        trialcoverage.init_paths()
+        fileutil.remove_if_possible(trialcoverage.BEST_TOTALS_FNAME)
+        fileutil.remove_if_possible(trialcoverage.BEST_SUMMARY_FNAME)
+        fileutil.remove_if_possible(trialcoverage.SUMMARY_FNAME)
+        fileutil.remove_if_possible(trialcoverage.BEST_FILES_FNAME)
+        self.modfname = os.path.abspath('progmod.py')
+        fileutil.write_file(self.modfname, MODCONTENTS)
+        fileutil.write_file(trialcoverage.COVERAGE_FNAME, '')
+        self.realstdout = sys.stdout
+        sys.stdout = Mock()
+
+    def tearDown(self):
+        sys.stdout = self.realstdout
+        fileutil.remove_if_possible(self.modfname)
+        fileutil.remove_if_possible(os.path.abspath('progmod2.py'))
+
+    def _report(self, lines, arcs):
+        cov = coverage.coverage(data_file=trialcoverage.COVERAGE_FNAME, branch=True)
+        cov.data.add_line_data({self.modfname: dict.fromkeys(lines)})
+        cov.data.add_arc_data({self.modfname: dict.fromkeys(arcs)})
+        pr = trialcoverage.ProgressionReporter(cov)
+        return pr, pr.report(None)
+
+    def test_totals_from_analysis(self):
+        # f(1) was called: line 4 is uncovered, and the branch on line 2
+        # was only taken one way. g() was never called.
+        pr, progression = self._report([1, 2, 3, 6], [(-1, 1), (1, 6), (6, -1), (-1, 2), (2, 3), (3, -1)])
+        self.failUnlessEqual(progression, 1)
+        self.failUnlessEqual((pr.curunc, pr.curpart), (2, 1))
+        self.failIf(os.path.exists(trialcoverage.SUMMARY_FNAME))
+
+        pr, progression = self._report([1, 2, 3, 6], [(-1, 1), (1, 6), (6, -1), (-1, 2), (2, 3), (3, -1)])
+        self.failUnlessEqual(progression, 2)
+        self.failUnlessEqual((pr.bestunc, pr.bestpart), (2, 1))
+
+        pr, progression = self._report([1, 2, 6], [(-1, 1), (1, 6), (6, -1), (-1, 2), (2, 4), (4, -1)])
+        self.failUnlessEqual(progression, 0)
+
+    def test_legacy_summary_baseline(self):
+        fileutil.write_file(trialcoverage.BEST_SUMMARY_FNAME, '''\
+Name    Stmts   Miss Branch BrPart  Cover
+-----------------------------------------
+a           5      0      2      0   100%
+b           5      1      2      0    85%
+-----------------------------------------
+TOTAL      10      1      4      0    92%
+''')
+        pr, progression = self._report([1, 2, 3, 6], [(-1, 1), (1, 6), (6, -1), (-1, 2), (2, 3), (3, -1)])
+        self.failUnlessEqual((pr.bestunc, pr.bestpart), (1, 0))
+        self.failUnlessEqual(progression, 0)
+
+    def test_per_file_regression(self):
+        mod2fname = os.path.abspath('progmod2.py')
+        fileutil.write_file(mod2fname, MODCONTENTS)
+        def report(lines1, lines2):
+            cov = coverage.coverage(data_file=trialcoverage.COVERAGE_FNAME)
+            cov.data.add_line_data({self.modfname: dict.fromkeys(lines1), mod2fname: dict.fromkeys(lines2)})
+            pr = trialcoverage.ProgressionReporter(cov)
+            return pr, pr.report(None)
+
+        pr, progression = report([1, 2, 3, 6, 7], [1, 6])
+        self.failUnlessEqual(progression, 1)
+        self.failUnlessEqual(pr.file_regressions, [])
+        self.failUnless(os.path.exists(trialcoverage.BEST_FILES_FNAME))
+
+        # progmod2 gains four lines while progmod loses two, so the
+        # totals improve but progmod is listed as regressed.
+        pr, progression = report([1, 2, 6], [1, 2, 3, 4, 6, 7])
+        self.failUnlessEqual(progression, 3)
+        self.failUnlessEqual([r.filename for r in pr.file_regressions], [self.modfname])
+        r = pr.file_regressions[0]
+        self.failUnlessEqual((r.bestunc, r.curunc), (1, 3))
+        self.failUnlessEqual(r.missing, [3, 7])
+        self.failUnlessEqual(r.missing_formatted, "3, 7")
+        self.failUnless(os.path.exists(trialcoverage.FILE_REGRESSIONS_FNAME))
+
+        # The baseline was updated by the improved run.
+        pr, progression = report([1, 2, 6], [1, 2, 3, 4, 6, 7])
+        self.failUnlessEqual(progression, 2)
+        self.failUnlessEqual(pr.file_regressions, [])
@@ -0,0 +1,83 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+import math, os, sys
+
+from mock import Mock
+
+from trialcoverage.sampling import SampleEstimate, choose_slot, compare_estimates, estimate_total, file_slot, package_path
+
+class SlotTest(unittest.TestCase):
+    def test_package_path(self):
+        for checkout in ('a', os.path.join('b', 'c')):
+            fileutil.make_dirs(os.path.join(checkout, 'pkg', 'sub'))
+            fileutil.write_file(os.path.join(checkout, 'pkg', '__init__.py'), '')
+            fileutil.write_file(os.path.join(checkout, 'pkg', 'sub', '__init__.py'), '')
+            fname = os.path.join(checkout, 'pkg', 'sub', 'mod.py')
+            self.failUnlessEqual(package_path(fname), 'pkg/sub/mod.py')
+            self.failUnlessEqual(package_path(os.path.abspath(fname)), 'pkg/sub/mod.py')
+            self.failUnlessEqual(package_path(os.path.join(checkout, 'setup.py')), 'setup.py')
+        # So a file is in the same slot in any checkout, and from any
+        # current directory.
+        self.failUnlessEqual(file_slot(os.path.join('a', 'pkg', 'sub', 'mod.py'), 7), file_slot(os.path.join('b', 'c', 'pkg', 'sub', 'mod.py'), 7))
+        olddir = os.getcwd()
+        os.chdir('b')
+        try:
+            self.failUnlessEqual(package_path(os.path.join('c', 'pkg', 'sub', 'mod.py')), 'pkg/sub/mod.py')
+        finally:
+            os.chdir(olddir)
+
+    def test_file_slot(self):
+        fname = os.path.join('pkg', 'mod.py')
+        self.failUnlessEqual(file_slot(fname, 7), file_slot(os.path.abspath(fname), 7))
+        self.failUnless(0 <= file_slot(fname, 7) < 7)
+        slots = set([file_slot(os.path.join('pkg', 'mod%d.py' % i), 4) for i in range(100)])
+        self.failUnlessEqual(slots, set(range(4)))
+
+    def test_choose_slot(self):
+        first = choose_slot('state.json', 'v1', 5)
+        # The same version measures the same slot again.
+        self.failUnlessEqual(choose_slot('state.json', 'v1', 5), first)
+        # Each new version measures the next slot, so that five of them
+        # measure every slot.
+        seen = [first]
+        for v in ['v2', 'v3', 'v4', 'v5']:
+            seen.append(choose_slot('state.json', v, 5))
+        self.failUnlessEqual(seen, [(first + i) % 5 for i in range(5)])
+        # Without a version stamp every run moves on.
+        self.failUnlessEqual(choose_slot('state.json', None, 5), (first + 5) % 5)
+        self.failUnlessEqual(choose_slot('state.json', None, 5), (first + 6) % 5)
+
+    def test_corrupt_state(self):
+        fileutil.write_file('state.json', '{"slot": ')
+        self.patch(sys, 'stderr', Mock())
+        self.failUnless(0 <= choose_slot('state.json', 'v1', 3) < 3)
+        self.failUnlessEqual(len(sys.stderr.method_calls), 1)
+
+class EstimateTest(unittest.TestCase):
+    def test_estimate_total(self):
+        self.failUnlessEqual(estimate_total([], 10), (0.0, 0.0))
+        # The whole population has no sampling error.
+        self.failUnlessEqual(estimate_total([1, 2, 3], 3), (6.0, 0.0))
+        (est, se) = estimate_total([1, 3], 4)
+        self.failUnlessEqual(est, 8.0)
+        # variance 2, finite population correction 1/2, n 2
+        self.failUnlessAlmostEqual(se, 4 * math.sqrt(0.5 * 2 / 2))
+        self.failUnlessEqual(estimate_total([5], 10), (50.0, 50.0))
+
+    def test_compare(self):
+        best = SampleEstimate(100.0, 10.0, 150.0, 10.0, 10, 40)
+        self.failUnlessEqual(compare_estimates(best, None), 1)
+        self.failUnlessEqual(compare_estimates(SampleEstimate(110.0, 10.0, 160.0, 10.0, 10, 40), best), 2)
+        self.failUnlessEqual(compare_estimates(SampleEstimate(140.0, 10.0, 190.0, 10.0, 10, 40), best), 0)
+        self.failUnlessEqual(compare_estimates(SampleEstimate(100.0, 10.0, 190.0, 10.0, 10, 40), best), 0)
+        self.failUnlessEqual(compare_estimates(SampleEstimate(60.0, 10.0, 110.0, 10.0, 10, 40), best), 3)
+
+    def test_save_and_load(self):
+        e = SampleEstimate(100.0, 10.0, 150.0, 12.5, 10, 40)
+        e.save('sample.json')
+        loaded = SampleEstimate.load('sample.json')
+        self.failUnlessEqual(loaded.to_dict(), e.to_dict())
+        self.failUnlessEqual(SampleEstimate.load('nonexistent.json'), None)
+        self.failUnless('an estimated 150 total lines untested (95% confidence: 126 to 174)' in e.describe(), e.describe())
@@ -0,0 +1,56 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage.saturation import SaturationTracker
+
+import imp, os
+
+import coverage
+
+MODCONTENTS = '''\
+def f(x):
+    if x:
+        return 1
+    return 2
+'''
+
+class SaturationTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.modfname = os.path.abspath('satmod.py')
+        fileutil.write_file(self.modfname, MODCONTENTS)
+        self.cov = coverage.coverage(data_file=self.mktemp(), branch=True, include=[self.modfname])
+        self.tracker = SaturationTracker(self.cov)
+        self.cov.start()
+        self.mod = imp.load_source('satmod', self.modfname)
+        self.cov.stop()
+
+    def tearDown(self):
+        fileutil.remove_if_possible(self.modfname)
+        fileutil.remove_if_possible(self.modfname + 'c')
+
+    def _trace(self, *args):
+        """ Calls f with each of args while tracing, and returns the line
+        data that was collected. """
+        self.cov.start()
+        for x in args:
+            self.mod.f(x)
+        self.cov.collector.stop()
+        line_data = self.cov.collector.get_line_data()
+        self.cov._harvest_data()
+        self.tracker.executed(line_data)
+        return line_data
+
+    def test_saturated_file_is_no_longer_traced(self):
+        self.failUnless(self._trace(1))
+        self.failUnlessEqual(self.tracker.check(), [])
+
+        self.failUnless(self._trace(0))
+        self.failUnlessEqual(self.tracker.check(), [self.modfname])
+
+        self.failUnlessEqual(self._trace(0, 1), {})
+        self.failUnlessEqual(self.tracker.check(), [])
+        self.failUnlessEqual(self.tracker.saturated, set([self.modfname]))
+
+        # The data collected before the file was saturated is kept.
+        self.failUnless(set([1, 2, 3, 4]).issubset(self.cov.data.executed_lines(self.modfname)))
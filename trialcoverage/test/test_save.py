@@ -0,0 +1,47 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+from trialcoverage import trialcoverage
+
+import os
+
+import coverage
+
+class SavePolicyTest(unittest.TestCase):
+    def test_default_saves_after_every_test(self):
+        sp = trialcoverage.SavePolicy()
+        self.failIf(sp.is_buffered())
+        self.failUnless(sp.test_finished(0))
+        sp.saved(0)
+        self.failUnless(sp.test_finished(0))
+
+    def test_save_every(self):
+        sp = trialcoverage.SavePolicy(save_every=3)
+        self.failUnless(sp.is_buffered())
+        now = sp.last_save
+        self.failIf(sp.test_finished(now))
+        self.failIf(sp.test_finished(now))
+        self.failUnless(sp.test_finished(now))
+        sp.saved(now)
+        self.failIf(sp.test_finished(now))
+
+    def test_save_interval(self):
+        sp = trialcoverage.SavePolicy(save_interval=10)
+        self.failUnless(sp.is_buffered())
+        sp.saved(100)
+        self.failIf(sp.test_finished(105))
+        self.failUnless(sp.test_finished(110))
+
+class SaveAtomicallyTest(unittest.TestCase):
+    def test_save_atomically(self):
+        fname = os.path.abspath('atomic.coverage')
+        cov = coverage.coverage(data_file=fname)
+        cov.data.add_line_data({'/x/y.py': {1: None, 2: None}})
+        trialcoverage.save_atomically(cov)
+        self.failIf(os.path.exists(fname + '~'))
+
+        cov2 = coverage.coverage(data_file=fname)
+        cov2.load()
+        self.failUnlessEqual(cov2.data.line_data(), {'/x/y.py': [1, 2]})
+        fileutil.remove(fname)
@@ -0,0 +1,67 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+import os, sys
+
+try:
+    from setuptools_darcs import setuptools_darcs
+except ImportError:
+    # The copy that setup.py fetched into this tree.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'setuptools_darcs-1.2.11.egg'))
+    from setuptools_darcs import setuptools_darcs
+
+class ManifestCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.repo = os.path.abspath(self.mktemp())
+        fileutil.make_dirs(os.path.join(self.repo, '_darcs', 'patches'))
+        fileutil.write_file(os.path.join(self.repo, '_darcs', 'hashed_inventory'), 'one patch')
+        self.manifest = '.\n./setup.py\n./pkg/__init__.py\n./pkg/mod.py\n'
+        self.queries = 0
+        self.indexed = 0
+        def query_manifest():
+            self.queries += 1
+            return (0, self.manifest)
+        def whatsnew_dot():
+            return (1, "No changes!\n")
+        real_index_manifest = setuptools_darcs.index_manifest
+        def index_manifest(queryoutput):
+            self.indexed += 1
+            return real_index_manifest(queryoutput)
+        self.patch(setuptools_darcs, 'run_darcs_query_manifest', query_manifest)
+        self.patch(setuptools_darcs, 'run_darcs_whatsnew_dot', whatsnew_dot)
+        self.patch(setuptools_darcs, 'index_manifest', index_manifest)
+        self.patch(setuptools_darcs, '_manifest_cache', {})
+        self.olddir = os.getcwd()
+        os.chdir(self.repo)
+
+    def tearDown(self):
+        os.chdir(self.olddir)
+
+    def _find(self, dirname):
+        # As before the cache, the top directory also lists '', from the
+        # newline which ends darcs's output.
+        return sorted([fn for fn in setuptools_darcs.find_files_for_darcs(dirname) if fn])
+
+    def test_fresh(self):
+        self.failUnlessEqual(self._find(''), ['pkg' + os.sep + '__init__.py', 'pkg' + os.sep + 'mod.py', 'setup.py'])
+        self.failUnlessEqual(self._find('pkg'), ['__init__.py', 'mod.py'])
+        self.failUnlessEqual(self._find('pkg'), ['__init__.py', 'mod.py'])
+        # darcs ran, and its output was indexed, only once.
+        self.failUnlessEqual((self.queries, self.indexed), (1, 1))
+
+    def test_stale(self):
+        self.failUnlessEqual(self._find('pkg'), ['__init__.py', 'mod.py'])
+        # Recording a patch changes the inventory, so the manifest is read
+        # again.
+        self.manifest += './pkg/new.py\n'
+        fileutil.write_file(os.path.join(self.repo, '_darcs', 'hashed_inventory'), 'two patches')
+        self.failUnlessEqual(self._find('pkg'), ['__init__.py', 'mod.py', 'new.py'])
+        self.failUnlessEqual((self.queries, self.indexed), (2, 2))
+        # So does adding a file, which only changes the pending patch.
+        self.manifest += './pkg/added.py\n'
+        fileutil.write_file(os.path.join(self.repo, '_darcs', 'patches', 'pending'), 'addfile ./pkg/added.py')
+        self.failUnlessEqual(self._find('pkg'), ['__init__.py', 'added.py', 'mod.py', 'new.py'])
+        self.failUnlessEqual((self.queries, self.indexed), (3, 3))
+        self.failUnlessEqual(self._find(''), ['pkg' + os.sep + f for f in ['__init__.py', 'added.py', 'mod.py', 'new.py']] + ['setup.py'])
+        self.failUnlessEqual((self.queries, self.indexed), (3, 3))
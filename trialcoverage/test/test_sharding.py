@@ -0,0 +1,91 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+import os, sys
+
+from mock import Mock
+
+from trialcoverage.sharding import DEFAULT_SECONDS, estimate, main, plan_shards
+from trialcoverage.timing import TestTiming, TestTimings
+
+TESTCONTENTS = '''\
+from twisted.trial import unittest
+class T(unittest.TestCase):
+    def test_a(self):
+        pass
+    def test_b(self):
+        pass
+    def test_c(self):
+        pass
+'''
+
+class EstimateTest(unittest.TestCase):
+    def test_estimate(self):
+        self.failUnlessEqual(estimate(['p.test.test_m.T.test_a'], {}), [('p.test.test_m.T.test_a', DEFAULT_SECONDS, True)])
+        d = {'p.test.test_m.T.test_a': 1.0, 'p.test.test_m.U.test_b': 3.0, 'p.test.test_n.T.test_c': 8.0}
+        self.failUnlessEqual(estimate(['p.test.test_m.T.test_a', 'p.test.test_m.T.test_new', 'p.test.test_o.T.test_new'], d),
+                             [('p.test.test_m.T.test_a', 1.0, False), # recorded
+                              ('p.test.test_m.T.test_new', 2.0, True), # the mean of its module
+                              ('p.test.test_o.T.test_new', 4.0, True)]) # the mean of the suite
+
+class PlanTest(unittest.TestCase):
+    def _totals(self, shards, tests):
+        seconds = dict(tests)
+        return [sum([seconds[t] for t in shard]) for shard in shards]
+
+    def test_balance(self):
+        tests = [('a', 5.0), ('b', 4.0), ('c', 3.0), ('d', 3.0), ('e', 2.0), ('f', 1.0)]
+        shards = plan_shards(tests, 2)
+        self.failUnlessEqual(sorted(sum(shards, [])), ['a', 'b', 'c', 'd', 'e', 'f'])
+        self.failUnlessEqual(sorted(self._totals(shards, tests)), [9.0, 9.0])
+        self.failUnlessEqual(plan_shards(tests, 2), shards)
+        self.failUnlessEqual(plan_shards([], 3), [[], [], []])
+        self.failUnlessEqual(plan_shards([('a', 1.0)], 3), [['a'], [], []])
+
+    def test_coverage(self):
+        # Plain balancing puts both tests of x.py on one shard.
+        tests = [('x1', 2.0), ('y1', 2.0), ('x2', 1.9), ('y2', 1.9)]
+        files = {'x1': set(['x.py']), 'x2': set(['x.py']), 'y1': set(['y.py']), 'y2': set(['y.py'])}
+        self.failUnlessEqual(plan_shards(tests, 2), [['x1', 'x2'], ['y1', 'y2']])
+        self.failUnlessEqual(plan_shards(tests, 2, files), [['x1', 'y2'], ['y1', 'x2']])
+
+    def test_slack(self):
+        tests = [('y', 3.0), ('x1', 2.0), ('x2', 1.0)]
+        files = {'x1': set(['x.py']), 'x2': set(['x.py']), 'y': set(['y.py'])}
+        self.failUnlessEqual(plan_shards(tests, 2, files, slack=0.5), [['y', 'x2'], ['x1']])
+        # Unless that would unbalance the shards by more than the slack.
+        self.failUnlessEqual(plan_shards(tests, 2, files, slack=0.1), [['y'], ['x1', 'x2']])
+
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        fileutil.make_dirs(os.path.join('fakepackage18', 'test'))
+        fileutil.write_file(os.path.join('fakepackage18', '__init__.py'), '')
+        fileutil.write_file(os.path.join('fakepackage18', 'test', '__init__.py'), '')
+        fileutil.write_file(os.path.join('fakepackage18', 'test', 'test_mod.py'), TESTCONTENTS)
+        sys.path.append(os.getcwd())
+        self.realstdout = sys.stdout
+        sys.stdout = Mock()
+
+    def tearDown(self):
+        sys.stdout = self.realstdout
+        sys.path.remove(os.getcwd())
+        fileutil.rm_dir('fakepackage18')
+
+    def _printed(self):
+        return ''.join([args[0] for (name, args, kwargs) in sys.stdout.method_calls])
+
+    def test_shard(self):
+        timings = TestTimings()
+        for (name, seconds) in [('test_a', 3.0), ('test_b', 1.0)]:
+            t = TestTiming('fakepackage18.test.test_mod.T.' + name)
+            t.wall = seconds
+            timings.add(t)
+        timings.save('timings.json')
+        # test_c is estimated at 2.0, the mean of its module.
+        self.patch(sys, 'stderr', Mock())
+        self.failUnlessEqual(main(['--shards', '2', '--durations', 'timings.json', '--shard', '1', 'fakepackage18']), 0)
+        self.failUnlessEqual(self._printed(), 'fakepackage18.test.test_mod.T.test_c\nfakepackage18.test.test_mod.T.test_b\n')
+        sys.stdout = Mock()
+        main(['--shards', '2', '--durations', 'timings.json', 'fakepackage18'])
+        self.failUnless(self._printed().startswith('# shard 0: 1 tests, about 3.0s\nfakepackage18.test.test_mod.T.test_a\n# shard 1: 2 tests'), self._printed())
@@ -0,0 +1,51 @@
+from twisted.trial import unittest
+
+from trialcoverage import testimpact
+
+import os
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+class TestImpactTest(unittest.TestCase):
+    def test_compress_lines(self):
+        self.failUnlessEqual(testimpact.compress_lines([10, 1, 2, 3, 7, 9]), [[1, 3], 7, [9, 10]])
+        self.failUnlessEqual(testimpact.expand_lines([[1, 3], 7, [9, 10]]), [1, 2, 3, 7, 9, 10])
+        self.failUnlessEqual(testimpact.compress_lines([]), [])
+
+    def _index(self):
+        index = testimpact.TestImpactIndex()
+        index.record('p.test.T.test_a', {'/p/a.py': {1: None, 2: None, 3: None}, '/p/test.py': {5: None}})
+        index.record('p.test.T.test_b', {'/p/b.py': {1: None}, '/p/test.py': {8: None}})
+        index.record('p.test.T.test_c', {'/p/a.py': {10: None}, '/p/empty.py': {}})
+        return index
+
+    def test_select(self):
+        index = self._index()
+        self.failUnlessEqual(index.select({'/p/a.py': None}), ['p.test.T.test_a', 'p.test.T.test_c'])
+        self.failUnlessEqual(index.select({'/p/a.py': set([10, 11])}), ['p.test.T.test_c'])
+        self.failUnlessEqual(index.select({'/p/b.py': None, '/p/test.py': set([5])}), ['p.test.T.test_a', 'p.test.T.test_b'])
+        self.failUnlessEqual(index.select({'/p/new.py': None}), [])
+        self.failUnlessEqual(index.select({'/p/empty.py': None}), [])
+
+    def test_json_roundtrip(self):
+        index = self._index()
+        index2 = testimpact.TestImpactIndex.from_json(index.to_json())
+        self.failUnlessEqual(json.loads(index2.to_json()), json.loads(index.to_json()))
+        self.failUnlessEqual(index2.test_files(), {'p.test.T.test_a': set(['/p/a.py', '/p/test.py']),
+                                                   'p.test.T.test_b': set(['/p/b.py', '/p/test.py']),
+                                                   'p.test.T.test_c': set(['/p/a.py'])})
+        self.failUnlessEqual(index2.select({'/p/a.py': set([10])}), ['p.test.T.test_c'])
+
+    def test_load_missing(self):
+        index = testimpact.TestImpactIndex.load('nonexistent-test-impact.json')
+        self.failUnlessEqual(index.test_files(), {})
+
+    def test_parse_changed(self):
+        a = testimpact.canonical_filename('a.py')
+        b = testimpact.canonical_filename('b.py')
+        self.failUnlessEqual(testimpact.parse_changed(['a.py:3', 'a.py:5-6', 'b.py', 'b.py:1']),
+                             {a: set([3, 5, 6]), b: None})
@@ -0,0 +1,45 @@
+from twisted.trial import unittest, runner
+
+from trialcoverage import testorder
+from trialcoverage.coveragestore import make_bitmap
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+class Sample(unittest.TestCase):
+    def test_a(self):
+        pass
+    def test_b(self):
+        pass
+    def test_c(self):
+        pass
+
+class TestOrderTest(unittest.TestCase):
+    def test_greedy_order(self):
+        tests = [('small', 1.0, {'a.py': make_bitmap([1, 2])}),
+                 ('big', 1.0, {'a.py': make_bitmap([1, 2, 3]), 'b.py': make_bitmap([4, 5])}),
+                 ('rest', 1.0, {'b.py': make_bitmap([5, 6])}),
+                 ('redundant', 1.0, {'a.py': make_bitmap([3])}),
+                 ]
+        order = testorder.greedy_order(tests)
+        self.failUnlessEqual(order, [('big', 5, 1.0), ('rest', 1, 1.0), ('redundant', 0, 1.0), ('small', 0, 1.0)])
+
+    def test_fast_tests_first(self):
+        tests = [('slow', 10.0, {'a.py': make_bitmap(range(10))}), ('fast', 0.5, {'a.py': make_bitmap(range(10, 13))})]
+        self.failUnlessEqual([t[0] for t in testorder.greedy_order(tests)], ['fast', 'slow'])
+
+    def test_recorder(self):
+        r = testorder.TestOrderRecorder()
+        r.record('t1', 0.5, {'a.py': {1: None, 2: None}}, {'a.py': {(1, 2): None}})
+        r.record('t2', 0.5, {'a.py': {1: None}, 'b.py': {1: None}}, {})
+        d = json.loads(r.to_json())
+        self.failUnlessEqual(d['tests'], [{'id': 't1', 'gain': 3, 'seconds': 0.5}, {'id': 't2', 'gain': 1, 'seconds': 0.5}])
+
+    def test_order_suite(self):
+        suite = runner.TestLoader().loadClass(Sample)
+        prefix = Sample('test_a').id()[:-len('test_a')]
+        ordered = testorder.order_suite(suite, [prefix + 'test_c', prefix + 'test_a'])
+        self.failUnlessEqual([t.id()[len(prefix):] for t in ordered._tests], ['test_b', 'test_c', 'test_a'])
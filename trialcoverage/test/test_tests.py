@@ -6,18 +6,35 @@ from twisted.scripts import trial
 
 import os, sys
 
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+import coverage
+
 from mock import Mock
 
-from trialcoverage import trialcoverage
+from trialcoverage import check, trialcoverage
+from trialcoverage.profiles import Profile, ProfileError
+from trialcoverage.testimpact import TestImpactIndex
+from trialcoverage.timing import TestTiming, TestTimings
 
 class T(unittest.TestCase):
     def setUp(self):
-        trialcoverage.cov.stop()
+        # The coverage started at import time is still running unless an
+        # earlier test already stopped it.
+        if trialcoverage.cov is not None and trialcoverage.cov.collector in trialcoverage.cov.collector._collectors:
+            trialcoverage.cov.stop()
         fileutil.remove_if_possible(trialcoverage.COVERAGE_FNAME)
 
-    def test_basic_test(self):
-        pkgname='fakepackage4'
-        modname='fakemodule4'
+    def _run_fake_package(self, pkgname, modname, extramodules={}):
+        """ I write out a small package with one module and one test for
+        it, run trial on it with the coverage reporter, and return the
+        result. extramodules maps the names of further modules to put in
+        the package to their contents. What the run wrote to stdout is
+        left in self.stdout. """
         modcontents='\n\
 def foofunc():\n\
     x=1\n\
@@ -34,7 +51,9 @@ class T(unittest.TestCase):\n\
         mockstdout = Mock()
         realstdout=sys.stdout
         sys.stdout = mockstdout
+        self.stdout = mockstdout
         mockstderr = Mock()
+        self.stderr = mockstderr
         realstderr=sys.stderr
         sys.stderr = mockstderr
         something = None
@@ -45,6 +64,8 @@ class T(unittest.TestCase):\n\
             fileutil.make_dirs(os.path.join(pkgname, 'test'))
             fileutil.write_file(os.path.join(pkgname, 'test', '__init__.py'), '')
             fileutil.write_file(os.path.join(pkgname, 'test', 'test_'+modname+'.py'), testcontents)
+            for (extramodname, extramodcontents) in extramodules.items():
+                fileutil.write_file(os.path.join(pkgname, extramodname+'.py'), extramodcontents)
             sys.path.append(os.getcwd())
             trialcoverage.init_paths()
             trialcoverage.start_coverage()
@@ -64,6 +85,250 @@ class T(unittest.TestCase):\n\
             fileutil.rm_dir(pkgname)
             # print something, type(something)
             # print dir(something)
+        return something
+
+    def _stdout_text(self):
+        return ''.join([args[0] for (name, args, kwargs) in self.stdout.method_calls if name == 'write'])
+
+    def test_basic_test(self):
+        self._run_fake_package('fakepackage4', 'fakemodule4')
+
+    def test_plugin_module(self):
+        # The module that trial loads the reporter from must be importable
+        # from trial's working directory, and must start coverage when it is.
+        from twisted.plugin import getPlugins
+        from twisted.trial.itrial import IReporter
+        modules = [p.module for p in getPlugins(IReporter) if p.longOpt and p.longOpt.startswith('bwverbose-coverage')]
+        self.failUnlessEqual(set(modules), set(['trialcoverage.trialcoverage']))
+
+    def test_unknown_profile(self):
+        # Reported when coverage is started, and by the reporter, rather
+        # than when the module is imported.
+        self.failUnlessRaises(ProfileError, trialcoverage.start_coverage, ['trial', '--reporter=bwverbose-coverage-nosuch', 'pkg'])
+        self.patch(trialcoverage, 'profile_error', ProfileError("no trialcoverage profile named 'nosuch'"))
+        self.failUnlessRaises(ProfileError, trialcoverage.CoverageTextReporter, sys.stdout)
+
+    def test_buffered_save(self):
+        self.patch(trialcoverage, 'SAVE_EVERY', 100)
+        self._run_fake_package('fakepackage5', 'fakemodule5')
+        self.failUnless(os.path.exists(trialcoverage.COVERAGE_FNAME))
+        self.failIf(os.path.exists(trialcoverage.COVERAGE_FNAME + '~'))
+        lines = trialcoverage.cov.data.line_data()
+        self.failUnless([f for f in lines if f.endswith(os.path.join('fakepackage5', 'fakemodule5.py'))], lines.keys())
+
+    def test_test_impact(self):
+        self.patch(trialcoverage, 'TEST_IMPACT', True)
+        self._run_fake_package('fakepackage7', 'fakemodule7')
+        index = TestImpactIndex.load(trialcoverage.TEST_IMPACT_FNAME)
+        testid = 'fakepackage7.test.test_fakemodule7.T.test_thing'
+        testfiles = index.test_files()
+        self.failUnless(testid in testfiles, testfiles)
+        modfname = [f for f in testfiles[testid] if f.endswith(os.path.join('fakepackage7', 'fakemodule7.py'))]
+        self.failUnlessEqual(len(modfname), 1, testfiles[testid])
+        self.failUnlessEqual(index.select({modfname[0]: set([3])}), [testid])
+        self.failUnlessEqual(index.select({modfname[0]: set([2])}), [])
+
+    def test_static_import_all(self):
+        self.patch(trialcoverage, 'IMPORT_ALL', 'static')
+        self._run_fake_package('fakepackage8', 'fakemodule8', {'untested8': 'def a():\n    pass\nb = 1\n'})
+        self.failIf('fakepackage8.untested8' in sys.modules)
+        out = self._stdout_text()
+        self.failUnless('1 files were never imported (3 statements, counted as uncovered)' in out, out)
+        self.failUnless(os.path.join('fakepackage8', 'untested8.py') + ' (3 statements)' in out, out)
+
+    def test_timings(self):
+        self.patch(trialcoverage, 'TIMINGS', True)
+        self._run_fake_package('fakepackage9', 'fakemodule9')
+        timings = json.loads(fileutil.read_file(trialcoverage.TIMINGS_FNAME))
+        self.failUnlessEqual([t['id'] for t in timings['tests']], ['fakepackage9.test.test_fakemodule9.T.test_thing'])
+        self.failUnless(timings['tests'][0]['lines'] >= 2, timings)
+        self.failUnless('slowest tests:' in self._stdout_text())
+
+    def test_cprofile(self):
+        self.patch(trialcoverage, 'CPROFILE', ['*.test_thing'])
+        self._run_fake_package('fakepackage14', 'fakemodule14')
+        self.failUnless(os.path.exists(os.path.join(trialcoverage.CPROFILE_DIRNAME, 'fakepackage14.test.test_fakemodule14.T.test_thing.prof')))
+        self.failUnless(os.path.exists(trialcoverage.CPROFILE_FNAME))
+        self.failUnless('cProfile of 1 tests' in self._stdout_text(), self._stdout_text())
+        lines = trialcoverage.cov.data.line_data()
+        self.failUnless([f for f in lines if f.endswith(os.path.join('fakepackage14', 'fakemodule14.py'))], lines.keys())
+
+    def test_events(self):
+        self.patch(trialcoverage, 'EVENTS', True)
+        self._run_fake_package('fakepackage15', 'fakemodule15')
+        records = [json.loads(l) for l in fileutil.read_file(trialcoverage.EVENTS_FNAME).splitlines()]
+        self.failUnlessEqual([r['event'] for r in records], ['start', 'test', 'end'])
+        test = records[1]
+        self.failUnlessEqual((test['id'], test['outcome']), ('fakepackage15.test.test_fakemodule15.T.test_thing', 'success'))
+        # The bodies of test_thing and foofunc, and the arcs into, through
+        # and out of them.
+        self.failUnlessEqual((test['new_lines'], test['new_arcs']), (3, 5))
+        self.failUnlessEqual(records[2]['tests'], 1)
+        self.failUnlessEqual(records[2]['verdict'], trialcoverage.VERDICTS[records[2]['progression']])
+
+    def test_timings_merged(self):
+        self.patch(trialcoverage, 'TIMINGS', True)
+        earlier = TestTimings()
+        earlier.add(TestTiming('other.test.test_x.T.test_y'))
+        earlier.timings[0].wall = 2.0
+        earlier.save(trialcoverage.TIMINGS_FNAME)
+        self._run_fake_package('fakepackage17', 'fakemodule17')
+        seconds = TestTimings.load(trialcoverage.TIMINGS_FNAME).seconds()
+        # The timings of earlier runs are kept.
+        self.failUnlessEqual(sorted(seconds), ['fakepackage17.test.test_fakemodule17.T.test_thing', 'other.test.test_x.T.test_y'])
+        self.failUnless(0 <= seconds['fakepackage17.test.test_fakemodule17.T.test_thing'] < 2.0, seconds)
+
+    def test_sample(self):
+        self.patch(trialcoverage, 'SAMPLE', 2)
+        self.patch(trialcoverage, 'PROFILE', Profile('default', include=['fakepackage19/*']))
+        fileutil.write_file(trialcoverage.VERSION_STAMP_FNAME, 'v1')
+        extramodules = dict([('extra%d' % i, 'def f():\n    return %d\n' % i) for i in range(10)])
+        self._run_fake_package('fakepackage19', 'fakemodule19', extramodules)
+        sample = trialcoverage.sample
+        self.failUnlessEqual(sample.population, 14)
+        self.failUnless(0 < len(sample.files) < 14, sample.files)
+        # Only the files of the sample were measured.
+        self.failUnlessEqual(set(trialcoverage.cov.data.executed_files()).difference(sample.files), set())
+        self.failUnlessEqual(trialcoverage.cov.data.filename, os.path.join(trialcoverage.SAMPLE_DIRNAME, '.coverage.%d' % (sample.slot,)))
+        text = self._stdout_text()
+        self.failUnless('code coverage summary of sample %d of 2' % (sample.slot,) in text, text)
+        self.failUnless('Current sampled coverage left an estimated' in text, text)
+        self.failUnless(os.path.exists(trialcoverage.SAMPLE_BEST_FNAME))
+
+    def test_diff(self):
+        fileutil.write_file('changes.diff', '--- a/fakepackage20/fakemodule20.py\n+++ b/fakepackage20/fakemodule20.py\n@@ -2,1 +2,3 @@\n def foofunc():\n+    x=1\n+    y=x\n')
+        self.patch(trialcoverage, 'DIFF', 'changes.diff')
+        self.patch(trialcoverage, 'DIFF_THRESHOLD', 100.0)
+        result = self._run_fake_package('fakepackage20', 'fakemodule20')
+        text = self._stdout_text()
+        self.failUnless('diff coverage: 2 changed statements in 1 files, 0 untested, 100.0% tested' in text, text)
+        # Only the changed file was analyzed.
+        self.failUnlessEqual([os.path.basename(f) for f in result.pr.analyses], ['fakemodule20.py'])
+        self.failUnlessEqual(result.pr.verdict, 'diff-passes')
+
+    def test_html_after_diff(self):
+        self.patch(trialcoverage, 'HTML', True)
+        fileutil.rm_dir(trialcoverage.HTML_DIRNAME)
+        self._run_fake_package('fakepackage25', 'fakemodule25', {'other25': 'def f():\n    return 1\n'})
+        pages = sorted(os.listdir(trialcoverage.HTML_DIRNAME))
+        self.failUnless([p for p in pages if p.endswith('other25.html')], pages)
+        index = fileutil.read_file(os.path.join(trialcoverage.HTML_DIRNAME, 'index.html'))
+
+        for modname in sys.modules.keys():
+            if modname.startswith('fakepackage25'):
+                del sys.modules[modname]
+        fileutil.write_file('changes.diff', '--- a/fakepackage25/fakemodule25.py\n+++ b/fakepackage25/fakemodule25.py\n@@ -2,1 +2,2 @@\n def foofunc():\n+    x=1\n')
+        self.patch(trialcoverage, 'DIFF', 'changes.diff')
+        self._run_fake_package('fakepackage25', 'fakemodule25', {'other25': 'def f():\n    return 1\n'})
+        # The diff run analyzed only fakemodule25, and left the report of
+        # the whole tree alone.
+        self.failUnlessEqual(sorted(os.listdir(trialcoverage.HTML_DIRNAME)), pages)
+        self.failUnlessEqual(fileutil.read_file(os.path.join(trialcoverage.HTML_DIRNAME, 'index.html')), index)
+        self.failUnless('The HTML report in %s was left as it was' % (trialcoverage.HTML_DIRNAME,) in self._stdout_text(), self._stdout_text())
+
+    def test_subprocess(self):
+        self.patch(trialcoverage, 'SUBPROCESS', True)
+        self.patch(os, 'environ', dict(os.environ))
+        os.environ.pop('TRIALCOVERAGE_SUBPROCESS_CONFIG', None)
+        pythonpath = os.environ.get('PYTHONPATH')
+        childtest = """
+import os, subprocess, sys
+from twisted.trial import unittest
+class T(unittest.TestCase):
+    def test_child(self):
+        code = "import sys; sys.path.insert(0, %r); from fakepackage16 import childmod16; childmod16.childfunc()"
+        for i in range(3):
+            subprocess.check_call([sys.executable, '-c', code], env=os.environ)
+""" % (os.getcwd(),)
+        self._run_fake_package('fakepackage16', 'fakemodule16', {'childmod16': 'def childfunc():\n    return 42\n', 'test/test_child16': childtest})
+        self.failUnless('Merged the coverage data of 3 child processes' in self._stdout_text(), self._stdout_text())
+        self.failUnlessEqual(os.listdir(os.path.dirname(trialcoverage.SUBPROCESS_DATA_FNAME)), [])
+        childmod = [f for f in trialcoverage.cov.data.executed_files() if f.endswith(os.path.join('fakepackage16', 'childmod16.py'))]
+        self.failUnlessEqual(len(childmod), 1)
+        # Line 2 only ran in the child processes.
+        self.failUnless(2 in trialcoverage.cov.data.executed_lines(childmod[0]))
+        # Processes started after the run don't measure coverage.
+        self.failIf('TRIALCOVERAGE_SUBPROCESS_CONFIG' in os.environ)
+        self.failUnlessEqual(os.environ.get('PYTHONPATH'), pythonpath)
+
+    def test_subprocess_environ(self):
+        environ = {'PYTHONPATH': 'a'}
+        saved = trialcoverage.enable_subprocess_coverage(['x/*'], None, True, environ)
+        self.failUnlessEqual(environ['PYTHONPATH'], trialcoverage.CHILDSTARTUP_DIRNAME + os.pathsep + 'a')
+        self.failUnless(os.path.isabs(trialcoverage.CHILDSTARTUP_DIRNAME))
+        trialcoverage.disable_subprocess_coverage(saved, environ)
+        self.failUnlessEqual(environ, {'PYTHONPATH': 'a'})
+
+    def test_adaptive(self):
+        self.patch(trialcoverage, 'ADAPTIVE', 1)
+        self._run_fake_package('fakepackage10', 'fakemodule10')
+        self.failUnless('Stopped tracing 2 files once they were fully covered' in self._stdout_text(), self._stdout_text())
+
+    def test_adaptive_with_order(self):
+        # The order needs every test's full coverage, so adaptive tracing
+        # is turned off.
+        self.patch(trialcoverage, 'ADAPTIVE', 1)
+        self.patch(trialcoverage, 'ORDER', True)
+        self._run_fake_package('fakepackage24', 'fakemodule24')
+        self.failIf('Stopped tracing' in self._stdout_text(), self._stdout_text())
+        err = ''.join([args[0] for (name, args, kwargs) in self.stderr.method_calls if name == 'write'])
+        self.failUnless("TRIALCOVERAGE_ADAPTIVE is ignored because TRIALCOVERAGE_ORDER needs every test to be traced" in err, err)
+        order = json.loads(fileutil.read_file(trialcoverage.TEST_ORDER_FNAME))
+        self.failUnless(order['tests'][0]['gain'] >= 2, order)
+
+    def test_profile(self):
+        self.patch(trialcoverage, 'PROFILE', Profile('fast', branch=False))
+        self._run_fake_package('fakepackage11', 'fakemodule11')
+        self.failUnlessEqual(trialcoverage.COVERAGE_FNAME, os.path.join(trialcoverage.RES_FULLDIRNAME, 'profiles', 'fast', '.coverage'))
+        self.failUnless(os.path.exists(trialcoverage.COVERAGE_FNAME))
+        self.failUnless(os.path.exists(os.path.join(trialcoverage.RES_FULLDIRNAME, 'profiles', 'fast', 'best', 'totals.json')))
+        self.failIf(trialcoverage.cov.data.has_arcs())
+
+    def test_order_and_stop_early(self):
+        self.patch(trialcoverage, 'ORDER', True)
+        trialcoverage.init_paths()
+        fileutil.remove_if_possible(trialcoverage.BEST_TOTALS_FNAME)
+        fileutil.remove_if_possible(trialcoverage.BEST_FILES_FNAME)
+        self._run_fake_package('fakepackage12', 'fakemodule12')
+        order = json.loads(fileutil.read_file(trialcoverage.TEST_ORDER_FNAME))
+        self.failUnlessEqual([t['id'] for t in order['tests']], ['fakepackage12.test.test_fakemodule12.T.test_thing'])
+        self.failUnless(order['tests'][0]['gain'] >= 2, order)
+
+        for modname in sys.modules.keys():
+            if modname.startswith('fakepackage12'):
+                del sys.modules[modname]
+        self.patch(trialcoverage, 'STOP_EARLY', True)
+        self._run_fake_package('fakepackage12', 'fakemodule12')
+        self.failUnless('Stopped the run after 1 tests' in self._stdout_text(), self._stdout_text())
+
+    def test_parallel(self):
+        self.patch(trialcoverage, 'PARALLEL', True)
+        for fname in trialcoverage.list_parallel_data_files():
+            fileutil.remove_if_possible(fname)
+        fileutil.remove_if_possible(trialcoverage.BEST_TOTALS_FNAME)
+        result = self._run_fake_package('fakepackage6', 'fakemodule6')
+        # A process of a parallel run neither reports nor touches the
+        # baseline; its data waits for the combining step.
+        self.failUnlessEqual(result.pr, None)
+        self.failUnless(result.wasSuccessful())
+        self.failIf('code coverage summary' in self._stdout_text(), self._stdout_text())
+        self.failIf(os.path.exists(trialcoverage.BEST_TOTALS_FNAME))
+        self.failIf(os.path.exists(trialcoverage.COVERAGE_FNAME))
+        self.failUnlessEqual(len(trialcoverage.list_parallel_data_files()), 1)
+
+        realstdout = sys.stdout
+        self.stdout = sys.stdout = Mock()
+        try:
+            self.failUnlessEqual(check.main(['--combine', '--update-baseline']), 1)
+        finally:
+            sys.stdout = realstdout
+        self.failUnless('Combined the coverage data of 1 processes' in self._stdout_text(), self._stdout_text())
+        self.failIf(trialcoverage.list_parallel_data_files())
+        self.failUnless(os.path.exists(trialcoverage.BEST_TOTALS_FNAME))
+        data = coverage.coverage(data_file=trialcoverage.COVERAGE_FNAME)
+        data.load()
+        lines = data.data.line_data()
+        self.failUnless([f for f in lines if f.endswith(os.path.join('fakepackage6', 'fakemodule6.py'))], lines.keys())
 
     def UNFINISHED_test_successive_different_code(self):
         pkgname='fakepackage4'
@@ -0,0 +1,46 @@
+from twisted.trial import unittest
+
+from trialcoverage.timing import TestTiming, TestTimings
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+from mock import Mock
+
+def _timing(testid, wall, start, stop, save):
+    t = TestTiming(testid)
+    t.wall, t.start, t.stop, t.save = wall, start, stop, save
+    return t
+
+class TimingsTest(unittest.TestCase):
+    def setUp(self):
+        self.timings = TestTimings()
+        self.timings.add(_timing('a', 1.0, 0.1, 0.1, 0.0))
+        self.timings.add(_timing('b', 3.0, 0.0, 0.0, 0.0))
+        self.timings.add(_timing('c', 2.0, 0.2, 0.2, 0.5))
+
+    def test_ordering(self):
+        self.failUnlessEqual([t.testid for t in self.timings.slowest(2)], ['b', 'c'])
+        self.failUnlessEqual([t.testid for t in self.timings.most_overhead(2)], ['c', 'a'])
+
+    def test_json(self):
+        d = json.loads(self.timings.to_json())
+        self.failUnlessEqual([t['id'] for t in d['tests']], ['a', 'b', 'c'])
+        self.failUnlessEqual(d['tests'][2]['save'], 0.5)
+
+    def test_report(self):
+        out = Mock()
+        self.timings.report(out, 1)
+        text = ''.join([args[0] for (name, args, kwargs) in out.method_calls])
+        self.failUnless('3 tests took 6.000s, of which 1.100s' in text, text)
+
+    def test_update(self):
+        newer = TestTimings()
+        newer.add(_timing('b', 0.5, 0.0, 0.0, 0.0))
+        newer.add(_timing('d', 4.0, 0.0, 0.0, 0.0))
+        self.timings.update(newer)
+        self.failUnlessEqual(self.timings.seconds(), {'a': 1.0, 'b': 0.5, 'c': 2.0, 'd': 4.0})
+        self.failUnlessEqual(len(self.timings), 4)
@@ -0,0 +1,117 @@
+from twisted.trial import unittest
+
+from pyutil import fileutil
+
+import os, sys, time
+
+from mock import Mock
+
+from trialcoverage import trialcoverage
+from trialcoverage.profiles import Profile
+from trialcoverage.watch import CoverageMap, Watcher
+
+MODCONTENTS = '''\
+def f(x):
+    if x:
+        return 1
+    return 2
+
+def g():
+    return 3
+'''
+
+TESTCONTENTS = '''\
+from twisted.trial import unittest
+from fakepackage13 import mod
+class T(unittest.TestCase):
+    def test_f(self):
+        mod.f(1)
+'''
+
+OTHERTESTCONTENTS = '''\
+from twisted.trial import unittest
+class T(unittest.TestCase):
+    def test_nothing(self):
+        pass
+'''
+
+class CoverageMapTest(unittest.TestCase):
+    def test_union_and_select(self):
+        m = CoverageMap()
+        self.failUnlessEqual(m.record_imports({'a': {1: None}}, {}), set(['a']))
+        self.failUnlessEqual(m.record_test('t1', {'a': {2: None}, 'b': {1: None}}, {'a': {(1, 2): None}}), set(['a', 'b']))
+        m.record_test('t2', {'b': {2: None}}, {})
+        self.failUnlessEqual(m.file_data('a'), (set([1, 2]), set([(1, 2)])))
+        self.failUnlessEqual(m.file_data('b'), (set([1, 2]), set()))
+        self.failUnlessEqual(m.select(['a']), set(['t1']))
+        self.failUnlessEqual(m.select(['b', 'c']), set(['t1', 't2']))
+
+        # Recording a test again replaces what it executed before.
+        self.failUnlessEqual(m.record_test('t1', {'b': {3: None}}, {}), set(['a', 'b']))
+        self.failUnlessEqual(m.file_data('a'), (set([1]), set()))
+        self.failUnlessEqual(m.select(['a']), set())
+        self.failUnlessEqual(m.forget_test('t1'), set(['b']))
+        self.failUnlessEqual(m.file_data('b'), (set([2]), set()))
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.patch(trialcoverage, 'PROFILE', Profile('default', include=['fakepackage13/*']))
+        self.patch(trialcoverage, 'IMPORT_ALL', 'import')
+        trialcoverage.init_paths()
+        fileutil.remove_if_possible(trialcoverage.BEST_TOTALS_FNAME)
+        fileutil.make_dirs(os.path.join('fakepackage13', 'test'))
+        fileutil.write_file(os.path.join('fakepackage13', '__init__.py'), '')
+        fileutil.write_file(os.path.join('fakepackage13', 'mod.py'), MODCONTENTS)
+        fileutil.write_file(os.path.join('fakepackage13', 'test', '__init__.py'), '')
+        fileutil.write_file(os.path.join('fakepackage13', 'test', 'test_mod.py'), TESTCONTENTS)
+        fileutil.write_file(os.path.join('fakepackage13', 'test', 'test_other.py'), OTHERTESTCONTENTS)
+        sys.path.append(os.getcwd())
+        self.realstdout = sys.stdout
+        sys.stdout = Mock()
+
+    def tearDown(self):
+        sys.stdout = self.realstdout
+        sys.path.remove(os.getcwd())
+        fileutil.rm_dir('fakepackage13')
+
+    def _write(self, relpath, contents):
+        fname = os.path.join('fakepackage13', *relpath.split('/'))
+        fileutil.write_file(fname, contents)
+        # Make sure that the change is visible even on a coarse-grained
+        # file system clock.
+        mtime = time.time() + 10
+        os.utime(fname, (mtime, mtime))
+
+    def _uncovered(self, watcher):
+        return dict([(os.path.basename(f), n) for (f, n) in watcher.numbers.iteritems()])
+
+    def test_watch(self):
+        w = Watcher(['fakepackage13'], test_output=os.path.abspath('watch-output.txt'))
+        self.failUnless(sys.modules.get('fakepackage13') is None, "the watcher must not import the code under test")
+        self.failUnlessEqual(w.start(), 1)
+        self.failUnlessEqual(sorted(w.coverage_map.tests), ['fakepackage13.test.test_mod.T.test_f', 'fakepackage13.test.test_other.T.test_nothing'])
+        # Line 4 and line 7 are never executed, and the if is only taken one way.
+        self.failUnlessEqual(self._uncovered(w)['mod.py'], (2, 1))
+        self.failUnlessEqual(w.poll(), None)
+
+        # Only the test which executed mod.py is run again.
+        self._write('test/test_mod.py', TESTCONTENTS + '''\
+    def test_g(self):
+        mod.g()
+''')
+        self.failUnlessEqual(w.poll(), 1)
+        self.failUnlessEqual(self._uncovered(w)['mod.py'], (1, 1))
+        self.failUnlessEqual(len(w.coverage_map.tests), 3)
+
+        # A changed module reruns the tests which executed it.
+        self._write('mod.py', MODCONTENTS.replace('if x:', 'if x or x == 0:'))
+        old = w.run_tests
+        ran = []
+        def run_tests(testnames, modules=(), import_all=False):
+            ran.extend(testnames)
+            return old(testnames, modules, import_all)
+        w.run_tests = run_tests
+        self.failUnlessEqual(w.poll(), 1)
+        self.failUnlessEqual(sorted(ran), ['fakepackage13.test.test_mod.T.test_f', 'fakepackage13.test.test_mod.T.test_g'])
+        self.failUnlessEqual(self._uncovered(w)['mod.py'], (1, 1))
+        self.failUnless('test_g ... [OK]' in fileutil.read_file('watch-output.txt'))
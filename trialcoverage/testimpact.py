@@ -0,0 +1,138 @@
+"""
+A record of which lines of which files each test executed, and a way to use
+it to pick the tests that a change can affect.
+
+The index is collected by CoverageTextReporter when TRIALCOVERAGE_TEST_IMPACT=1
+is set, and is stored in .coverage-results/test-impact.json. Then:
+
+  trial $(python -m trialcoverage.testimpact foo/bar.py foo/baz.py:10-20)
+
+runs just the tests which executed any line of foo/bar.py or any of lines 10
+to 20 of foo/baz.py. A changed file which no test executed (for example a new
+file) selects no tests, and is reported on stderr.
+
+The JSON file holds a table of file names, and for each test id a mapping
+from an index into that table to the executed lines of that file, with runs
+of consecutive lines stored as [first, last] pairs.
+"""
+
+import errno, os, sys
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+from pyutil import fileutil
+
+from coveragestore import CoverageStore
+from util import compress_lines, expand_lines, write_file_atomically
+
+def canonical_filename(fname):
+    return os.path.realpath(os.path.abspath(fname))
+
+class TestImpactIndex(object):
+    def __init__(self):
+        self.store = CoverageStore() # the lines that each test executed
+
+    def record(self, testid, line_data):
+        """ line_data is { filename: { lineno: None } } as collected by
+        coverage.py while the test ran. A test that is recorded again
+        replaces its earlier record. """
+        self.store.record(testid, line_data, {})
+
+    def files(self):
+        return set([f for (f, fu) in self.store.files.iteritems() if fu.bitmaps])
+
+    def test_files(self):
+        """ Returns { testid: set of the files that it executed }. """
+        return dict([(testid, self.store.files_of(testid)) for testid in self.store])
+
+    def select(self, changed):
+        """ changed is { filename: set(lines) or None }, where None means
+        that any line of the file may have changed. Returns the sorted ids
+        of the tests which executed any of the changed lines. """
+        selected = set()
+        for fname, changedlines in changed.iteritems():
+            selected.update(self.store.tests_hitting_any(fname, changedlines))
+        return sorted(selected)
+
+    def to_json(self):
+        fnames = sorted(self.files())
+        tests = dict([(testid, {}) for testid in self.store])
+        for (i, fname) in enumerate(fnames):
+            for testid in self.store.tests_hitting(fname):
+                (lines, arcs) = self.store.executed(testid, fname)
+                tests[testid][str(i)] = compress_lines(lines)
+        return json.dumps({'files': fnames, 'tests': tests})
+
+    def from_json(klass, s):
+        d = json.loads(s)
+        fnames = d['files']
+        self = klass()
+        for testid, filemap in d['tests'].iteritems():
+            self.record(testid, dict([(fnames[int(i)], expand_lines(lines)) for (i, lines) in filemap.iteritems()]))
+        return self
+    from_json = classmethod(from_json)
+
+    def save(self, fname):
+        write_file_atomically(fname, self.to_json(), mode='w')
+
+    def load(klass, fname):
+        """ Returns the index stored in fname, or an empty index if there
+        is none (or it is unreadable). """
+        try:
+            return klass.from_json(fileutil.read_file(fname, mode='rU'))
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                sys.stderr.write("WARNING, could not read test impact index %s: %s\n" % (fname, le,))
+        except (ValueError, KeyError, IndexError, TypeError), le:
+            sys.stderr.write("WARNING, discarding corrupt test impact index %s: %s\n" % (fname, le,))
+        return klass()
+    load = classmethod(load)
+
+def parse_changed(args):
+    """ Parse command-line arguments of the form FILE, FILE:LINE or
+    FILE:FIRST-LAST into the argument for TestImpactIndex.select(). """
+    changed = {}
+    for arg in args:
+        fname, lines = arg, None
+        if ':' in arg:
+            head, tail = arg.rsplit(':', 1)
+            if tail.replace('-', '').isdigit():
+                fname = head
+                if '-' in tail:
+                    first, last = tail.split('-', 1)
+                    lines = set(range(int(first), int(last)+1))
+                else:
+                    lines = set([int(tail)])
+        fname = canonical_filename(fname)
+        if changed.has_key(fname) and (changed[fname] is None or lines is None):
+            changed[fname] = None
+        elif lines is not None:
+            changed.setdefault(fname, set()).update(lines)
+        else:
+            changed[fname] = None
+    return changed
+
+def main(argv=None):
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog [options] CHANGEDFILE[:FIRST[-LAST]]...",
+                          description="Print the ids of the tests which executed any of the given files or lines, one per line.")
+    parser.add_option("--index", dest="index", default=os.path.join('.coverage-results', 'test-impact.json'),
+                      help="the test impact index written by the coverage reporter [default: %default]")
+    (options, args) = parser.parse_args(argv)
+
+    index = TestImpactIndex.load(options.index)
+    changed = parse_changed(args)
+    known = index.files()
+    for fname in sorted(changed):
+        if fname not in known:
+            sys.stderr.write("no recorded test executed %s\n" % (fname,))
+    for testid in index.select(changed):
+        sys.stdout.write(testid + "\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Run the tests that add the most coverage first, and stop as soon as the run
+is known not to regress coverage.
+
+With TRIALCOVERAGE_ORDER=1 the reporter records which lines and arcs each
+test executed and how long it took, and at the end of the run orders the
+tests greedily, each next test being the one which adds the most lines and
+arcs not yet executed by the tests before it, per second of its run time.
+The order is written, with each test's marginal coverage, to
+.coverage-results/test-order.json. Then:
+
+  python -m trialcoverage.testorder --reporter=bwverbose-coverage mypkg
+
+runs trial with the same arguments, except that the tests run in that order
+(tests which aren't in it, e.g. new ones, run first).
+
+With TRIALCOVERAGE_STOP_EARLY=1 the reporter stops the run as soon as every
+file in the best run's per-file baseline has been executed and the totals of
+the files executed so far are no worse than the best run's. The tests that
+are left can only cover more of those files, so the progression report then
+gives a non-regression verdict for them without running the rest of the
+suite. (They could still execute files that the best run never did, which is
+why this is for a quick answer, not for the full run.)
+"""
+
+import errno, heapq, os, sys
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+from pyutil import fileutil
+
+from coverage.codeunit import code_unit_factory
+
+from coveragestore import CoverageStore, popcount
+from util import write_file_atomically
+
+# A test is never taken to have taken less than this long, so that very
+# fast tests don't get arbitrarily large scores.
+MIN_SECONDS = 0.001
+
+def count_units(units):
+    """ units is { key: bitmap }. Returns the number of bits set. """
+    return sum([popcount(bitmap) for bitmap in units.itervalues()])
+
+def greedy_order(tests):
+    """ tests is a list of (testid, seconds, coverage units), the units
+    being { filename: bitmap } with the bits numbered alike for all tests,
+    as CoverageStore.bitmaps() returns them. Returns [(testid, marginal
+    units, seconds)] in greedy order of marginal units per second. Since a
+    test's marginal coverage can only shrink as more tests are chosen, a
+    test's score is only recomputed when it reaches the top of the heap. """
+    heap = []
+    for (testid, seconds, units) in tests:
+        n = count_units(units)
+        heap.append((-n / max(seconds, MIN_SECONDS), testid, seconds, units, n))
+    heapq.heapify(heap)
+    covered = {} # filename -> bitmap
+    order = []
+    while heap:
+        (negscore, testid, seconds, units, n) = heapq.heappop(heap)
+        gain = {}
+        for (filename, bitmap) in units.iteritems():
+            new = bitmap & ~covered.get(filename, 0L)
+            if new:
+                gain[filename] = new
+        gained = count_units(gain)
+        if gained < n:
+            score = gained / max(seconds, MIN_SECONDS)
+            if heap and score < -heap[0][0]:
+                heapq.heappush(heap, (-score, testid, seconds, gain, gained))
+                continue
+        for (filename, bitmap) in gain.iteritems():
+            covered[filename] = covered.get(filename, 0L) | bitmap
+        order.append((testid, gained, seconds))
+    return order
+
+class TestOrderRecorder(object):
+    def __init__(self):
+        self.store = CoverageStore() # the lines and arcs that each test executed
+        self.seconds = {} # testid -> seconds
+
+    def record(self, testid, seconds, line_data, arc_data):
+        self.store.record(testid, line_data, arc_data)
+        self.seconds[testid] = seconds
+
+    def to_json(self):
+        tests = [(testid, self.seconds[testid], self.store.bitmaps(testid)) for testid in self.store]
+        return json.dumps({'tests': [{'id': testid, 'gain': gain, 'seconds': seconds} for (testid, gain, seconds) in greedy_order(tests)]})
+
+    def save(self, fname):
+        write_file_atomically(fname, self.to_json(), mode='w')
+
+def load_order(fname):
+    """ Returns the test ids in the order stored in fname, or [] if there is
+    none. """
+    try:
+        return [t['id'] for t in json.loads(fileutil.read_file(fname, mode='rU'))['tests']]
+    except EnvironmentError, le:
+        if le.errno != errno.ENOENT:
+            sys.stderr.write("WARNING, could not read test order %s: %s\n" % (fname, le,))
+    except (ValueError, KeyError, TypeError), le:
+        sys.stderr.write("WARNING, discarding corrupt test order %s: %s\n" % (fname, le,))
+    return []
+
+class EarlyStop(object):
+    """ Tells when the files executed so far are, in total, no worse
+    covered than in the best run, and every file of the best run has been
+    executed. """
+    def __init__(self, cov, baseline, analysis_cache=None):
+        self.cov = cov
+        self.analysis_cache = analysis_cache
+        self.remaining = set(baseline.files) # baseline files not executed yet
+        self.bestunc = sum([entry[0] for entry in baseline.files.itervalues()])
+        self.besttot = self.bestunc + sum([entry[1] for entry in baseline.files.itervalues()])
+        self.numbers = {} # filename -> (uncovered, partial)
+        self.pending = set() # files executed since the last check
+
+    def analyze(self, cu):
+        if self.analysis_cache is None:
+            return self.cov._analyze(cu)
+        return self.analysis_cache.analyze(self.cov, cu)
+
+    def executed(self, filenames):
+        self.pending.update(filenames)
+        self.remaining.difference_update(filenames)
+
+    def matched(self):
+        if self.remaining:
+            return False
+        for filename in self.pending:
+            cu = code_unit_factory([filename], self.cov.file_locator)[0]
+            try:
+                nums = self.analyze(cu).numbers
+            except KeyboardInterrupt:
+                raise
+            except Exception, le:
+                sys.stderr.write("WARNING, got exception while analyzing %s: %s\n" % (cu.name, le,))
+                continue
+            self.numbers[filename] = (nums.n_missing, nums.n_missing_branches)
+        self.pending.clear()
+        unc = sum([n[0] for n in self.numbers.itervalues()])
+        tot = unc + sum([n[1] for n in self.numbers.itervalues()])
+        return (tot <= self.besttot) and (unc <= self.bestunc)
+
+def order_suite(suite, order):
+    """ Returns a flat suite of the tests in suite, with the ones in order
+    (a list of test ids) in that order, after the ones which aren't. """
+    from twisted.trial import runner, unittest
+    rank = dict([(testid, i) for (i, testid) in enumerate(order)])
+    tests = list(unittest._iterateTests(suite))
+    tests.sort(key=lambda t: rank.get(t.id(), -1))
+    return runner.TestSuite(tests)
+
+def main(argv=None):
+    """ Like trial's main function, but runs the tests in the order stored
+    in .coverage-results/test-order.json. """
+    from twisted.python import usage
+    from twisted.scripts import trial
+    config = trial.Options()
+    try:
+        config.parseOptions(argv)
+    except usage.error, ue:
+        raise SystemExit, "%s: %s" % (sys.argv[0], ue)
+    trial._initialDebugSetup(config)
+    trialRunner = trial._makeRunner(config)
+    suite = order_suite(trial._getSuite(config), load_order(os.path.join('.coverage-results', 'test-order.json')))
+    test_result = trialRunner.run(suite)
+    return not test_result.wasSuccessful()
+
+if __name__ == "__main__":
+    sys.exit(main())
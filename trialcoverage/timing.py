@@ -0,0 +1,105 @@
+"""
+Per-test timing of a coverage run: how long each test took, how much of
+that was spent starting, stopping and saving coverage, and how many lines
+and arcs were collected while it ran. CoverageTextReporter collects this when
+TRIALCOVERAGE_TIMINGS=1 is set, prints the slowest tests and those with the
+most coverage overhead, and merges it into .coverage-results/timings.json,
+which keeps the latest timing of every test that any run, on this machine or
+copied from the shards of an earlier CI build, has recorded. The sharding
+planner (see trialcoverage/sharding.py) reads the test durations from there.
+"""
+
+import errno, sys
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
+
+from pyutil import fileutil
+
+from util import write_file_atomically
+
+class TestTiming(object):
+    def __init__(self, testid):
+        self.testid = testid
+        self.wall = 0.0
+        self.start = 0.0 # in cov.start()
+        self.stop = 0.0 # in cov.stop()
+        self.save = 0.0 # in saving the coverage data
+        self.lines = 0
+        self.arcs = 0
+
+    def overhead(self):
+        return self.start + self.stop + self.save
+
+    def to_dict(self):
+        return {'id': self.testid, 'wall': self.wall, 'start': self.start, 'stop': self.stop, 'save': self.save, 'lines': self.lines, 'arcs': self.arcs}
+
+    def from_dict(klass, d):
+        self = klass(d['id'])
+        for k in ('wall', 'start', 'stop', 'save', 'lines', 'arcs'):
+            setattr(self, k, d[k])
+        return self
+    from_dict = classmethod(from_dict)
+
+class TestTimings(object):
+    def __init__(self):
+        self.timings = [] # in the order the tests ran
+
+    def add(self, timing):
+        self.timings.append(timing)
+
+    def update(self, other):
+        """ Takes the timings of other in preference to our own. """
+        ids = set([t.testid for t in other.timings])
+        self.timings = [t for t in self.timings if t.testid not in ids] + other.timings
+
+    def seconds(self):
+        """ Returns { testid: wall seconds }. """
+        return dict([(t.testid, t.wall) for t in self.timings])
+
+    def __len__(self):
+        return len(self.timings)
+
+    def slowest(self, n):
+        return sorted(self.timings, key=lambda t: t.wall, reverse=True)[:n]
+
+    def most_overhead(self, n):
+        return sorted(self.timings, key=lambda t: t.overhead(), reverse=True)[:n]
+
+    def report(self, out, n=10):
+        if not self.timings:
+            return
+        totwall = sum([t.wall for t in self.timings])
+        totoverhead = sum([t.overhead() for t in self.timings])
+        out.write("%d tests took %.3fs, of which %.3fs was spent starting, stopping and saving coverage\n" % (len(self.timings), totwall, totoverhead))
+        out.write("slowest tests:\n")
+        for t in self.slowest(n):
+            out.write("  %8.3fs %s\n" % (t.wall, t.testid))
+        out.write("tests with the most coverage overhead:\n")
+        for t in self.most_overhead(n):
+            out.write("  %8.3fs (start %.3fs, stop %.3fs, save %.3fs, %d lines, %d arcs) %s\n" % (t.overhead(), t.start, t.stop, t.save, t.lines, t.arcs, t.testid))
+
+    def to_json(self):
+        return json.dumps({'tests': [t.to_dict() for t in self.timings]})
+
+    def save(self, fname):
+        write_file_atomically(fname, self.to_json(), mode='w')
+
+    def load(klass, fname):
+        """ Returns the timings stored in fname, or no timings if there are
+        none (or they are unreadable). """
+        self = klass()
+        try:
+            for d in json.loads(fileutil.read_file(fname, mode='rU'))['tests']:
+                self.add(TestTiming.from_dict(d))
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                sys.stderr.write("WARNING, could not read timings %s: %s\n" % (fname, le,))
+        except (ValueError, KeyError, TypeError), le:
+            sys.stderr.write("WARNING, discarding corrupt timings %s: %s\n" % (fname, le,))
+            self.timings = []
+        return self
+    load = classmethod(load)
@@ -11,23 +11,177 @@ top-level directory. This file can be turned into a directory of .html files
 
  coverage html -d OUTPUTDIR --include=PREFIX1/*,PREFIX2/*,..
 
+or, cheaper, by setting TRIALCOVERAGE_HTML=1, which makes the reporter write
+that report into .coverage-results/html/ at the end of the run, rendering
+pages in parallel and only for the files whose source or coverage changed
+since the last report. Runs with TRIALCOVERAGE_DIFF or TRIALCOVERAGE_SAMPLE
+only analyze some of the files, so they leave the report as it was. See
+trialcoverage/htmlreport.py.
+
 Before using this, you need to install the 'coverage' package, which will
 provide an executable tool named 'coverage' ('python-coverage' on Ubuntu) as
 well as an importable library. 'coverage report' will produce a basic text
 summary of the coverage data.
+
+By default the coverage data is written out to the .coverage file after every
+test. On large test suites that rewrite dominates the run time, so the data
+can instead be kept in memory and written out every N tests and/or every T
+seconds, by setting these environment variables before running trial:
+
+  TRIALCOVERAGE_SAVE_EVERY=N      # save after every N tests
+  TRIALCOVERAGE_SAVE_INTERVAL=T   # save when T seconds passed since last save
+
+The data is always saved at the end of the run, and once more when the
+process exits, so an aborted run still leaves usable data behind. Every save
+is written to a temporary file which is then renamed over .coverage, so the
+file is never left half-written.
+
+To split a test run across several processes (e.g. shards of the suite run
+at the same time), set TRIALCOVERAGE_PARALLEL=1. Each process then writes its
+own data file, named .coverage.HOST.PID.RANDOM, under .coverage-results/
+instead of writing .coverage, and doesn't report on coverage, since the
+others may not have finished yet. Once every process has finished,
+
+  python -m trialcoverage.check --combine --update-baseline
+
+merges the per-process data files into .coverage (reading them in parallel),
+removes them, and reports on the union of everything.
+
+With TRIALCOVERAGE_SUBPROCESS=1 the Python processes that the tests start
+(with subprocess, reactor.spawnProcess or otherwise) measure coverage too, as
+long as they inherit the environment (spawnProcess doesn't pass it on unless
+it is given env=os.environ). Each writes a data file of its own under
+.coverage-results/subprocess/ when it exits, and those are merged into
+.coverage before the progression report. Processes which exit with
+os._exit() or are killed leave no data. See
+trialcoverage/childstartup/sitecustomize.py.
+
+The progression report is computed directly from coverage.py's analysis of
+each file (the static part of which is cached across runs in
+.coverage-results/analysis-cache.pickle, for up to
+TRIALCOVERAGE_ANALYSIS_CACHE_SIZE files, default 10000, 0 to disable), and the best-ever totals are kept in
+.coverage-results/best/totals.json. A text summary like the one 'coverage
+report' prints is written to .coverage-results/summary.txt only if
+TRIALCOVERAGE_WRITE_SUMMARY=1 is set. To get the same verdict for a .coverage
+file without running the tests, use trialcoverage/check.py.
+
+The best run's uncovered and partially covered lines are also kept per file,
+in .coverage-results/best/files.json, and every report lists the files that
+regressed compared with them, and which of their lines did, even when the
+totals improved. The same list is written to
+.coverage-results/file-regressions.json. See trialcoverage/filediff.py.
+
+With TRIALCOVERAGE_TEST_IMPACT=1 the reporter also records which lines each
+test executed, in .coverage-results/test-impact.json. See
+trialcoverage/testimpact.py for how to use that to run only the tests that a
+change affects.
+
+Before the tests run, the reporter imports every .py file in the packages
+under the current directory, so that the import-time statements of modules
+that no test imports still count as covered. That can be slow and runs each
+module's import-time side effects. With TRIALCOVERAGE_IMPORT_ALL=static
+nothing is imported; instead the files that were never executed are found by
+walking the package directories, listed in the report, and counted with all
+of their statements uncovered. TRIALCOVERAGE_IMPORT_ALL=none skips both.
+
+Finding the packages and their modules needs a listing of every package
+directory. Those listings are cached in .coverage-results/discovery-cache.pickle
+and a directory is only listed again when its mtime has changed. Set
+TRIALCOVERAGE_DISCOVERY_CACHE=0 to always list everything.
+
+With TRIALCOVERAGE_ADAPTIVE=N the reporter checks every N tests which of the
+files executed since the last check are fully covered (all statements and
+both ways of every branch), and stops tracing those for the rest of the run.
+That cuts the tracing overhead of long suites without changing the totals.
+It is ignored with TRIALCOVERAGE_TEST_IMPACT=1, TRIALCOVERAGE_ORDER=1 or
+TRIALCOVERAGE_STOP_EARLY=1, which need every test's full data. See
+trialcoverage/saturation.py.
+
+With TRIALCOVERAGE_ORDER=1 the reporter works out an order of the tests which
+front-loads coverage, and with TRIALCOVERAGE_STOP_EARLY=1 it stops the run as
+soon as coverage matches the best run. See trialcoverage/testorder.py.
+
+With TRIALCOVERAGE_EVENTS=1 the reporter also writes a JSON-lines log of
+each test's outcome, duration and newly covered lines and arcs, and finally
+the totals and the verdict, to .coverage-results/events.jsonl as the run
+goes. See trialcoverage/events.py.
+
+For quick local iteration, python -m trialcoverage.watch runs the tests once
+and then, each time a file changes, re-runs only the tests that executed it
+and prints the verdict for the whole suite. See trialcoverage/watch.py.
+
+With TRIALCOVERAGE_TIMINGS=1 the reporter times each test and the coverage
+work done around it, prints the TRIALCOVERAGE_TIMINGS_TOP (default 10)
+slowest tests and the tests with the most coverage overhead, and merges the
+results into .coverage-results/timings.json, from which python -m
+trialcoverage.sharding splits the suite into shards of about the same
+duration (see trialcoverage/sharding.py). TRIALCOVERAGE_CPROFILE=PATTERNS and
+TRIALCOVERAGE_CPROFILE_SLOWEST=N run some of the tests under cProfile as
+well; see trialcoverage/profiling.py.
+
+With TRIALCOVERAGE_SAMPLE=K the reporter measures one of K slots of the
+source files on each run, rotating to the next slot with each new version
+stamp, and estimates the totals of the whole tree, with confidence bounds,
+from that sample. The verdict is then a probable regression, or not, against
+a baseline of sampled runs kept apart from that of full runs. See
+trialcoverage/sampling.py.
+
+With TRIALCOVERAGE_DIFF=FILE, a unified diff, or TRIALCOVERAGE_DIFF=best, for
+the changes since the best run, the reporter analyzes only the changed files
+and reports the coverage of the changed lines, and the run fails if less
+than TRIALCOVERAGE_DIFF_THRESHOLD (default 80) percent of them were tested.
+See trialcoverage/diffcover.py.
+
+Named measurement profiles in setup.cfg or .trialcoveragerc can choose
+line-only or branch tracing, the include and omit patterns, the save policy
+and the import-all policy. Each is run with its own reporter,
+--reporter=bwverbose-coverage-NAME, and has its own data file, baseline and
+history under .coverage-results/profiles/NAME/. See
+trialcoverage/profiles.py.
+
+The data of every run is added to a deduplicated history in
+.coverage-results/history/, which keeps the best run and the last
+TRIALCOVERAGE_HISTORY_KEEP (default 1000, 0 to disable) runs. Without the
+history the best run's data is kept in .coverage-results/best/.coverage
+instead. python -m trialcoverage.check --history=best (or last, or a run
+number) prints a run of the history. See trialcoverage/history.py.
 """
 
-import errno, os, shutil, sys
+import atexit, errno, fnmatch, os, random, shutil, socket, sys, time
+
+try:
+    import json
+except ImportError:
+    # Python < 2.6
+    import simplejson as json
 
 from pyutil import fileutil
 from pyutil.assertutil import precondition
 
-import twisted.trial.reporter
+from analysiscache import AnalysisCache
+from diffcover import DiffCoverage, SourceBaseline, is_measured, parse_unified_diff
+from discovery import DiscoveryIndex
+from events import VERDICTS, EventLog, count_new, outcome, outcome_counts
+from filediff import FileBaseline, diff_against_baseline, save_regressions
+from history import History
+from profiles import DEFAULT_PROFILE, IMPORT_ALL_POLICIES, Profile, ProfileError, find_profile, read_profiles, select_profile
+from profiling import TestProfiler
+from sampling import SAMPLE_VERDICTS, Sample, SampleEstimate, choose_slot, compare_estimates, file_slot
+from saturation import SaturationTracker
+from htmlreport import IncrementalHtmlReporter
+from testimpact import TestImpactIndex
+from testorder import EarlyStop, TestOrderRecorder
+from timing import TestTiming, TestTimings
+from util import acquire_lock, release_lock, replace_file, write_file_atomically
 
-import setuptools
+import twisted.trial.reporter
 
 class SummaryTextParseError(Exception): pass
 
+# Put on the PYTHONPATH of child processes with TRIALCOVERAGE_SUBPROCESS=1.
+# Found now, since __file__ may be relative to a directory that trial leaves.
+CHILDSTARTUP_DIRNAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'childstartup')
+
 # These plugins are registered via twisted/plugins/trialcoveragereporterplugin.py .
 # See the notes there for an explanation of how that works.
 
@@ -47,32 +201,62 @@ class SummaryTextParseError(Exception): pass
 
 import coverage
 
+from coverage.codeunit import code_unit_factory
+from coverage.data import CoverageData
 from coverage.report import Reporter as CoverageReporter
+from coverage.results import Numbers
 from coverage.summary import SummaryReporter as CoverageSummaryReporter
 import coverage.summary
 
-def import_all_python_files(packages):
+def find_python_files(packages, walk=None):
+    """ Yields (import_str, path) for each .py file in the given packages'
+    directories. walk defaults to the discovery cache's walk, if there is
+    one, else os.walk. """
     precondition(not isinstance(packages, basestring), "packages is required to be a sequence.", packages=packages) # common mistake
+    if walk is None:
+        if discovery is not None:
+            walk = discovery.walk
+        else:
+            walk = os.walk
     for package in packages:
         packagedir = '/'.join(package.split('.'))
 
-        for (dirpath, dirnames, filenames) in os.walk(packagedir):
+        for (dirpath, dirnames, filenames) in walk(packagedir):
             for filename in (filename for filename in filenames if filename.endswith('.py')):
                 dirs = dirpath.split("/")
                 if filename != "__init__.py":
                     dirs.append(filename[:-3])
                 import_str = "%s" % ".".join(dirs)
-                if import_str not in ("setup", __name__):
-                    try:
-                        __import__(import_str)
-                    except ImportError, le:
-                        if 'No module named' in str(le):
-                            # Oh whoops I guess that Python file we found isn't a module of this package. Nevermind.
-                            pass
-                        else:
-                            sys.stderr.write("WARNING, importing %s resulted in an ImportError %s. I'm ignoring this ImportError, as I was trying to import it only for the purpose of marking its import-time statements as covered for code-coverage accounting purposes.\n" % (import_str, le,))
-                    except Exception, le:
-                        sys.stderr.write("WARNING, importing %s resulted in an Exception %s. I'm ignoring this Exception, as I was trying to import it only for the purpose of marking its import-time statements as covered for code-coverage accounting purposes.\n" % (import_str, le,))
+                yield (import_str, os.path.join(dirpath, filename))
+
+def import_all_python_files(packages):
+    import_python_files(find_python_files(packages))
+
+def import_python_files(files):
+    """ Imports each (import_str, path) of files, ignoring errors. """
+    for (import_str, path) in files:
+        if import_str not in ("setup", __name__):
+            try:
+                __import__(import_str)
+            except ImportError, le:
+                if 'No module named' in str(le):
+                    # Oh whoops I guess that Python file we found isn't a module of this package. Nevermind.
+                    pass
+                else:
+                    sys.stderr.write("WARNING, importing %s resulted in an ImportError %s. I'm ignoring this ImportError, as I was trying to import it only for the purpose of marking its import-time statements as covered for code-coverage accounting purposes.\n" % (import_str, le,))
+            except Exception, le:
+                sys.stderr.write("WARNING, importing %s resulted in an Exception %s. I'm ignoring this Exception, as I was trying to import it only for the purpose of marking its import-time statements as covered for code-coverage accounting purposes.\n" % (import_str, le,))
+
+def find_unexecuted_python_files(cov, packages):
+    """ Returns the canonical names of the .py files in the given packages
+    that cov has no data for, without importing anything. """
+    executed = set(cov.data.executed_files())
+    unexecuted = []
+    for (import_str, path) in find_python_files(packages):
+        fname = cov.file_locator.canonical_filename(path)
+        if fname not in executed:
+            unexecuted.append(fname)
+    return unexecuted
 
 def move_if_present(src, dst):
     try:
@@ -90,6 +274,223 @@ def copy_if_present(src, dst):
         if (le.args[0] != 2 and le.args[0] != 3) or (le.args[0] != errno.ENOENT):
             raise
 
+def stop_and_collect(cov, new=False):
+    """ Like cov.stop(), but also return the data collected since
+    cov.start(), as (line_data, arc_data, new) where line_data and arc_data
+    are in the formats of coverage.collector.Collector.get_line_data() and
+    get_arc_data(). If new, new is how many of those (lines, arcs) cov had
+    no data for yet, else it is None. """
+    cov.collector.stop()
+    line_data = cov.collector.get_line_data()
+    arc_data = cov.collector.get_arc_data()
+    if new:
+        new = count_new(cov.data, line_data, arc_data)
+    else:
+        new = None
+    cov._harvest_data()
+    return (line_data, arc_data, new)
+
+def save_atomically(cov):
+    """ Write cov's data to its data file by way of a temporary file, so
+    that a reader (or a crash) never sees a partially-written .coverage
+    file. """
+    cov._harvest_data()
+    fname = cov.data.filename
+    if cov.data_suffix:
+        fname += '.' + cov.data_suffix
+    # Don't use a '.coverage.' prefix for the temporary file or else
+    # coverage's combine() would mistake it for a parallel data file.
+    tmpfname = fname + '~'
+    cov.data.write_file(tmpfname)
+    replace_file(tmpfname, fname)
+
+class SavePolicy(object):
+    """ I decide when the in-memory coverage data should be written out.
+    save_every is a number of tests (or None), save_interval is a number of
+    seconds (or None). If both are None, the data is saved after every
+    test. """
+    def __init__(self, save_every=None, save_interval=None):
+        precondition(save_every is None or save_every >= 1, save_every=save_every)
+        precondition(save_interval is None or save_interval >= 0, save_interval=save_interval)
+        if save_every is None and save_interval is None:
+            save_every = 1
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.saved(time.time())
+
+    def is_buffered(self):
+        return self.save_every != 1
+
+    def saved(self, now):
+        self.tests_since_save = 0
+        self.last_save = now
+
+    def test_finished(self, now):
+        """ Returns True if the data should be saved now. """
+        self.tests_since_save += 1
+        if self.save_every is not None and self.tests_since_save >= self.save_every:
+            return True
+        if self.save_interval is not None and (now - self.last_save) >= self.save_interval:
+            return True
+        return False
+
+def merge_coverage_data(lines, arcs, newlines, newarcs):
+    """ Union newlines and newarcs into lines and arcs. All four are in
+    the in-memory format of coverage.data.CoverageData, i.e. { filename: {
+    lineno-or-arc: None } }. """
+    for filename, file_data in newlines.iteritems():
+        lines.setdefault(filename, {}).update(file_data)
+    for filename, file_data in newarcs.iteritems():
+        arcs.setdefault(filename, {}).update(file_data)
+
+def read_and_merge_data_files(fnames):
+    """ Read the given coverage data files and return the union of their
+    data, as a (lines, arcs) pair in the format of
+    coverage.data.CoverageData.line_data() and arc_data(). """
+    lines, arcs = {}, {}
+    reader = CoverageData()
+    for fname in fnames:
+        newlines, newarcs = reader._read_file(fname)
+        merge_coverage_data(lines, arcs, newlines, newarcs)
+    return (dict([(f, l.keys()) for (f, l) in lines.iteritems()]),
+            dict([(f, a.keys()) for (f, a) in arcs.iteritems()]))
+
+def parallel_read_and_merge_data_files(fnames, processes=None):
+    """ Like read_and_merge_data_files(), but divide the files among a pool
+    of processes which each merge their share, and then merge the partial
+    results. Since merging is a set union the result is the same as
+    reading the files one after another. """
+    try:
+        import multiprocessing
+    except ImportError:
+        multiprocessing = None
+    if processes is None and multiprocessing is not None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes or 1, len(fnames))
+    if multiprocessing is None or processes < 2:
+        return read_and_merge_data_files(fnames)
+
+    chunks = [fnames[i::processes] for i in range(processes)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        partials = pool.map(read_and_merge_data_files, chunks)
+    finally:
+        pool.close()
+        pool.join()
+
+    lines, arcs = {}, {}
+    for (partlines, partarcs) in partials:
+        for filename, linenos in partlines.iteritems():
+            lines.setdefault(filename, {}).update(dict.fromkeys(linenos))
+        for filename, arcpairs in partarcs.iteritems():
+            arcs.setdefault(filename, {}).update(dict.fromkeys(arcpairs))
+    return (dict([(f, l.keys()) for (f, l) in lines.iteritems()]),
+            dict([(f, a.keys()) for (f, a) in arcs.iteritems()]))
+
+def list_data_files(datafname):
+    """ Returns the data files named datafname plus a suffix. """
+    prefix = os.path.basename(datafname) + '.'
+    # Names ending in '~' are temporary files still being written by
+    # save_atomically().
+    dirname = os.path.dirname(datafname)
+    return [os.path.join(dirname, fname) for fname in sorted(os.listdir(dirname)) if fname.startswith(prefix) and not fname.endswith('~')]
+
+def list_parallel_data_files():
+    return list_data_files(PARALLEL_DATA_FNAME)
+
+def combine_parallel_data(cov, processes=None, fname=None):
+    """ Merge all of the per-process data files under .coverage-results,
+    plus any existing fname (by default .coverage), into fname and into
+    cov's in-memory data, then remove the per-process files. """
+    if fname is None:
+        fname = COVERAGE_FNAME
+    lockfname = fname + '.lock'
+    acquire_lock(lockfname)
+    try:
+        fnames = list_parallel_data_files()
+        lines, arcs = parallel_read_and_merge_data_files(fnames + [fname], processes)
+        cov.data.add_line_data(dict([(f, dict.fromkeys(l)) for (f, l) in lines.iteritems()]))
+        cov.data.add_arc_data(dict([(f, dict.fromkeys(a)) for (f, a) in arcs.iteritems()]))
+        tmpfname = fname + '~'
+        cov.data.write_file(tmpfname)
+        replace_file(tmpfname, fname)
+        for fname in fnames:
+            fileutil.remove_if_possible(fname)
+    finally:
+        release_lock(lockfname)
+    return len(fnames)
+
+def enable_subprocess_coverage(include, omit, branch, environ=None):
+    """ Make the Python child processes which inherit environ (by default
+    os.environ) measure coverage of include and omit too. See
+    trialcoverage/childstartup/sitecustomize.py. Returns the values that
+    it replaced, for disable_subprocess_coverage(). """
+    if environ is None:
+        environ = os.environ
+    saved = dict([(k, environ.get(k)) for k in ('PYTHONPATH', 'TRIALCOVERAGE_SUBPROCESS_CONFIG')])
+    pythonpath = environ.get('PYTHONPATH')
+    if pythonpath:
+        environ['PYTHONPATH'] = CHILDSTARTUP_DIRNAME + os.pathsep + pythonpath
+    else:
+        environ['PYTHONPATH'] = CHILDSTARTUP_DIRNAME
+    # The children may run in another directory.
+    config = {'data_file': SUBPROCESS_DATA_FNAME,
+              'include': [os.path.abspath(p) for p in include or []],
+              'omit': [os.path.abspath(p) for p in omit or []],
+              'branch': branch}
+    environ['TRIALCOVERAGE_SUBPROCESS_CONFIG'] = json.dumps(config)
+    return saved
+
+def disable_subprocess_coverage(saved, environ=None):
+    """ Put back the values of environ (by default os.environ) that
+    enable_subprocess_coverage() replaced. """
+    if environ is None:
+        environ = os.environ
+    for (k, v) in saved.iteritems():
+        if v is None:
+            environ.pop(k, None)
+        else:
+            environ[k] = v
+
+def restore_environ():
+    """ Undo what start_coverage() did to os.environ, so that the child
+    processes started after the run, and later runs in this process, don't
+    inherit it. """
+    global subprocess_environ
+    if subprocess_environ is not None:
+        disable_subprocess_coverage(subprocess_environ)
+        subprocess_environ = None
+
+def merge_subprocess_data(cov, processes=None):
+    """ Merge the data files written by child processes into cov's
+    in-memory data, and remove them. Returns how many there were. """
+    # Not in the same directory as the data files, or it would look like one.
+    lockfname = os.path.dirname(SUBPROCESS_DATA_FNAME) + '.lock'
+    acquire_lock(lockfname)
+    try:
+        fnames = list_data_files(SUBPROCESS_DATA_FNAME)
+        if fnames:
+            lines, arcs = parallel_read_and_merge_data_files(fnames, processes)
+            cov.data.add_line_data(dict([(f, dict.fromkeys(l)) for (f, l) in lines.iteritems()]))
+            cov.data.add_arc_data(dict([(f, dict.fromkeys(a)) for (f, a) in arcs.iteritems()]))
+            for fname in fnames:
+                fileutil.remove_if_possible(fname)
+    finally:
+        release_lock(lockfname)
+    return len(fnames)
+
+def save_timings(timings):
+    """ Merge timings into TIMINGS_FNAME, which processes running other
+    parts of the suite may be updating too. """
+    lockfname = TIMINGS_FNAME + '.lock'
+    acquire_lock(lockfname)
+    try:
+        merged = TestTimings.load(TIMINGS_FNAME)
+        merged.update(timings)
+        merged.save(TIMINGS_FNAME)
+    finally:
+        release_lock(lockfname)
+
 def parse_out_unc_and_part(summarytxt):
     for line in summarytxt.split('\n'):
         if line.startswith('Name'):
@@ -107,62 +508,183 @@ def parse_out_unc_and_part(summarytxt):
             return (int(linesplit[missix]), int(linesplit[brpartix]))
     raise SummaryTextParseError("Control shouldn't have reached here because there should have been a line that started with 'TOTAL'. The full summary text was %r." % (summarytxt,))
 
+def compare_with_best(curunc, curpart, best):
+    """ Returns what ProgressionReporter.coverage_progressed() would for a
+    run which left curunc lines uncovered and curpart lines partially
+    covered, best being the (uncovered, partial) of the best-ever run, or
+    None if there isn't one. """
+    if best is None:
+        return 1
+    (bestunc, bestpart) = best
+    curtot, besttot = curunc + curpart, bestunc + bestpart
+    if (curtot == besttot) and (curunc == bestunc):
+        return 2
+    if (curtot <= besttot) and (curunc <= bestunc):
+        return 3
+    else:
+        return 0
+
 class ProgressionReporter(CoverageReporter):
     """A reporter for testing whether your coverage is improving or degrading. """
 
-    def __init__(self, coverage, show_missing=False, ignore_errors=False):
+    def __init__(self, coverage, show_missing=False, ignore_errors=False, analysis_cache=None):
         super(ProgressionReporter, self).__init__(coverage, ignore_errors)
         self.summary_reporter = CoverageSummaryReporter(coverage, show_missing=show_missing, ignore_errors=ignore_errors)
+        if analysis_cache is None and ANALYSIS_CACHE_SIZE:
+            analysis_cache = AnalysisCache(ANALYSIS_CACHE_FNAME, ANALYSIS_CACHE_SIZE)
+        self.analysis_cache = analysis_cache
+        self.file_regressions = []
+
+    def analyze(self, cu):
+        if self.analysis_cache is None:
+            return self.coverage._analyze(cu)
+        return self.analysis_cache.analyze(self.coverage, cu)
 
     def coverage_progressed(self):
         """ Returns 0 if coverage has regressed, 1 if there was no
         existing best-coverage summary, 2 if coverage is the same as
         the existing best-coverage summary, 3 if coverage is improved
         compared to the existing best-coverage summary. """
+        if hasattr(self, 'sample_progression'):
+            return self.sample_progression
+        if hasattr(self, 'diff_coverage'):
+            if self.diff_coverage.passes(self.diff_threshold):
+                return 2
+            return 0
         if not hasattr(self, 'bestunc'):
             return 1
+        return compare_with_best(self.curunc, self.curpart, (self.bestunc, self.bestpart))
 
-        if (self.curtot == self.besttot) and (self.curunc == self.bestunc):
-            return 2
-
-        if (self.curtot <= self.besttot) and (self.curunc <= self.bestunc):
-            return 3
-        else:
-            return 0
-
-    def report(self, morfs, omit=None, outfile=None, include=None):
-        """Writes a report summarizing progression/regression."""
-        # First we use our summary_reporter to generate a text summary of the current version.
-        if outfile is None:
-            outfile = SUMMARY_FNAME
-        outfileobj = open(outfile, "w")
-        self.summary_reporter.report(morfs, omit=omit, outfile=outfileobj, include=include)
-        outfileobj.close()
-
-        self.curunc, self.curpart = parse_out_unc_and_part(fileutil.read_file(SUMMARY_FNAME, mode='rU'))
-        self.curtot = self.curunc + self.curpart
+    def compute_totals(self, morfs, omit=None, include=None):
+        """ Analyze each measured file once and return the summed
+        coverage.results.Numbers. """
+        self.find_code_units(morfs, omit, include)
+        total = Numbers()
+        self.file_numbers = {}
+        self.analyses = {}
+        for cu in self.code_units:
+            try:
+                analysis = self.analyze(cu)
+                nums = analysis.numbers
+                self.analyses[cu.filename] = analysis
+                self.file_numbers[cu.filename] = nums
+                total += nums
+            except KeyboardInterrupt:
+                raise
+            except Exception, le:
+                if not self.ignore_errors:
+                    sys.stderr.write("WARNING, got exception while analyzing %s: %s\n" % (cu.name, le,))
+        if self.analysis_cache is not None:
+            try:
+                self.analysis_cache.save()
+            except EnvironmentError, le:
+                sys.stderr.write("WARNING, could not write analysis cache: %s\n" % (le,))
+        return total
 
-        # Then we see if there is a previous best version and if so what its count of uncovered and partially covered lines was.
+    def read_best_totals(self):
+        """ Returns (uncovered, partial) from the best-ever run, or None if
+        there isn't one. Falls back to scraping the text summary that
+        earlier versions of this tool stored. """
         try:
-            self.bestunc, self.bestpart = parse_out_unc_and_part(fileutil.read_file(BEST_SUMMARY_FNAME, mode='rU'))
+            best = json.loads(fileutil.read_file(BEST_TOTALS_FNAME, mode='rU'))
+            return (int(best['uncovered']), int(best['partial']))
         except IOError, le:
             # Ignore "No such file or directory", report and ignore any other error.
-            if (le.args[0] != 2 and le.args[0] != 3) or (le.args[0] != errno.ENOENT):
+            if le.args[0] != errno.ENOENT:
+                sys.stderr.write("WARNING, got unexpected IOError from attempt to read best-ever totals file: %s\n" % (le,))
+        except (ValueError, KeyError, TypeError), le:
+            sys.stderr.write("WARNING, could not parse best-ever totals file %s: %s\n" % (BEST_TOTALS_FNAME, le,))
+            return None
+
+        try:
+            return parse_out_unc_and_part(fileutil.read_file(BEST_SUMMARY_FNAME, mode='rU'))
+        except IOError, le:
+            if le.args[0] != errno.ENOENT:
                 sys.stderr.write("WARNING, got unexpected IOError from attempt to read best-ever summary file: %s\n" % (le,))
-            pass
         except SummaryTextParseError, le:
             sys.stderr.write("WARNING, got unexpected SummaryTextParseError from attempt to read best-ever summary file: %s\n" % (le,))
-            pass
-        else:
+        return None
+
+    def report_file_regressions(self):
+        """ Lists the files which regressed compared with the per-file
+        baseline of the best run, if there is one. """
+        self.file_regressions = []
+        baseline = FileBaseline.load(BEST_FILES_FNAME)
+        if baseline is None:
+            return
+        self.file_regressions = diff_against_baseline(baseline, self.analyses.values())
+        try:
+            save_regressions(FILE_REGRESSIONS_FNAME, self.file_regressions)
+        except EnvironmentError, le:
+            sys.stderr.write("WARNING, could not write per-file regressions: %s\n" % (le,))
+        if self.file_regressions:
+            sys.stdout.write("%d files regressed compared with the previous best coverage:\n" % (len(self.file_regressions),))
+            for r in self.file_regressions:
+                sys.stdout.write("  %s\n" % (r.describe(),))
+
+    def record_history(self, total, progression):
+        """ Returns the number of the run in the history, or None if it
+        wasn't recorded. """
+        if not HISTORY_KEEP:
+            return None
+        try:
+            version = fileutil.read_file(VERSION_STAMP_FNAME, mode='rU').strip()
+        except EnvironmentError:
+            version = None
+        totals = {'uncovered': self.curunc, 'partial': self.curpart, 'statements': total.n_statements, 'branches': total.n_branches, 'files': total.n_files}
+        try:
+            return History(HISTORY_DIRNAME, HISTORY_KEEP).record(self.coverage.data, best=(progression != 0), totals=totals, progression=progression, version=version)
+        except EnvironmentError, le:
+            sys.stderr.write("WARNING, could not record this run in the coverage history: %s\n" % (le,))
+            return None
+
+    def report(self, morfs, omit=None, outfile=None, include=None, unexecuted=None, update_baseline=True, file_diff=True):
+        """Writes a report summarizing progression/regression.
+
+        unexecuted is an optional list of source files which were never
+        imported; they are counted with all of their statements (and
+        branches) uncovered. Unless update_baseline, this run is neither
+        recorded in the history nor made the new best run. Unless
+        file_diff, the per-file baseline is only read (to list the files
+        which regressed) if the totals regressed."""
+        if unexecuted:
+            morfs = (morfs or self.coverage.data.executed_files()) + list(unexecuted)
+        total = self.total = self.compute_totals(morfs, omit=omit, include=include)
+        self.curunc, self.curpart = total.n_missing, total.n_missing_branches
+        self.curtot = self.curunc + self.curpart
+
+        # The text summary is only for humans, so only render it if asked.
+        if outfile is not None or WRITE_SUMMARY:
+            if outfile is None:
+                outfile = SUMMARY_FNAME
+            outfileobj = open(outfile, "w")
+            try:
+                self.summary_reporter.report(morfs, omit=omit, outfile=outfileobj, include=include)
+            finally:
+                outfileobj.close()
+
+        # Then we see if there is a previous best version and if so what its count of uncovered and partially covered lines was.
+        best = self.read_best_totals()
+        if best is not None:
+            self.bestunc, self.bestpart = best
             self.besttot = (self.bestunc + self.bestpart)
 
         progression = self.coverage_progressed()
+        self.verdict = VERDICTS[progression]
         sys.stdout.write("\n"+"-"*79+"\n")
         sys.stdout.write("code coverage summary\n")
+        if unexecuted:
+            unexecuted_numbers = [(fname, self.file_numbers[fname]) for fname in sorted(unexecuted) if fname in self.file_numbers]
+            sys.stdout.write("%d files were never imported (%d statements, counted as uncovered):\n" % (len(unexecuted_numbers), sum([nums.n_statements for (fname, nums) in unexecuted_numbers])))
+            for (fname, nums) in unexecuted_numbers:
+                sys.stdout.write("  %s (%d statements)\n" % (fname, nums.n_statements))
         if progression == 0:
             sys.stdout.write("WARNING code coverage regression\n")
             sys.stdout.write("Previous best coverage left %d total lines untested (%d lines uncovered and %d lines partially covered).\n" % (self.besttot, self.bestunc, self.bestpart))
             sys.stdout.write("Current coverage left %d total lines untested (%d lines uncovered and %d lines partially covered).\n" % (self.curtot, self.curunc, self.curpart))
+            self.report_file_regressions()
+            if update_baseline:
+                self.record_history(total, progression)
             return progression
 
         if progression == 1:
@@ -177,38 +699,335 @@ class ProgressionReporter(CoverageReporter):
             sys.stdout.write("Previous best coverage left %d total lines untested (%d lines uncovered and %d lines partially covered).\n" % (self.besttot, self.bestunc, self.bestpart))
             sys.stdout.write("Current coverage left %d total lines untested (%d lines uncovered and %d lines partially covered).\n" % (self.curtot, self.curunc, self.curpart))
 
-        shutil.copy2(COVERAGE_FNAME, BEST_COVERAGE_FNAME)
-        shutil.copy2(SUMMARY_FNAME, BEST_SUMMARY_FNAME)
+        if file_diff:
+            self.report_file_regressions()
+        if not update_baseline:
+            return progression
+        if self.record_history(total, progression) is None:
+            # Without the history, keep a copy of the best run's data.
+            self.coverage.data.write_file(BEST_COVERAGE_FNAME + '~')
+            replace_file(BEST_COVERAGE_FNAME + '~', BEST_COVERAGE_FNAME)
+        else:
+            # The best run's data now lives in the history store.
+            fileutil.remove_if_possible(BEST_COVERAGE_FNAME)
+        write_file_atomically(BEST_TOTALS_FNAME, json.dumps({'uncovered': self.curunc, 'partial': self.curpart, 'statements': total.n_statements, 'branches': total.n_branches, 'files': total.n_files}), mode='w')
+        FileBaseline.from_analyses(self.analyses.values()).save(BEST_FILES_FNAME)
+        SourceBaseline.from_files(self.analyses.keys()).save(BEST_SOURCES_FNAME)
+        if WRITE_SUMMARY:
+            copy_if_present(SUMMARY_FNAME, BEST_SUMMARY_FNAME)
+        else:
+            # Don't leave a stale summary behind to contradict totals.json.
+            fileutil.remove_if_possible(BEST_SUMMARY_FNAME)
         copy_if_present(VERSION_STAMP_FNAME, BEST_VERSION_STAMP_FNAME)
         return progression
 
+    def report_sample(self, sample, omit=None, include=None, update_baseline=True):
+        """ Like report(), but for a run which measured only the files of
+        sample, a sampling.Sample: writes the estimated totals of the whole
+        tree and compares them with the sampled baseline. """
+        total = self.total = self.compute_totals(sample.files, omit=omit, include=include)
+        estimate = self.estimate = SampleEstimate.from_numbers(self.file_numbers.values(), sample.population)
+        self.curunc = int(round(estimate.uncovered))
+        self.curpart = int(round(estimate.untested)) - self.curunc
+        self.curtot = self.curunc + self.curpart
+        best = SampleEstimate.load(SAMPLE_BEST_FNAME)
+        progression = self.sample_progression = compare_estimates(estimate, best)
+        self.verdict = SAMPLE_VERDICTS[progression]
+
+        sys.stdout.write("\n"+"-"*79+"\n")
+        sys.stdout.write("code coverage summary of sample %d of %d (%d files, %d lines untested)\n" % (sample.slot, sample.slots, total.n_files, total.n_missing + total.n_missing_branches))
+        if progression == 0:
+            sys.stdout.write("WARNING probable code coverage regression\n")
+        elif progression == 1:
+            sys.stdout.write("There was no previous sampled code-coverage baseline found.\n")
+        elif progression == 2:
+            sys.stdout.write("code coverage unchanged within the sampling error\n")
+        elif progression == 3:
+            sys.stdout.write("probable code coverage improvement!\n")
+        if best is not None:
+            sys.stdout.write("Previous sampled coverage left %s.\n" % (best.describe(),))
+        sys.stdout.write("Current sampled coverage left %s.\n" % (estimate.describe(),))
+        # The files of the sample can be compared exactly with the last full
+        # run.
+        self.report_file_regressions()
+        if update_baseline and progression != 0:
+            estimate.save(SAMPLE_BEST_FNAME)
+        return progression
+
+    def report_diff(self, changed, threshold):
+        """ Analyzes only the files in changed, { filename: set of changed
+        lines }, and writes the coverage of the changed lines. Returns the
+        diffcover.DiffCoverage. """
+        self.analyses = {}
+        self.file_numbers = {}
+        total = Numbers()
+        for cu in code_unit_factory(sorted(changed), self.coverage.file_locator):
+            try:
+                analysis = self.analyze(cu)
+            except KeyboardInterrupt:
+                raise
+            except Exception, le:
+                sys.stderr.write("WARNING, got exception while analyzing %s: %s\n" % (cu.name, le,))
+                continue
+            self.analyses[cu.filename] = analysis
+            self.file_numbers[cu.filename] = analysis.numbers
+            total += analysis.numbers
+        self.total = total
+        if self.analysis_cache is not None:
+            try:
+                self.analysis_cache.save()
+            except EnvironmentError, le:
+                sys.stderr.write("WARNING, could not write analysis cache: %s\n" % (le,))
+        dc = self.diff_coverage = DiffCoverage.from_analyses(self.analyses.values(), changed)
+        self.diff_threshold = threshold
+        self.curunc = sum([len(f.missing) for f in dc.files])
+        self.curpart = sum([len(f.partial) for f in dc.files])
+        self.curtot = self.curunc + self.curpart
+        if dc.passes(threshold):
+            self.verdict = 'diff-passes'
+        else:
+            self.verdict = 'diff-below-threshold'
+        sys.stdout.write("\n"+"-"*79+"\n")
+        sys.stdout.write("code coverage summary of the changed lines\n")
+        dc.report(sys.stdout, threshold)
+        return dc
+
+def write_html_report(pr):
+    """ Writes the HTML report for the files that the ProgressionReporter
+    pr analyzed. """
+    hr = IncrementalHtmlReporter(pr.coverage, pr.ignore_errors)
+    try:
+        hr.report_analyses(pr.analyses.values(), HTML_DIRNAME)
+    except EnvironmentError, le:
+        sys.stderr.write("WARNING, could not write the HTML report: %s\n" % (le,))
+        return
+    sys.stdout.write("HTML report written to %s (%d pages rendered, %d reused)\n" % (HTML_DIRNAME, hr.rendered, hr.reused))
+
 class CoverageTextReporter(twisted.trial.reporter.VerboseTextReporter):
     def __init__(self, *args, **kwargs):
         global cov, packages
+        if profile_error is not None:
+            raise ProfileError("coverage was not started: %s" % (profile_error,))
         twisted.trial.reporter.VerboseTextReporter.__init__(self, *args, **kwargs)
         self.pr = None
-        import_all_python_files(packages)
+        self.stopped = False
+        self.save_policy = SavePolicy(SAVE_EVERY, SAVE_INTERVAL)
+        self.tracing = False
+        if TEST_IMPACT:
+            self.impact_index = TestImpactIndex.load(TEST_IMPACT_FNAME)
+        else:
+            self.impact_index = None
+        if TIMINGS:
+            self.timings = TestTimings()
+        else:
+            self.timings = None
+        if CPROFILE or CPROFILE_SLOWEST:
+            slowest = [t.testid for t in TestTimings.load(TIMINGS_FNAME).slowest(CPROFILE_SLOWEST)]
+            self.profiler = TestProfiler(CPROFILE, slowest)
+        else:
+            self.profiler = None
+        if ANALYSIS_CACHE_SIZE:
+            self.analysis_cache = AnalysisCache(ANALYSIS_CACHE_FNAME, ANALYSIS_CACHE_SIZE)
+        else:
+            self.analysis_cache = None
+        if ORDER:
+            self.order_recorder = TestOrderRecorder()
+        else:
+            self.order_recorder = None
+        self.early_stop = None
+        self.stopped_early = None
+        if STOP_EARLY:
+            baseline = FileBaseline.load(BEST_FILES_FNAME)
+            if baseline is None:
+                sys.stderr.write("WARNING, TRIALCOVERAGE_STOP_EARLY is ignored because there is no per-file baseline yet\n")
+            else:
+                self.early_stop = EarlyStop(cov, baseline, self.analysis_cache)
+        # These need all of the lines and arcs that each test executed.
+        fulltracing = [name for (name, user) in [('TRIALCOVERAGE_TEST_IMPACT', self.impact_index), ('TRIALCOVERAGE_ORDER', self.order_recorder),
+                                                 ('TRIALCOVERAGE_STOP_EARLY', self.early_stop)] if user is not None]
+        if ADAPTIVE and not fulltracing:
+            self.saturation = SaturationTracker(cov, self.analysis_cache)
+            self.tests_since_check = 0
+        else:
+            if ADAPTIVE:
+                sys.stderr.write("WARNING, TRIALCOVERAGE_ADAPTIVE is ignored because %s %s every test to be traced\n" % (" and ".join(fulltracing), len(fulltracing) == 1 and "needs" or "need"))
+            self.saturation = None
+        if EVENTS:
+            self.events = EventLog(EVENTS_FILE or EVENTS_FNAME, append=PARALLEL, max_buffered=EVENTS_BUFFER, interval=EVENTS_INTERVAL)
+            self.events.write({'event': 'start', 'time': time.time(), 'pid': os.getpid(), 'profile': PROFILE.name})
+            atexit.register(self.events.close)
+        else:
+            self.events = None
+        self.collect_per_test = (self.impact_index is not None or self.timings is not None or self.saturation is not None
+                                 or self.order_recorder is not None or self.early_stop is not None or self.events is not None)
+        if IMPORT_ALL == 'import':
+            import_all_python_files(packages)
+            save_discovery_index()
         cov.stop() # It was started when this module was imported.
-        cov.save()
+        save_atomically(cov)
+        if self.early_stop is not None:
+            # Some files are only executed by being imported.
+            self.early_stop.executed(cov.data.executed_files())
+        self.save_policy.saved(time.time())
+        # The data we just loaded and saved stays in memory from now on, so
+        # don't let cov.start() re-read the data file before each test.
+        cov.auto_data = False
+        if self.save_policy.is_buffered():
+            atexit.register(self.flush_coverage_at_exit)
 
     def startTest(self, test):
+        started = time.time()
         res = twisted.trial.reporter.VerboseTextReporter.startTest(self, test)
+        before = time.time()
         cov.start()
+        self.tracing = True
+        self.test_started = started
+        if self.timings is not None:
+            self.timing = TestTiming(test.id())
+            self.timing.start = time.time() - before
+        if self.events is not None:
+            self.outcome_counts = outcome_counts(self)
+        if self.profiler is not None and self.profiler.wants(test.id()):
+            self.profiler.start(test.id())
         # print "%s.startTest(%s) self.collector._collectors: %s" % (self, test, cov.collector._collectors)
         return res
 
     def stopTest(self, test):
         res = twisted.trial.reporter.VerboseTextReporter.stopTest(self, test)
         # print "%s.stopTest(%s) self.collector._collectors: %s" % (self, test, cov.collector._collectors)
-        cov.stop()
-        cov.save()
+        if self.profiler is not None:
+            self.profiler.stop()
+        before = time.time()
+        if self.collect_per_test:
+            (line_data, arc_data, new) = stop_and_collect(cov, new=(self.events is not None))
+            self.collected(test, line_data, arc_data)
+            if self.events is not None:
+                self.events.write({'event': 'test', 'id': test.id(), 'outcome': outcome(self.outcome_counts, outcome_counts(self)),
+                                   'seconds': before - self.test_started, 'new_lines': new[0], 'new_arcs': new[1]}, before)
+        else:
+            cov.stop()
+        self.tracing = False
+        if self.saturation is not None:
+            self.saturation.executed(line_data)
+            self.tests_since_check += 1
+            if self.tests_since_check >= ADAPTIVE:
+                self.saturation.check()
+                self.tests_since_check = 0
+        after = time.time()
+        if self.save_policy.test_finished(after):
+            self.flush_coverage()
+        if self.timings is not None:
+            timing = self.timing
+            timing.stop = after - before
+            timing.save = time.time() - after
+            timing.lines = sum([len(lines) for lines in line_data.itervalues()])
+            timing.arcs = sum([len(arcs) for arcs in arc_data.itervalues()])
+            timing.wall = time.time() - self.test_started
+            self.timings.add(timing)
+        if self.order_recorder is not None:
+            self.order_recorder.record(test.id(), before - self.test_started, line_data, arc_data)
+        if self.early_stop is not None and self.stopped_early is None:
+            self.early_stop.executed(line_data)
+            if self.early_stop.matched():
+                self.stopped_early = self.testsRun
+                self.stop()
         return res
 
+    def collected(self, test, line_data, arc_data):
+        """ Called with the data collected while test ran, if
+        collect_per_test. """
+        if self.impact_index is not None:
+            self.impact_index.record(test.id(), line_data)
+
+    def flush_coverage(self):
+        save_atomically(cov)
+        self.save_policy.saved(time.time())
+
+    def flush_coverage_at_exit(self):
+        """ If the run was aborted before stop_coverage, write out whatever
+        is still buffered in memory. """
+        if self.stopped:
+            return
+        try:
+            if self.tracing:
+                cov.stop()
+                self.tracing = False
+            self.flush_coverage()
+        except Exception, le:
+            sys.stderr.write("WARNING, got exception while saving coverage data at exit: %s\n" % (le,))
+
     def stop_coverage(self):
-        sys.stdout.write("Coverage results written to %s\n" % (COVERAGE_FNAME,))
+        restore_environ()
+        if SUBPROCESS:
+            merged = merge_subprocess_data(cov)
+            sys.stdout.write("Merged the coverage data of %d child processes\n" % (merged,))
+        self.flush_coverage()
+        self.stopped = True
+        if self.impact_index is not None:
+            self.impact_index.save(TEST_IMPACT_FNAME)
+        if self.timings is not None:
+            save_timings(self.timings)
+            sys.stdout.write("\n")
+            self.timings.report(sys.stdout, TIMINGS_TOP)
+        if sample is not None or PARALLEL:
+            sys.stdout.write("Coverage results written to %s\n" % (cov.data.filename + (cov.data_suffix and '.' + cov.data_suffix or ''),))
+        else:
+            sys.stdout.write("Coverage results written to %s\n" % (COVERAGE_FNAME,))
         assert self.pr is None, self.pr
-        self.pr = ProgressionReporter(cov)
-        self.pr.report(None)
+        if self.order_recorder is not None:
+            self.order_recorder.save(TEST_ORDER_FNAME)
+        if self.stopped_early is not None:
+            sys.stdout.write("Stopped the run after %d tests: every file of the best run was executed and coverage already matches it\n" % (self.stopped_early,))
+        if self.saturation is not None:
+            sys.stdout.write("Stopped tracing %d files once they were fully covered\n" % (len(self.saturation.saturated),))
+        if PARALLEL:
+            # The other processes may still be running, so only the step which
+            # combines the data of all of them reports on it.
+            sys.stdout.write("Once every process has finished, run python -m trialcoverage.check --combine to combine their data and compare it with the best run\n")
+            if self.events is not None:
+                self.events.write({'event': 'end', 'time': time.time(), 'tests': self.testsRun})
+                self.events.close()
+            self.report_profile()
+            return
+        self.pr = ProgressionReporter(cov, analysis_cache=self.analysis_cache)
+        if DIFF:
+            if DIFF == 'best':
+                diff = None
+            else:
+                diff = fileutil.read_file(DIFF, mode='rU')
+            self.pr.report_diff(find_changed_lines(cov, diff), DIFF_THRESHOLD)
+            progression = self.pr.coverage_progressed()
+        elif sample is not None:
+            # The sample's files are all analyzed whether they were
+            # executed or not.
+            progression = self.pr.report_sample(sample)
+        elif IMPORT_ALL == 'static':
+            progression = self.pr.report(None, unexecuted=find_unexecuted_python_files(cov, packages))
+            save_discovery_index()
+        else:
+            progression = self.pr.report(None)
+        if self.events is not None:
+            total = self.pr.total
+            self.events.write({'event': 'end', 'time': time.time(), 'tests': self.testsRun, 'uncovered': self.pr.curunc, 'partial': self.pr.curpart,
+                               'statements': total.n_statements, 'branches': total.n_branches, 'files': total.n_files,
+                               'progression': progression, 'verdict': self.pr.verdict})
+            self.events.close()
+        if HTML:
+            if DIFF or sample is not None:
+                # The report would lose the pages of the files which
+                # weren't analyzed.
+                sys.stdout.write("The HTML report in %s was left as it was, since this run only analyzed some of the files\n" % (HTML_DIRNAME,))
+            else:
+                write_html_report(self.pr)
+        self.report_profile()
+
+    def report_profile(self):
+        if self.profiler is not None:
+            try:
+                self.profiler.save(CPROFILE_DIRNAME, CPROFILE_FNAME)
+            except EnvironmentError, le:
+                sys.stderr.write("WARNING, could not write the cProfile stats: %s\n" % (le,))
+            self.profiler.report(sys.stdout, TIMINGS_TOP)
 
     def printSummary(self):
         # for twisted-2.5.x
@@ -221,39 +1040,245 @@ class CoverageTextReporter(twisted.trial.reporter.VerboseTextReporter):
         return twisted.trial.reporter.VerboseTextReporter.done(self)
 
     def wasSuccessful(self):
+        if self.pr is None:
+            # A process of a parallel run, which doesn't judge coverage.
+            return super(CoverageTextReporter, self).wasSuccessful()
         return super(CoverageTextReporter, self).wasSuccessful() and self.pr.coverage_progressed()
 
 def init_paths():
-    global RES_DIRNAME, RES_FULLDIRNAME, COVERAGE_FNAME, BEST_DIRNAME, BEST_COVERAGE_FNAME, SUMMARY_FNAME, BEST_SUMMARY_FNAME, VERSION_STAMP_FNAME, BEST_VERSION_STAMP_FNAME
+    global RES_DIRNAME, RES_FULLDIRNAME, PROFILE_DIRNAME, COVERAGE_FNAME, BEST_DIRNAME, BEST_COVERAGE_FNAME, SUMMARY_FNAME, BEST_SUMMARY_FNAME, VERSION_STAMP_FNAME, BEST_VERSION_STAMP_FNAME, PARALLEL_DATA_FNAME, BEST_TOTALS_FNAME, ANALYSIS_CACHE_FNAME, TEST_IMPACT_FNAME, DISCOVERY_FNAME, TIMINGS_FNAME, HISTORY_DIRNAME, BEST_FILES_FNAME, FILE_REGRESSIONS_FNAME, HTML_DIRNAME, TEST_ORDER_FNAME, CPROFILE_DIRNAME, CPROFILE_FNAME, EVENTS_FNAME, SUBPROCESS_DATA_FNAME, SAMPLE_DIRNAME, SAMPLE_STATE_FNAME, SAMPLE_BEST_FNAME, BEST_SOURCES_FNAME
 
     # We keep our notes about previous best code-coverage results in a
     # folder named ".coverage-results".
     RES_DIRNAME='.coverage-results'
     RES_FULLDIRNAME=os.path.realpath(os.path.abspath(os.path.expanduser(RES_DIRNAME)))
     fileutil.make_dirs(RES_FULLDIRNAME)
-    COVERAGE_FNAME=os.path.join(os.path.abspath(os.getcwd()), '.coverage')
-    BEST_DIRNAME=os.path.join(RES_FULLDIRNAME, 'best')
+    # Each profile other than the default one keeps its data, baseline and
+    # history apart, so that they are never mixed with another profile's.
+    if PROFILE.name == DEFAULT_PROFILE:
+        PROFILE_DIRNAME=RES_FULLDIRNAME
+        COVERAGE_FNAME=os.path.join(os.path.abspath(os.getcwd()), '.coverage')
+    else:
+        PROFILE_DIRNAME=os.path.join(RES_FULLDIRNAME, 'profiles', PROFILE.name)
+        fileutil.make_dirs(PROFILE_DIRNAME)
+        COVERAGE_FNAME=os.path.join(PROFILE_DIRNAME, '.coverage')
+    BEST_DIRNAME=os.path.join(PROFILE_DIRNAME, 'best')
     fileutil.make_dirs(BEST_DIRNAME)
     BEST_COVERAGE_FNAME=os.path.join(BEST_DIRNAME, '.coverage')
-    SUMMARY_FNAME=os.path.join(RES_FULLDIRNAME, 'summary.txt')
+    SUMMARY_FNAME=os.path.join(PROFILE_DIRNAME, 'summary.txt')
     BEST_SUMMARY_FNAME=os.path.join(BEST_DIRNAME, 'summary.txt')
+    BEST_TOTALS_FNAME=os.path.join(BEST_DIRNAME, 'totals.json')
+    BEST_FILES_FNAME=os.path.join(BEST_DIRNAME, 'files.json')
+    BEST_SOURCES_FNAME=os.path.join(BEST_DIRNAME, 'sources.json')
+    FILE_REGRESSIONS_FNAME=os.path.join(PROFILE_DIRNAME, 'file-regressions.json')
+    ANALYSIS_CACHE_FNAME=os.path.join(RES_FULLDIRNAME, 'analysis-cache.pickle')
+    TEST_IMPACT_FNAME=os.path.join(RES_FULLDIRNAME, 'test-impact.json')
+    TEST_ORDER_FNAME=os.path.join(RES_FULLDIRNAME, 'test-order.json')
+    DISCOVERY_FNAME=os.path.join(RES_FULLDIRNAME, 'discovery-cache.pickle')
+    TIMINGS_FNAME=os.path.join(RES_FULLDIRNAME, 'timings.json')
+    CPROFILE_DIRNAME=os.path.join(RES_FULLDIRNAME, 'cprofile')
+    CPROFILE_FNAME=os.path.join(RES_FULLDIRNAME, 'cprofile.prof')
+    HISTORY_DIRNAME=os.path.join(PROFILE_DIRNAME, 'history')
+    HTML_DIRNAME=os.path.join(PROFILE_DIRNAME, 'html')
+    EVENTS_FNAME=os.path.join(PROFILE_DIRNAME, 'events.jsonl')
     VERSION_STAMP_FNAME=os.path.join(RES_FULLDIRNAME, 'version-stamp.txt')
     BEST_VERSION_STAMP_FNAME=os.path.join(BEST_DIRNAME, 'version-stamp.txt')
+    # In parallel mode each process writes PARALLEL_DATA_FNAME plus a suffix.
+    if PROFILE.name == DEFAULT_PROFILE:
+        PARALLEL_DATA_FNAME=os.path.join(RES_FULLDIRNAME, '.coverage')
+    else:
+        # Not next to this profile's COVERAGE_FNAME, whose lock file would
+        # look like one of them.
+        PARALLEL_DATA_FNAME=os.path.join(PROFILE_DIRNAME, 'parallel', '.coverage')
+        if PARALLEL:
+            fileutil.make_dirs(os.path.dirname(PARALLEL_DATA_FNAME))
+    # Each child process writes SUBPROCESS_DATA_FNAME plus a suffix.
+    SUBPROCESS_DATA_FNAME=os.path.join(PROFILE_DIRNAME, 'subprocess', '.coverage')
+    if SUBPROCESS:
+        fileutil.make_dirs(os.path.dirname(SUBPROCESS_DATA_FNAME))
+    # A sampled run writes SAMPLE_DIRNAME/.coverage.SLOT.
+    SAMPLE_DIRNAME=os.path.join(PROFILE_DIRNAME, 'sample')
+    SAMPLE_STATE_FNAME=os.path.join(SAMPLE_DIRNAME, 'state.json')
+    SAMPLE_BEST_FNAME=os.path.join(BEST_DIRNAME, 'sample.json')
+    if SAMPLE:
+        fileutil.make_dirs(SAMPLE_DIRNAME)
+
+def _int_or_none(s):
+    if not s:
+        return None
+    return int(s)
+
+def _float_or_none(s):
+    if not s:
+        return None
+    return float(s)
+
+def init_options():
+    global SAVE_EVERY, SAVE_INTERVAL, PARALLEL, WRITE_SUMMARY, ANALYSIS_CACHE_SIZE, TEST_IMPACT, IMPORT_ALL, DISCOVERY_CACHE, TIMINGS, TIMINGS_TOP, HISTORY_KEEP, HTML, ADAPTIVE, ORDER, STOP_EARLY, CPROFILE, CPROFILE_SLOWEST, EVENTS, EVENTS_FILE, EVENTS_BUFFER, EVENTS_INTERVAL, SUBPROCESS, SAMPLE, DIFF, DIFF_THRESHOLD
+
+    # The environment variables take precedence over the profile.
+    SAVE_EVERY=_int_or_none(os.environ.get('TRIALCOVERAGE_SAVE_EVERY')) or PROFILE.save_every
+    SAVE_INTERVAL=_float_or_none(os.environ.get('TRIALCOVERAGE_SAVE_INTERVAL')) or PROFILE.save_interval
+    PARALLEL=bool(_int_or_none(os.environ.get('TRIALCOVERAGE_PARALLEL')))
+    # Measure one of SAMPLE slots of the files; 0 measures all of them.
+    SAMPLE=_int_or_none(os.environ.get('TRIALCOVERAGE_SAMPLE')) or 0
+    if SAMPLE and PARALLEL:
+        sys.stderr.write("WARNING, TRIALCOVERAGE_SAMPLE is ignored because TRIALCOVERAGE_PARALLEL combines the data of every process into one data file\n")
+        SAMPLE=0
+    SUBPROCESS=bool(_int_or_none(os.environ.get('TRIALCOVERAGE_SUBPROCESS')))
+    WRITE_SUMMARY=bool(_int_or_none(os.environ.get('TRIALCOVERAGE_WRITE_SUMMARY')))
+    # The maximum number of files in the analysis cache; 0 turns it off.
+    ANALYSIS_CACHE_SIZE=_int_or_none(os.environ.get('TRIALCOVERAGE_ANALYSIS_CACHE_SIZE'))
+    if ANALYSIS_CACHE_SIZE is None:
+        ANALYSIS_CACHE_SIZE=10000
+    TEST_IMPACT=bool(_int_or_none(os.environ.get('TRIALCOVERAGE_TEST_IMPACT')))
+    # The number of runs to keep in the history; 0 turns the history off.
+    HISTORY_KEEP=_int_or_none(os.environ.get('TRIALCOVERAGE_HISTORY_KEEP'))
+    if HISTORY_KEEP is None:
+        HISTORY_KEEP=1000
+    # Check for saturated files every ADAPTIVE tests; 0 turns that off.
+    ADAPTIVE=_int_or_none(os.environ.get('TRIALCOVERAGE_ADAPTIVE')) or 0
+    ORDER=bool(_int_or_none(os.environ.get('TRIALCOVERAGE_ORDER')))
+    STOP_EARLY=bool(_int_or_none(os.environ.get('TRIALCOVERAGE_STOP_EARLY')))
+    HTML=bool(_int_or_none(os.environ.get('TRIALCOVERAGE_HTML')))
+    # A unified diff, or 'best' for the changes since the best run.
+    DIFF=os.environ.get('TRIALCOVERAGE_DIFF') or None
+    DIFF_THRESHOLD=_float_or_none(os.environ.get('TRIALCOVERAGE_DIFF_THRESHOLD'))
+    if DIFF_THRESHOLD is None:
+        DIFF_THRESHOLD=80.0
+    if DIFF and SAMPLE:
+        sys.stderr.write("WARNING, TRIALCOVERAGE_SAMPLE is ignored because TRIALCOVERAGE_DIFF needs every changed file to be measured\n")
+        SAMPLE=0
+    EVENTS=bool(_int_or_none(os.environ.get('TRIALCOVERAGE_EVENTS')))
+    EVENTS_FILE=os.environ.get('TRIALCOVERAGE_EVENTS_FILE') or None
+    EVENTS_BUFFER=_int_or_none(os.environ.get('TRIALCOVERAGE_EVENTS_BUFFER')) or 100
+    EVENTS_INTERVAL=_float_or_none(os.environ.get('TRIALCOVERAGE_EVENTS_INTERVAL'))
+    if EVENTS_INTERVAL is None:
+        EVENTS_INTERVAL=1.0
+    TIMINGS=bool(_int_or_none(os.environ.get('TRIALCOVERAGE_TIMINGS')))
+    TIMINGS_TOP=_int_or_none(os.environ.get('TRIALCOVERAGE_TIMINGS_TOP')) or 10
+    # Run the tests whose ids match these patterns, and the CPROFILE_SLOWEST
+    # slowest tests of the last timed run, under cProfile.
+    CPROFILE=[p.strip() for p in os.environ.get('TRIALCOVERAGE_CPROFILE', '').split(',') if p.strip()]
+    CPROFILE_SLOWEST=_int_or_none(os.environ.get('TRIALCOVERAGE_CPROFILE_SLOWEST')) or 0
+    DISCOVERY_CACHE=_int_or_none(os.environ.get('TRIALCOVERAGE_DISCOVERY_CACHE')) != 0
+    IMPORT_ALL=os.environ.get('TRIALCOVERAGE_IMPORT_ALL') or PROFILE.import_all or 'import'
+    precondition(IMPORT_ALL in IMPORT_ALL_POLICIES, "TRIALCOVERAGE_IMPORT_ALL must be 'import', 'static' or 'none'", IMPORT_ALL=IMPORT_ALL)
 
-def start_coverage():
-    global cov, packages
-    packages = setuptools.find_packages('.')
-    includes = [os.path.join(pkg.replace('.', os.sep), '*') for pkg in packages]
-    cov = coverage.coverage(include=includes, branch=True, auto_data=True)
+def save_discovery_index():
+    if discovery is not None:
+        try:
+            discovery.save()
+        except EnvironmentError, le:
+            sys.stderr.write("WARNING, could not write discovery cache: %s\n" % (le,))
+
+def find_changed_lines(cov, diff=None):
+    """ Returns { filename: set of changed lines } of the measured files
+    that diff, the text of a unified diff, changes, or if it is None, of
+    those whose lines differ from the fingerprints of the best run's
+    sources. """
+    executed = set(cov.data.executed_files())
+    if diff is not None:
+        changed = parse_unified_diff(diff)
+    else:
+        baseline = SourceBaseline.load(BEST_SOURCES_FNAME)
+        if baseline is None:
+            sys.stderr.write("WARNING, there are no fingerprints of the best run's sources in %s, so every line is counted as changed\n" % (BEST_SOURCES_FNAME,))
+            baseline = SourceBaseline()
+        changed = baseline.changed(executed)
+    return dict([(f, lines) for (f, lines) in changed.iteritems() if is_measured(f, executed, PROFILE.include, PROFILE.omit)])
+
+def choose_sample(packages, includes, omit):
+    """ Returns the sampling.Sample to measure in this run, out of the .py
+    files of packages which match includes and don't match omit. """
+    includes = [os.path.abspath(p) for p in includes]
+    omit = [os.path.abspath(p) for p in omit or []]
+    # A subpackage's files are found under its parent package too.
+    population = set()
+    for (import_str, path) in find_python_files(packages):
+        fname = os.path.realpath(os.path.abspath(path))
+        if [p for p in includes if fnmatch.fnmatch(fname, p)] and not [p for p in omit if fnmatch.fnmatch(fname, p)]:
+            population.add(fname)
+    population = sorted(population)
+    try:
+        version = fileutil.read_file(VERSION_STAMP_FNAME, mode='rU').strip()
+    except EnvironmentError:
+        version = None
+    slot = choose_slot(SAMPLE_STATE_FNAME, version, SAMPLE)
+    return Sample(slot, SAMPLE, [f for f in population if file_slot(f, SAMPLE) == slot], len(population))
+
+def use_profile(name):
+    """ Makes the measurement profile called name the current one, along
+    with the paths and options that it sets. Raises ProfileError if there
+    is no such profile or it can't be read. """
+    global PROFILE
+    PROFILE = find_profile(read_profiles(), name)
+    init_options()
+    init_paths()
+
+def start_coverage(argv=None):
+    """ Starts measuring. If argv, trial's command line, is given, the
+    measurement profile is the one that it (or TRIALCOVERAGE_PROFILE) asks
+    for, else PROFILE is kept. Raises ProfileError if that profile can't be
+    read. """
+    global cov, packages, discovery, sample, subprocess_environ, PROFILE
+    if argv is not None:
+        PROFILE = select_profile(read_profiles(), argv)
+        init_options()
+        init_paths()
+    if DISCOVERY_CACHE:
+        discovery = DiscoveryIndex(DISCOVERY_FNAME)
+        packages = discovery.find_packages('.')
+        save_discovery_index()
+    else:
+        discovery = None
+        import setuptools # only here, it is slow to import
+        packages = setuptools.find_packages('.')
+    includes = PROFILE.include or [os.path.join(pkg.replace('.', os.sep), '*') for pkg in packages]
+    sample = None
+    if SAMPLE:
+        sample = choose_sample(packages, includes, PROFILE.omit)
+        # A pattern which matches nothing if the slot has no files, since
+        # no include patterns at all would measure everything.
+        includes = sample.files or [os.path.join(SAMPLE_DIRNAME, 'no-files')]
+        # This slot's data from an earlier run would be out of date.
+        fname = os.path.join(SAMPLE_DIRNAME, '.coverage.%d' % (sample.slot,))
+        fileutil.remove_if_possible(fname)
+        cov = coverage.coverage(data_file=fname, include=includes, omit=PROFILE.omit, branch=PROFILE.branch, auto_data=True)
+    elif PARALLEL:
+        # A suffix chosen once per process, so that repeated saves overwrite
+        # this process's own data file instead of creating new ones.
+        suffix = "%s.%s.%06d" % (socket.gethostname(), os.getpid(), random.randint(0, 999999))
+        cov = coverage.coverage(data_file=PARALLEL_DATA_FNAME, data_suffix=suffix, include=includes, omit=PROFILE.omit, branch=PROFILE.branch, auto_data=True)
+    else:
+        cov = coverage.coverage(data_file=COVERAGE_FNAME, include=includes, omit=PROFILE.omit, branch=PROFILE.branch, auto_data=True)
     # poke the internals of coverage to work-around this issue:
     # http://bitbucket.org/ned/coveragepy/issue/71/atexit-handler-results-in-exceptions-from-half-torn-down
     cov.atexit_registered = True
+    restore_environ()
+    if SUBPROCESS:
+        subprocess_environ = enable_subprocess_coverage(includes, PROFILE.omit, PROFILE.branch)
     cov.start()
 
 
+def stop_measuring():
+    """ Stops the coverage that was started when this module was imported,
+    for the tools which import it only to read coverage data. """
+    if cov is not None and cov.collector in cov.collector._collectors:
+        cov.stop()
+
 # As noted above, we have to do this at import time because trial
 # doesn't call the reporter before importing the test files, and we
 # want to turn on coverage before any of the package files (including
-# its test files) get imported.
+# its test files) get imported. A profile that can't be used doesn't stop
+# this module from being imported; the reporter reports it instead.
+PROFILE = Profile(DEFAULT_PROFILE)
+init_options()
 init_paths()
-start_coverage()
+cov = packages = discovery = sample = subprocess_environ = None
+try:
+    start_coverage(sys.argv)
+except ProfileError, profile_error:
+    pass
+else:
+    profile_error = None
@@ -0,0 +1,67 @@
+import errno, os, sys, time
+
+from pyutil import fileutil
+
+def replace_file(src, dst):
+    """ Rename src to dst, replacing dst if it exists. On POSIX this is
+    atomic. """
+    if sys.platform == "win32":
+        fileutil.remove_if_possible(dst)
+    os.rename(src, dst)
+
+def write_file_atomically(fname, data, mode='wb'):
+    tmpfname = fname + '~'
+    fileutil.write_file(tmpfname, data, mode=mode)
+    replace_file(tmpfname, fname)
+
+def compress_lines(lines):
+    """ [1, 2, 3, 7, 9, 10] -> [[1, 3], 7, [9, 10]] """
+    res = []
+    for l in sorted(lines):
+        if res:
+            last = res[-1]
+            if isinstance(last, list) and last[1] == l-1:
+                last[1] = l
+                continue
+            if last == l-1:
+                res[-1] = [last, l]
+                continue
+        res.append(l)
+    return res
+
+def expand_lines(compressed):
+    res = []
+    for x in compressed:
+        if isinstance(x, list):
+            res.extend(range(x[0], x[1]+1))
+        else:
+            res.append(x)
+    return res
+
+class LockTimeout(Exception): pass
+
+def acquire_lock(lockfname, timeout=600, poll=0.05):
+    """ Create lockfname, waiting until nobody else holds it. A lock older
+    than timeout seconds is assumed to belong to a dead process and is
+    broken. """
+    while True:
+        try:
+            fd = os.open(lockfname, os.O_CREAT|os.O_EXCL|os.O_WRONLY)
+        except OSError, le:
+            if le.errno != errno.EEXIST:
+                raise
+            try:
+                age = time.time() - os.stat(lockfname).st_mtime
+            except OSError:
+                continue
+            if age > timeout:
+                sys.stderr.write("WARNING, breaking stale lock file %s\n" % (lockfname,))
+                fileutil.remove_if_possible(lockfname)
+            else:
+                time.sleep(poll)
+        else:
+            os.close(fd)
+            return
+
+def release_lock(lockfname):
+    fileutil.remove_if_possible(lockfname)
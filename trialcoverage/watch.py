@@ -0,0 +1,369 @@
+"""
+Keep coverage warm between test runs, and re-run only the tests which a
+change affects.
+
+  python -m trialcoverage.watch [--interval=SECONDS] [TESTS...]
+
+runs TESTS (by default every top-level package under the current directory)
+once with coverage, then watches the .py files of the packages. Each time
+some of them change it runs only the tests which executed a changed file,
+plus the changed test modules, and prints the progression verdict for the
+whole suite, as if everything had been run again. The best-ever run is never
+replaced; a full trial run with the coverage reporter does that.
+
+The watcher never imports the code under test itself. Each run happens in a
+forked child process, which imports that code afresh (so every change is
+seen) but not the interpreter, twisted and coverage.py, and which sends back
+what was executed at import time and what each test executed. The watcher
+keeps those in memory, together with the analysis of each file and the
+listings of the package directories, and only analyzes again the files which
+changed or which one of the re-run tests executed. Needs os.fork().
+
+A changed module which isn't a test module is imported again in the child
+even if no test executes it, so that its import-time statements are counted
+as they were by TRIALCOVERAGE_IMPORT_ALL=import, which is only done for the
+first run.
+"""
+
+import cPickle, errno, os, sys, time, traceback
+
+from optparse import OptionParser
+
+from pyutil import fileutil
+
+import coverage
+from coverage.codeunit import code_unit_factory
+
+import twisted.trial.reporter
+
+import trialcoverage
+from coveragestore import CoverageStore
+from discovery import DiscoveryIndex
+from profiles import ProfileError
+from util import write_file_atomically
+
+VERDICTS = {
+    0: "WARNING code coverage regression",
+    1: "no previous best code-coverage summary",
+    2: "code coverage totals unchanged",
+    3: "code coverage improvement!",
+    }
+
+def is_test_module(import_str):
+    return import_str.split('.')[-1].startswith('test_')
+
+def _filemap(line_data, arc_data):
+    """ Returns { filename: (set of lines, set of arcs) }. """
+    filemap = {}
+    for filename, lines in line_data.iteritems():
+        filemap[filename] = (set(lines), set(arc_data.get(filename, ())))
+    for filename, arcs in arc_data.iteritems():
+        if filename not in filemap:
+            filemap[filename] = (set(), set(arcs))
+    return filemap
+
+class CoverageMap(object):
+    """ What was executed at import time and what each test executed. The
+    coverage of the whole suite is the union of those. """
+    def __init__(self):
+        self.imports = {} # filename -> (set of lines, set of arcs)
+        self.tests = CoverageStore()
+
+    def record_imports(self, line_data, arc_data):
+        """ Replaces the import-time data of the files in line_data and
+        arc_data. Returns the set of those files. """
+        filemap = _filemap(line_data, arc_data)
+        self.imports.update(filemap)
+        return set(filemap)
+
+    def forget_imports(self, filename):
+        self.imports.pop(filename, None)
+
+    def record_test(self, testid, line_data, arc_data):
+        """ Replaces the data of testid. Returns the set of files whose data
+        may have changed. """
+        return self.tests.record(testid, line_data, arc_data).union(line_data, arc_data)
+
+    def forget_test(self, testid):
+        """ Returns the set of files that testid had executed. """
+        return self.tests.forget(testid)
+
+    def select(self, filenames):
+        """ Returns the set of ids of the tests which executed any of
+        filenames. """
+        selected = set()
+        for filename in filenames:
+            selected.update(self.tests.tests_hitting(filename))
+        return selected
+
+    def file_data(self, filename):
+        """ Returns (set of lines, set of arcs) executed in filename by the
+        whole suite. """
+        lines, arcs = self.tests.union(filename)
+        entry = self.imports.get(filename)
+        if entry is not None:
+            lines.update(entry[0])
+            arcs.update(entry[1])
+        return (lines, arcs)
+
+class WatchReporter(trialcoverage.CoverageTextReporter):
+    """ The reporter of the child process. Instead of reporting on coverage
+    it writes what was executed at import time and what each test executed
+    to result_fname, for the watcher. """
+    result_fname = None
+
+    def __init__(self, *args, **kwargs):
+        trialcoverage.CoverageTextReporter.__init__(self, *args, **kwargs)
+        self.collect_per_test = True
+        data = trialcoverage.cov.data
+        self.imports = (data.line_data(), data.arc_data())
+        self.tests = {}
+
+    def collected(self, test, line_data, arc_data):
+        self.tests[test.id()] = (line_data, arc_data)
+
+    def stop_coverage(self):
+        result = {'imports': self.imports, 'tests': self.tests}
+        write_file_atomically(self.result_fname, cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL))
+
+    def wasSuccessful(self):
+        return twisted.trial.reporter.VerboseTextReporter.wasSuccessful(self)
+
+def run_child(testnames, modules, import_all, result_fname):
+    """ Runs in the child process: imports modules, a list of (import_str,
+    path), and runs testnames under trial with a WatchReporter. """
+    from twisted.scripts import trial
+    # Start from an empty data file, and don't do any of the extra work that
+    # the environment may ask the reporter for.
+    trialcoverage.COVERAGE_FNAME = result_fname + '.coverage'
+    fileutil.remove_if_possible(trialcoverage.COVERAGE_FNAME)
+    trialcoverage.SAVE_EVERY, trialcoverage.SAVE_INTERVAL = sys.maxint, None
+    trialcoverage.PARALLEL = trialcoverage.SUBPROCESS = trialcoverage.TEST_IMPACT = trialcoverage.TIMINGS = False
+    trialcoverage.ORDER = trialcoverage.STOP_EARLY = trialcoverage.HTML = trialcoverage.EVENTS = False
+    trialcoverage.ADAPTIVE = trialcoverage.CPROFILE_SLOWEST = trialcoverage.SAMPLE = 0
+    trialcoverage.CPROFILE = []
+    trialcoverage.DIFF = None
+    if import_all:
+        trialcoverage.IMPORT_ALL = 'import'
+    else:
+        trialcoverage.IMPORT_ALL = 'none'
+    WatchReporter.result_fname = result_fname
+
+    trialcoverage.start_coverage()
+    trialcoverage.import_python_files(modules)
+    config = trial.Options()
+    config.parseOptions(['--reporter', 'bwverbose'] + list(testnames))
+    config['reporter'] = WatchReporter
+    trial._initialDebugSetup(config)
+    test_result = trial._makeRunner(config).run(trial._getSuite(config))
+    return not test_result.wasSuccessful()
+
+class Watcher(object):
+    def __init__(self, testnames=None, test_output=None):
+        self.discovery = DiscoveryIndex(trialcoverage.DISCOVERY_FNAME)
+        if not testnames:
+            testnames = [p for p in self.discovery.find_packages('.') if '.' not in p]
+        self.testnames = testnames
+        self.test_output = test_output # where the child's output goes, if not to stdout
+        self.coverage_map = CoverageMap()
+        # Never started; it only holds the data of the files being analyzed.
+        self.cov = coverage.coverage(branch=trialcoverage.PROFILE.branch)
+        self.pr = trialcoverage.ProgressionReporter(self.cov)
+        self.numbers = {} # filename -> (uncovered, partial)
+        self.result_fname = os.path.join(trialcoverage.RES_FULLDIRNAME, 'watch-result.pickle')
+        self.files = self.scan()
+
+    def scan(self):
+        """ Returns { filename: (mtime, import_str, path) } for the .py files
+        of the packages. """
+        files = {}
+        packages = self.discovery.find_packages('.')
+        for (import_str, path) in trialcoverage.find_python_files(packages, walk=self.discovery.walk):
+            try:
+                mtime = os.stat(path).st_mtime
+            except EnvironmentError:
+                continue
+            files[self.cov.file_locator.canonical_filename(path)] = (mtime, import_str, path)
+        try:
+            self.discovery.save()
+        except EnvironmentError, le:
+            sys.stderr.write("WARNING, could not write discovery cache: %s\n" % (le,))
+        return files
+
+    def changes(self):
+        """ Returns (changed, removed), the files which changed or were added
+        and the files which were removed since the last call. """
+        files = self.scan()
+        changed = sorted([f for (f, entry) in files.iteritems() if f not in self.files or self.files[f][0] != entry[0]])
+        removed = sorted([f for f in self.files if f not in files])
+        self.files = files
+        return (changed, removed)
+
+    def run_tests(self, testnames, modules=(), import_all=False):
+        """ Runs testnames in a child process, after importing modules.
+        Returns what the child's WatchReporter wrote, or None if it didn't
+        get that far. """
+        fileutil.remove_if_possible(self.result_fname)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 2
+            try:
+                try:
+                    if self.test_output is not None:
+                        fd = os.open(self.test_output, os.O_WRONLY|os.O_CREAT|os.O_APPEND)
+                        os.dup2(fd, 1)
+                        os.dup2(fd, 2)
+                    code = run_child(testnames, modules, import_all, self.result_fname)
+                except:
+                    traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        os.waitpid(pid, 0)
+        try:
+            return cPickle.loads(fileutil.read_file(self.result_fname))
+        except EnvironmentError, le:
+            if le.errno != errno.ENOENT:
+                raise
+            sys.stderr.write("WARNING, the test run didn't finish; the coverage of this change is unknown\n")
+            return None
+
+    def merge(self, result, rerun):
+        """ Records the child's result, and forgets the tests of rerun (a
+        set of test ids) that weren't in it. Returns the set of files whose
+        data may have changed. """
+        (line_data, arc_data) = result['imports']
+        affected = self.coverage_map.record_imports(line_data, arc_data)
+        for testid in rerun:
+            if testid not in result['tests']:
+                affected.update(self.coverage_map.forget_test(testid))
+        for testid, (line_data, arc_data) in result['tests'].iteritems():
+            affected.update(self.coverage_map.record_test(testid, line_data, arc_data))
+        return affected
+
+    def analyze(self, filenames):
+        """ Recomputes the numbers of filenames from the data in
+        coverage_map. """
+        data = self.cov.data
+        for filename in filenames:
+            (lines, arcs) = self.coverage_map.file_data(filename)
+            if not lines or not os.path.exists(filename):
+                self.numbers.pop(filename, None)
+                continue
+            data.lines[filename] = dict.fromkeys(lines)
+            if arcs:
+                data.arcs[filename] = dict.fromkeys(arcs)
+            cu = code_unit_factory([filename], self.cov.file_locator)[0]
+            try:
+                nums = self.pr.analyze(cu).numbers
+            except KeyboardInterrupt:
+                raise
+            except Exception, le:
+                sys.stderr.write("WARNING, got exception while analyzing %s: %s\n" % (cu.name, le,))
+                self.numbers.pop(filename, None)
+                continue
+            self.numbers[filename] = (nums.n_missing, nums.n_missing_branches)
+        # The analyses are done with, and the data is all in coverage_map.
+        data.lines.clear()
+        data.arcs.clear()
+        if self.pr.analysis_cache is not None:
+            try:
+                self.pr.analysis_cache.save()
+            except EnvironmentError, le:
+                sys.stderr.write("WARNING, could not write analysis cache: %s\n" % (le,))
+
+    def report(self, ran, seconds):
+        """ Prints the verdict for the whole suite and returns it, as
+        ProgressionReporter.coverage_progressed() does. """
+        curunc = sum([n[0] for n in self.numbers.itervalues()])
+        curpart = sum([n[1] for n in self.numbers.itervalues()])
+        best = self.pr.read_best_totals()
+        progression = trialcoverage.compare_with_best(curunc, curpart, best)
+        sys.stdout.write("\n"+"-"*79+"\n")
+        sys.stdout.write("watch: ran %d tests in %.1fs; %s\n" % (ran, seconds, VERDICTS[progression],))
+        if best is not None:
+            sys.stdout.write("Previous best coverage left %d total lines untested (%d lines uncovered and %d lines partially covered).\n" % (best[0] + best[1], best[0], best[1]))
+        sys.stdout.write("Current coverage left %d total lines untested (%d lines uncovered and %d lines partially covered).\n" % (curunc + curpart, curunc, curpart))
+        return progression
+
+    def start(self):
+        """ Runs all of the tests. Returns the verdict. """
+        started = time.time()
+        result = self.run_tests(self.testnames, import_all=(trialcoverage.IMPORT_ALL == 'import'))
+        if result is None:
+            return None
+        self.analyze(self.merge(result, set()))
+        return self.report(len(result['tests']), time.time() - started)
+
+    def update(self, changed, removed):
+        """ Re-runs the tests which changed and removed files affect.
+        Returns the verdict. """
+        started = time.time()
+        for filename in removed:
+            self.coverage_map.forget_imports(filename)
+        selected = self.coverage_map.select(changed + removed)
+        modules, testmodules = [], []
+        for filename in changed:
+            (mtime, import_str, path) = self.files[filename]
+            if is_test_module(import_str):
+                testmodules.append(import_str)
+            else:
+                modules.append((import_str, path))
+        # A changed test module is run as a whole, which also runs the tests
+        # that were added to it.
+        def in_testmodules(testid):
+            for m in testmodules:
+                if testid.startswith(m + '.'):
+                    return True
+            return False
+        rerun = selected.union([testid for testid in self.coverage_map.tests if in_testmodules(testid)])
+        testnames = sorted([testid for testid in selected if not in_testmodules(testid)]) + testmodules
+        result = self.run_tests(testnames, modules)
+        if result is None:
+            return None
+        affected = self.merge(result, rerun)
+        self.analyze(affected.union(changed, removed))
+        return self.report(len(result['tests']), time.time() - started)
+
+    def poll(self):
+        """ Re-runs the affected tests if anything changed. Returns the
+        verdict, or None if nothing changed. """
+        (changed, removed) = self.changes()
+        if not (changed or removed):
+            return None
+        return self.update(changed, removed)
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options] [TESTS...]",
+                          description="Run the tests with coverage, then each time a file of the packages changes re-run the tests that it affects and print the progression verdict of the whole suite.")
+    parser.add_option("--interval", dest="interval", type="float", default=1.0,
+                      help="seconds between checks for changed files [default: %default]")
+    parser.add_option("--test-output", dest="test_output", default=None,
+                      help="append the output of the test runs to this file instead of printing it")
+    parser.add_option("--profile", dest="profile", default=None,
+                      help="measure with this measurement profile, and compare with its best run")
+    (options, args) = parser.parse_args(argv)
+    if not hasattr(os, 'fork'):
+        parser.error("watch mode needs os.fork()")
+
+    if options.profile:
+        try:
+            trialcoverage.use_profile(options.profile)
+        except ProfileError, le:
+            parser.error("no usable profile %r: %s" % (options.profile, le,))
+    watcher = Watcher(args, options.test_output)
+    watcher.start()
+    try:
+        while True:
+            time.sleep(options.interval)
+            watcher.poll()
+    except KeyboardInterrupt:
+        return 0
+
+if __name__ == "__main__":
+    # Importing trialcoverage started coverage, which only the tests need.
+    trialcoverage.stop_measuring()
+    sys.exit(main())
@@ -39,3 +39,26 @@ bwcov = _Reporter("Code-Coverage Reporter (colorless)",
                   shortOpt=None,
                   klass="CoverageTextReporter")
 
+
+# One more reporter for each measurement profile configured in setup.cfg or
+# .trialcoveragerc in the current directory. See trialcoverage/profiles.py.
+try:
+    from trialcoverage.profiles import DEFAULT_PROFILE, ProfileError, read_profiles
+except ImportError:
+    _profiles = {}
+else:
+    try:
+        _profiles = read_profiles()
+    except ProfileError:
+        # The reporter reports this when trial creates it.
+        _profiles = {}
+
+for _name, _profile in _profiles.items():
+    if _name == DEFAULT_PROFILE:
+        continue
+    globals()['bwcov_' + _name] = _Reporter("Code-Coverage Reporter (colorless, profile %s)" % (_name,),
+                                           "trialcoverage.trialcoverage",
+                                           description="Colorless verbose output (with 'coverage' coverage, measured as in the %r profile)" % (_name,),
+                                           longOpt=_profile.reporter_name(),
+                                           shortOpt=None,
+                                           klass="CoverageTextReporter")